@@ -0,0 +1,104 @@
+"""Offline evaluation of the weather classification tiers.
+
+Runs each local tier alone and the default tiered pipeline over a labeled
+query set, reporting coverage (share of queries decided locally at the
+configured confidence threshold) and accuracy on the decided queries.
+With --llm, the LLM baseline and the tiered pipeline with LLM fallback
+are also evaluated; this makes real API calls.
+
+Usage: python -m benchmarks.classifier_eval [--llm] [--threshold 0.8] [labeled.jsonl]
+"""
+
+import argparse
+import json
+import os
+import time
+
+from src.config import ClassificationConfig, Config
+from src.workflow_query.node_classify_query import (
+    CLASSIFICATION_PROMPT_TEMPLATE,
+    WeatherQueryClassification,
+)
+from src import services
+from src.workflow_query.weather_classification import classify_locally
+
+DEFAULT_DATASET = os.path.join(
+    os.path.dirname(__file__), "data", "weather_queries.jsonl"
+)
+
+
+def load_dataset(path: str) -> list[dict]:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def llm_classify(config: Config, query: str, location: str) -> bool:
+    response = (
+        services.get_llm(config)
+        .with_structured_output(WeatherQueryClassification)
+        .invoke(CLASSIFICATION_PROMPT_TEMPLATE.format(query=query, location=location))
+    )
+    assert isinstance(response, WeatherQueryClassification)
+    return response.is_weather_related
+
+
+def evaluate(name: str, config: Config, dataset: list[dict], use_llm: bool) -> None:
+    decided = correct = 0
+    started = time.perf_counter()
+    for example in dataset:
+        decision = classify_locally(example["query"], config)
+        if decision is not None:
+            decided += 1
+            prediction = decision["is_weather_related"]
+        elif use_llm:
+            prediction = llm_classify(config, example["query"], example["location"])
+        else:
+            continue
+        correct += prediction == example["is_weather_related"]
+
+    elapsed = time.perf_counter() - started
+    evaluated = len(dataset) if use_llm else decided
+    print(
+        f"{name:>22}: "
+        f"local coverage {decided / len(dataset):6.1%}, "
+        f"accuracy {correct / evaluated if evaluated else float('nan'):6.1%} "
+        f"on {evaluated:>3} queries, "
+        f"{elapsed / len(dataset) * 1e3:7.2f} ms/query"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataset", nargs="?", default=DEFAULT_DATASET)
+    parser.add_argument("--llm", action="store_true", help="include the LLM baseline")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.dataset)
+    base_config = Config.from_env()
+
+    variants: list[tuple[str, list]] = [
+        ("lexicon", ["lexicon"]),
+        ("prototype", ["prototype"]),
+        ("lexicon+prototype", ["lexicon", "prototype"]),
+    ]
+    if args.llm:
+        variants.append(("llm", []))
+
+    for name, tiers in variants:
+        config = base_config.model_copy(
+            update={
+                "classification": ClassificationConfig(
+                    local_tiers=tiers, confidence_threshold=args.threshold
+                )
+            }
+        )
+        # warm up the embedding model and prototype centroids outside the timing
+        classify_locally("warm up", config)
+        evaluate(name, config, dataset, use_llm=args.llm)
+
+    services.shutdown()
+
+
+if __name__ == "__main__":
+    main()
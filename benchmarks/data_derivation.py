@@ -0,0 +1,120 @@
+"""Cost of turning extracted documents into stored rows and chunks: text, id
+and chunks derived on every use (as before memoization) vs once per document.
+
+Runs the steps of `index_and_store` that depend on the document only (SQL
+values, then chunk documents) over a large tabular document and a long
+textual one; database and vector store writes are left out.
+
+Usage: python -m benchmarks.data_derivation [rows] [paragraphs] [repeat]
+"""
+
+import hashlib
+import sys
+import time
+from typing import Callable
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from src.data import GenericTabularData, IndexableData, TextualData
+from src.workflow_ingest.node_index_and_store import to_chunk_documents, to_sql_values
+from .fakes import make_config
+
+PARAGRAPH = (
+    "Paris, the 'City of Light,' boasts iconic landmarks such as the Eiffel "
+    "Tower, offering panoramic views from its observation decks. "
+)
+
+
+def make_tabular(rows: int) -> GenericTabularData:
+    return GenericTabularData(
+        title="Average Expenditures for Auto Insurance",
+        source_url="https://example.com/tabular",
+        data=[
+            {
+                "State": f"State {i}",
+                "Year": 2012 + i % 10,
+                "Average expenditure": f"${800 + i % 300}.40",
+                "Percent change": f"{i % 7}.{i % 10}%",
+            }
+            for i in range(rows)
+        ],
+    )
+
+
+def make_textual(paragraphs: int) -> TextualData:
+    return TextualData(
+        title="Paris",
+        source_url="https://example.com/textual",
+        data="\n".join(f"{i}. {PARAGRAPH}" for i in range(paragraphs)),
+    )
+
+
+def legacy_to_text(r: IndexableData) -> str:
+    # as the data classes built their text before memoization
+    if isinstance(r, GenericTabularData):
+        md = f"# {r.title}\n\n"
+        for kv_pair in r.data:
+            line = ", ".join([f"{k}: {v}" for k, v in kv_pair.items()])
+            line += "\n\n"
+            md += line
+        return md
+    assert isinstance(r, TextualData)
+    text = ""
+    if r.title is not None:
+        text += r.title + "\n\n"
+    text += r.data
+    return text
+
+
+def legacy_id(r: IndexableData) -> str:
+    content_hash = hashlib.sha256(legacy_to_text(r).encode("utf-8")).hexdigest()
+    return f"{r.__class__.__name__}-{content_hash[:8]}"
+
+
+def legacy_index(r: IndexableData, config) -> int:
+    # as `index_and_store` did: text for the row, then id per chunk
+    values = {"id": legacy_id(r), "content": legacy_to_text(r)}
+    chunks = RecursiveCharacterTextSplitter(
+        chunk_size=config.indexing.chunk_size,
+        chunk_overlap=config.indexing.chunk_overlap,
+    ).split_text(legacy_to_text(r))
+    ids = [f"{legacy_id(r)}-{i}" for i in range(len(chunks))]
+    return len(values) + len(ids)
+
+
+def memoized_index(r: IndexableData, config) -> int:
+    values = to_sql_values(r, None)
+    return len(values) + len(to_chunk_documents(r, None, config))
+
+
+def measure(
+    make: Callable[[], IndexableData], index: Callable[[IndexableData, object], int]
+) -> float:
+    config = make_config("/tmp")
+    # fresh instances: memoized values must not carry over across runs
+    document = make()
+    started = time.perf_counter()
+    index(document, config)
+    return time.perf_counter() - started
+
+
+def main(rows: int, paragraphs: int, repeat: int) -> None:
+    for label, make in [
+        (f"tabular ({rows} rows)", lambda: make_tabular(rows)),
+        (f"textual ({paragraphs} paragraphs)", lambda: make_textual(paragraphs)),
+    ]:
+        legacy = min(measure(make, legacy_index) for _ in range(repeat))
+        memoized = min(measure(make, memoized_index) for _ in range(repeat))
+        print(
+            f"{label:>28}: {legacy * 1000:8.1f} ms before,"
+            f" {memoized * 1000:8.1f} ms memoized ({legacy / memoized:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        rows=int(args[0]) if len(args) > 0 else 1_000,
+        paragraphs=int(args[1]) if len(args) > 1 else 2_000,
+        repeat=int(args[2]) if len(args) > 2 else 3,
+    )
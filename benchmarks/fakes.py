@@ -0,0 +1,163 @@
+"""Local stand-ins for the LLM and vector store, so benchmarks measure our
+own overhead and concurrency rather than network or model variance."""
+
+import asyncio
+import time
+from typing import Any
+
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from src import services
+from src.config import Config
+
+
+class FixedLatencyChatModel(BaseChatModel):
+    """Chat model that answers with a canned response after a fixed delay"""
+
+    latency: float = 0.1
+    response: str = "This is a canned answer."
+    # field values returned by `with_structured_output(schema)`
+    structured_response: dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fixed-latency-fake"
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    def with_structured_output(  # type: ignore[override]
+        self, schema: type[BaseModel], **kwargs: Any
+    ) -> Runnable:
+        def respond(_) -> BaseModel:
+            time.sleep(self.latency)
+            return schema(**self.structured_response)
+
+        async def arespond(_) -> BaseModel:
+            await asyncio.sleep(self.latency)
+            return schema(**self.structured_response)
+
+        return RunnableLambda(respond, afunc=arespond)
+
+    def _result(self) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=self.response))]
+        )
+
+
+class FixedLatencyEmbeddings(Embeddings):
+    """Deterministic embeddings whose every request costs a fixed round trip
+    plus a per-text delay, like a remote embedding API"""
+
+    def __init__(
+        self, latency: float = 0.05, latency_per_text: float = 0.0005, size: int = 384
+    ) -> None:
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self._embeddings = DeterministicFakeEmbedding(size=size)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency + self.latency_per_text * len(texts))
+        return self._embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self.latency + self.latency_per_text * len(texts))
+        return self._embeddings.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeVectorStore(InMemoryVectorStore):
+    """In-memory store accepting Chroma-style metadata filters, with an
+    optional fixed search latency standing in for query embedding"""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        super().__init__(DeterministicFakeEmbedding(size=384))
+        self.latency = latency
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        time.sleep(self.latency)
+        return super().similarity_search_with_score(query, k=k, **kwargs)
+
+    async def asimilarity_search_with_score(self, query, k=4, **kwargs):
+        await asyncio.sleep(self.latency)
+        return await super().asimilarity_search_with_score(query, k=k, **kwargs)
+
+    def similarity_search_with_score_by_vector(  # type: ignore[override]
+        self, embedding, k=4, filter=None, **kwargs
+    ):
+        if isinstance(filter, dict):
+            metadata_filter = filter
+            filter = lambda doc: all(
+                doc.metadata.get(key) == value for key, value in metadata_filter.items()
+            )
+        return super().similarity_search_with_score_by_vector(
+            embedding, k=k, filter=filter, **kwargs
+        )
+
+
+def install_fakes(
+    config: Config,
+    llm: BaseChatModel,
+    vector_store: FakeVectorStore | None = None,
+) -> None:
+    """Seed the service registry so that nodes resolve to the fakes"""
+    services.registry.get_or_create("llm", config.llm.model_dump_json(), lambda: llm)
+    services.registry.get_or_create(
+        "vector_store",
+        config.vector_store.model_dump_json() + services.embeddings_key(config),
+        lambda: vector_store or FakeVectorStore(),
+    )
+
+
+def make_config(tmp_dir: str) -> Config:
+    return Config(
+        **{
+            "llm": {"type": "openai", "model": "fake", "api_key": "fake"},
+            "weather": {"api_key": "fake"},
+            "db": {"url": f"sqlite:///{tmp_dir}/bench.db"},
+            "embeddings": {"type": "chroma-internal"},
+            "vector_store": {
+                "type": "chroma",
+                "collection_name": "documents",
+                "path": f"{tmp_dir}/chroma",
+            },
+            # benchmarks repeat queries, which should not be answered from cache
+            "caching": {"answer_maxsize": 0},
+        }  # type: ignore
+    )
@@ -0,0 +1,28 @@
+"""Per-request cost of obtaining the compiled workflow graphs.
+
+Usage: python -m benchmarks.graph_compile [iterations]
+"""
+
+import sys
+import timeit
+
+from src import workflow_ingest, workflow_query
+
+
+def main(iterations: int) -> None:
+    for name, get_graph in [
+        ("query", workflow_query.get_graph),
+        ("ingest", workflow_ingest.get_graph),
+    ]:
+        uncached = timeit.timeit(get_graph.__wrapped__, number=iterations)
+        get_graph()
+        cached = timeit.timeit(get_graph, number=iterations)
+        print(
+            f"{name:>6}: "
+            f"compile per call {uncached / iterations * 1e6:10.1f} µs, "
+            f"cached {cached / iterations * 1e6:8.3f} µs"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,85 @@
+"""Extraction of the title and text of HTML pages by each backend of
+`data.html_text`, over a corpus of generated pages the size of typical
+real-world ones (from 50KB to 1MB of markup, with navigation, scripts, styles,
+inline markup and entities), plus the insurance pages of the test fixtures.
+
+Usage: python -m benchmarks.html_text [pages] [repeat]
+"""
+
+import random
+import sys
+import time
+
+from src.data.html_text import HTML_TEXT_BACKENDS
+from .table_extraction import load_fixtures
+
+PAGE_SIZES = [50_000, 100_000, 250_000, 500_000, 1_000_000]
+
+SENTENCES = [
+    "Paris, the 'City of Light,' boasts iconic landmarks such as the "
+    "<a href='/wiki/Eiffel_Tower' title='Eiffel Tower'>Eiffel Tower</a>.",
+    "The <b>Louvre</b> is home to masterpieces like the <i>Mona Lisa</i>.",
+    "Notre-Dame &amp; the Sainte-Chapelle stand on the &Icirc;le de la Cit&eacute;.",
+    "Montmartre features the Basilica of the Sacr&eacute;-C&oelig;ur.",
+]
+
+
+def make_page(size: int, rng: random.Random) -> str:
+    parts = [
+        "<!DOCTYPE html><html lang='en'><head><meta charset='utf-8'>",
+        "<title>Paris – Travel guide</title>",
+        "<style>" + ".c{margin:0;padding:0}" * 100 + "</style>",
+        "<script>" + "window.dataLayer.push({event:'view'});" * 100 + "</script>",
+        "</head><body><nav><ul>",
+        "".join(f"<li><a href='/wiki/{i}'>Link {i}</a></li>" for i in range(100)),
+        "</ul></nav><div id='content'><h1>Paris</h1>",
+    ]
+    length = sum(len(p) for p in parts)
+    section = 0
+    while length < size:
+        section += 1
+        paragraphs = "".join(
+            f"<p class='para'>{' '.join(rng.choices(SENTENCES, k=5))}</p>"
+            f"<!-- section {section} -->"
+            for _ in range(5)
+        )
+        part = (
+            f"<div class='section'><h2><span id='s{section}'>Section {section}"
+            f"</span></h2>{paragraphs}<script>track({section})</script></div>"
+        )
+        parts.append(part)
+        length += len(part)
+    parts.append(
+        "</div><footer>Text is available under CC BY-SA.</footer></body></html>"
+    )
+    return "".join(parts)
+
+
+def main(pages: int, repeat: int) -> None:
+    rng = random.Random(0)
+    corpus = [make_page(PAGE_SIZES[i % len(PAGE_SIZES)], rng) for i in range(pages)]
+    corpus += list(load_fixtures().values())
+    size = sum(len(page) for page in corpus)
+    print(f"{len(corpus)} pages, {size / 1024 / 1024:.1f}MB, best of {repeat} runs")
+
+    results = {}
+    for name, extract in HTML_TEXT_BACKENDS.items():
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            results[name] = [extract(page) for page in corpus]
+            best = min(best, time.perf_counter() - started)
+        print(
+            f"  {name}: {best:.2f}s, {size / best / 1024 / 1024:.1f}MB/s,"
+            f" {best / len(corpus) * 1000:.1f}ms per page"
+        )
+
+    outputs = list(results.values())
+    assert all(output == outputs[0] for output in outputs), "backends differ"
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 20,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3,
+    )
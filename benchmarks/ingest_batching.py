@@ -0,0 +1,87 @@
+"""Ingestion throughput for a burst of documents: one embedding request and
+vector store write per document (as before batching) vs chunks batched
+across documents with the default `indexing` settings.
+
+Chunks of documents are written concurrently, as by a burst of `POST /notes`
+or a batch CLI run, into a real Chroma store; embeddings are a local fake
+with a fixed per-request latency standing in for a remote embedding API.
+Database writes, which batching does not affect, are left out.
+
+Usage: python -m benchmarks.ingest_batching [documents] [concurrency] [embedding_latency]
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+
+from src import services
+from src.data import TextualData
+from src.workflow_ingest.batching import get_chunk_batcher
+from src.workflow_ingest.node_index_and_store import to_chunk_documents
+from .fakes import FixedLatencyEmbeddings, make_config
+
+PARAGRAPH = (
+    "Paris, the 'City of Light,' boasts iconic landmarks such as the Eiffel "
+    "Tower, offering panoramic views from its observation decks. "
+)
+
+
+def make_documents(count: int) -> list[TextualData]:
+    # ~2 chunks each with the default chunk size
+    return [
+        TextualData(
+            title=f"Document {i}",
+            source_url=f"https://example.com/{i}",
+            data=f"Document {i}. " + PARAGRAPH * 12,
+        )
+        for i in range(count)
+    ]
+
+
+async def run(
+    config, documents: list[TextualData], concurrency: int, batched: bool
+) -> float:
+    batcher = get_chunk_batcher(config)
+    vector_store = services.get_vector_store(config)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(document: TextualData):
+        chunks = to_chunk_documents(document, None, config)
+        async with semaphore:
+            if batched:
+                await batcher.add(chunks)
+            else:
+                # as `aindex_and_store` did before batching
+                await vector_store.aadd_documents(chunks)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(document) for document in documents))
+    return time.perf_counter() - started
+
+
+def main(count: int, concurrency: int, latency: float) -> None:
+    documents = make_documents(count)
+
+    for label, batched in [("single", False), ("batched", True)]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = make_config(tmp_dir)
+            services.registry.get_or_create(
+                "embeddings",
+                services.embeddings_key(config),
+                lambda: FixedLatencyEmbeddings(latency=latency),
+            )
+
+            elapsed = asyncio.run(run(config, documents, concurrency, batched))
+            print(f"{label:>7}: {count / elapsed:8.1f} documents/s")
+
+            services.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        count=int(args[0]) if len(args) > 0 else 500,
+        concurrency=int(args[1]) if len(args) > 1 else 50,
+        latency=float(args[2]) if len(args) > 2 else 0.1,
+    )
@@ -0,0 +1,85 @@
+"""Sustained query throughput: sync graph on a threadpool vs async graph.
+
+The sync run mirrors the former `def` route handlers, which occupied one
+worker of Starlette's threadpool (40 by default) for the whole request.
+The async run mirrors the `async def` handlers driving `ainvoke`.
+
+Usage: python -m benchmarks.query_concurrency [requests] [concurrency] [llm_latency]
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+from src import services, workflow_query
+from src.db import SqlAlchemyBase
+from .fakes import FixedLatencyChatModel, install_fakes, make_config
+
+THREADPOOL_SIZE = 40
+
+
+def initial_state(i: int) -> workflow_query.AgentState:
+    return workflow_query.AgentState(
+        messages=[HumanMessage(content=f"question number {i}")],
+        retrieved_knowledge=[],
+        query=None,
+        topic_id=None,
+        external_knowledge_sources=[],
+        answer_cache=None,
+    )
+
+
+def run_sync(config, requests: int) -> float:
+    graph = workflow_query.get_graph()
+    runnable_config = config.to_runnable_config()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADPOOL_SIZE) as pool:
+        list(
+            pool.map(
+                lambda i: graph.invoke(initial_state(i), runnable_config),
+                range(requests),
+            )
+        )
+    return time.perf_counter() - started
+
+
+async def run_async(config, requests: int, concurrency: int) -> float:
+    graph = workflow_query.get_graph()
+    runnable_config = config.to_runnable_config()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await graph.ainvoke(initial_state(i), runnable_config)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - started
+
+
+def main(requests: int, concurrency: int, latency: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = make_config(tmp_dir)
+        SqlAlchemyBase.metadata.create_all(services.get_db(config))
+        install_fakes(config, FixedLatencyChatModel(latency=latency))
+
+        elapsed = run_sync(config, requests)
+        print(f" sync (threadpool={THREADPOOL_SIZE}): {requests / elapsed:8.1f} QPS")
+
+        elapsed = asyncio.run(run_async(config, requests, concurrency))
+        print(f"async (in-flight={concurrency}):  {requests / elapsed:8.1f} QPS")
+
+        services.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        requests=int(args[0]) if len(args) > 0 else 400,
+        concurrency=int(args[1]) if len(args) > 1 else 200,
+        latency=float(args[2]) if len(args) > 2 else 1.0,
+    )
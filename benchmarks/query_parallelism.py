@@ -0,0 +1,113 @@
+"""Wall-clock latency of a single query: serial vs parallel classification.
+
+The serial graph reproduces the former topology, where knowledge base
+retrieval waited for `classify_query` (and the weather lookup, if any).
+
+Usage: python -m benchmarks.query_parallelism [queries] [llm_latency] [retrieval_latency]
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
+from sqlalchemy.orm import Session
+
+from src import services, workflow_query
+from src.config import ClassificationConfig, Config
+from src.db import SqlAlchemyBase, SqlTopic
+from .fakes import FakeVectorStore, FixedLatencyChatModel, install_fakes, make_config
+
+
+def get_serial_graph():
+    builder = StateGraph(workflow_query.AgentState, Config)
+    for name, func, afunc in [
+        (
+            "classify_query",
+            workflow_query.classify_query,
+            workflow_query.aclassify_query,
+        ),
+        (
+            "retrieve_from_weather_service",
+            workflow_query.retrieve_from_weather_service,
+            workflow_query.aretrieve_from_weather_service,
+        ),
+        (
+            "retrieve_from_knowledge_base",
+            workflow_query.retrieve_from_knowledge_base,
+            workflow_query.aretrieve_from_knowledge_base,
+        ),
+        ("rerank", workflow_query.rerank, workflow_query.arerank),
+        ("generate", workflow_query.generate, workflow_query.agenerate),
+    ]:
+        builder.add_node(name, RunnableLambda(func, afunc=afunc))
+    builder.add_edge(START, "classify_query")
+    builder.add_edge("classify_query", "retrieve_from_weather_service")
+    builder.add_edge("retrieve_from_weather_service", "retrieve_from_knowledge_base")
+    builder.add_edge("retrieve_from_knowledge_base", "rerank")
+    builder.add_edge("rerank", "generate")
+    builder.add_edge("generate", END)
+    return builder.compile()
+
+
+async def mean_latency(graph, config: Config, topic_id: str, queries: int) -> float:
+    runnable_config = config.to_runnable_config()
+    started = time.perf_counter()
+    for i in range(queries):
+        await graph.ainvoke(
+            workflow_query.AgentState(
+                messages=[HumanMessage(content=f"what to see, take {i}?")],
+                retrieved_knowledge=[],
+                query=None,
+                topic_id=topic_id,
+                external_knowledge_sources=[],
+                answer_cache=None,
+            ),
+            runnable_config,
+        )
+    return (time.perf_counter() - started) / queries
+
+
+def main(queries: int, llm_latency: float, retrieval_latency: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # measure the worst case, where the LLM is needed for classification
+        config = make_config(tmp_dir).model_copy(
+            update={"classification": ClassificationConfig(local_tiers=[])}
+        )
+        db = services.get_db(config)
+        SqlAlchemyBase.metadata.create_all(db)
+        with Session(db) as session:
+            topic = SqlTopic(name="Paris")
+            session.add(topic)
+            session.commit()
+            topic_id = topic.id
+
+        install_fakes(
+            config,
+            FixedLatencyChatModel(
+                latency=llm_latency,
+                structured_response={"is_weather_related": False, "location": None},
+            ),
+            FakeVectorStore(latency=retrieval_latency),
+        )
+
+        for name, graph in [
+            ("serial", get_serial_graph()),
+            ("parallel", workflow_query.get_graph()),
+        ]:
+            latency = asyncio.run(mean_latency(graph, config, topic_id, queries))
+            print(f"{name:>8}: {latency * 1e3:8.1f} ms per query")
+
+        services.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        queries=int(args[0]) if len(args) > 0 else 20,
+        llm_latency=float(args[1]) if len(args) > 1 else 0.5,
+        retrieval_latency=float(args[2]) if len(args) > 2 else 0.1,
+    )
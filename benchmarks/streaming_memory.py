@@ -0,0 +1,110 @@
+"""Peak memory of ingesting a large local HTML file: read, parsed and chunked
+whole vs streamed (see `workflow_ingest.stream`), for growing file sizes.
+
+Each ingestion runs in its own process, whose peak RSS above its baseline
+after imports is reported. Embeddings are a local fake and chunks are
+discarded once embedded, so that only ingestion itself takes memory.
+
+Usage: python -m benchmarks.streaming_memory [sizes in MB, comma-separated]
+"""
+
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import services
+from src.db import SqlAlchemyBase
+from src.workflow_ingest import batch
+from .fakes import FakeVectorStore, FixedLatencyChatModel, install_fakes, make_config
+
+PARAGRAPH = (
+    "<p>Paris, the 'City of Light,' boasts iconic landmarks such as the "
+    "<a href='/eiffel'>Eiffel Tower</a>, offering panoramic views from its "
+    "observation decks.</p><script>track('paragraph');</script>\n"
+)
+
+
+class DiscardingVectorStore(FakeVectorStore):
+    """Embeds chunks as a store would, keeping none of them"""
+
+    def add_documents(self, documents, **kwargs):
+        self.embeddings.embed_documents([d.page_content for d in documents])
+        return [d.id for d in documents]
+
+
+def write_html(path: str, size: int) -> None:
+    with open(path, "w") as file:
+        file.write("<!DOCTYPE html><html><head><title>Paris</title></head><body>")
+        for _ in range(size // len(PARAGRAPH) + 1):
+            file.write(PARAGRAPH)
+        file.write("</body></html>")
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process, in bytes"""
+    # kilobytes on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def ingest(mode: str, path: str, tmp_dir: str) -> None:
+    """Ingest `path` and print the peak RSS growth and time it took"""
+    config = make_config(tmp_dir)
+    config.indexing.streaming_threshold = 0 if mode == "streamed" else 2**62
+    embeddings = DeterministicFakeEmbedding(size=384)
+    services.registry.get_or_create(
+        "embeddings", services.embeddings_key(config), lambda: embeddings
+    )
+    SqlAlchemyBase.metadata.create_all(services.get_db(config))
+    install_fakes(
+        config, FixedLatencyChatModel(latency=0, response="{}"), DiscardingVectorStore()
+    )
+
+    baseline = peak_rss()
+    started = time.perf_counter()
+    report = asyncio.run(batch.aingest_many([path], None, config, workers=0))
+    assert report["ingested"] == 1, report
+    print(peak_rss() - baseline, time.perf_counter() - started, report["chunks"])
+
+
+def measure(mode: str, path: str) -> tuple[int, float, int]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.streaming_memory", "--ingest"]
+            + [mode, path, tmp_dir],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+    return int(output[-3]), float(output[-2]), int(output[-1])
+
+
+def main(sizes: list[int]) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            path = os.path.join(tmp_dir, f"{size}MB.html")
+            write_html(path, size * 1024 * 1024)
+            print(f"{size}MB of HTML:")
+            for mode in ["whole", "streamed"]:
+                rss, seconds, chunks = measure(mode, path)
+                print(
+                    f"  {mode}: peak RSS +{rss / 1024 / 1024:.0f}MB,"
+                    f" {seconds:.1f}s, {chunks} chunks"
+                )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--ingest"]:
+        ingest(*sys.argv[2:5])
+    else:
+        main(
+            [int(s) for s in sys.argv[1].split(",")]
+            if len(sys.argv) > 1
+            else [4, 16, 32]
+        )
@@ -0,0 +1,80 @@
+"""Extraction of the insurance tables of the test fixtures: local parsing
+(`HtmlTableExtractor`) vs the LLM extractor (`GenericTabularData`).
+
+The LLM is a local fake answering with the local result after a fixed latency,
+standing in for a typical completion time; the size of the prompt it would be
+sent is reported as well, at about 4 characters per token.
+
+Usage: python -m benchmarks.table_extraction [llm latency in s] [repeat]
+"""
+
+import ast
+import json
+import os
+import sys
+import time
+
+from src.config import IndexingConfig
+from src.data import GenericTabularData, HtmlTableExtractor
+from .fakes import FixedLatencyChatModel
+
+CONFTEST = os.path.join(os.path.dirname(__file__), "..", "tests", "conftest.py")
+
+INDEXING = IndexingConfig(chunk_size=1000, chunk_overlap=100)
+
+
+def load_fixtures() -> dict[str, str]:
+    """HTML constants of the test fixtures, read without importing conftest
+    (which needs the API's environment)"""
+    with open(CONFTEST) as file:
+        tree = ast.parse(file.read())
+    return {
+        node.targets[0].id.lower(): ast.literal_eval(node.value)
+        for node in tree.body
+        if isinstance(node, ast.Assign)
+        and isinstance(node.targets[0], ast.Name)
+        and node.targets[0].id.endswith("_HTML")
+    }
+
+
+def main(llm_latency: float, repeat: int) -> None:
+    print(f"LLM latency {llm_latency}s, local parse over {repeat} runs")
+    for name, html in load_fixtures().items():
+        local = HtmlTableExtractor.from_content(
+            html, "text/html", name, llm=None, indexing=INDEXING
+        )
+        assert local is not None, f"{name}: not parsed locally"
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            HtmlTableExtractor.from_content(
+                html, "text/html", name, llm=None, indexing=INDEXING
+            )
+        local_seconds = (time.perf_counter() - started) / repeat
+
+        llm = FixedLatencyChatModel(
+            latency=llm_latency,
+            response=json.dumps({"title": local.title, "data": local.data}),
+        )
+        prompt = GenericTabularData._extraction_prompt(html)
+        started = time.perf_counter()
+        via_llm = GenericTabularData.from_content(
+            html, "text/html", name, llm=llm, indexing=INDEXING
+        )
+        llm_seconds = time.perf_counter() - started
+        assert via_llm is not None and via_llm.data == local.data
+
+        prompt_chars = sum(len(str(m.content)) for m in prompt)
+        print(
+            f"  {name}: {len(local.data)} records;"
+            f" local {local_seconds * 1000:.2f}ms,"
+            f" LLM {llm_seconds * 1000:.0f}ms (prompt ~{prompt_chars // 4} tokens);"
+            f" {llm_seconds / local_seconds:.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 3.0,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+    )
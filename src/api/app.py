@@ -2,10 +2,19 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from . import route_notes, route_topics, route_query, route_healthcheck
+from . import (
+    route_jobs,
+    route_notes,
+    route_topics,
+    route_query,
+    route_healthcheck,
+    route_metrics,
+)
 from ..db import SqlAlchemyBase
-from .. import services
+from .. import services, workflow_ingest, workflow_query
 from ..settings import Settings
+from ..config import Config
+from ..workflow_query.weather_classification import get_centroids
 from .deps import get_config
 
 
@@ -14,10 +23,23 @@ settings = Settings()  # type: ignore # https://github.com/pydantic/pydantic-set
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Lifespan context manager for database initialization"""
-    engine = services.get_db(get_config())
+    """Lifespan context manager for database initialization, warm-up and service shutdown"""
+    config = get_config()
+    engine = services.get_db(config)
     SqlAlchemyBase.metadata.create_all(engine)
+    warm_up(config)
     yield
+    await services.ashutdown()
+
+
+def warm_up(config: Config) -> None:
+    """Pay one-off setup costs before the first request rather than during it"""
+    workflow_query.get_graph()
+    workflow_ingest.get_graph()
+    services.get_llm(config)
+    services.get_vector_store(config)
+    if "prototype" in config.classification.local_tiers:
+        get_centroids(config)
 
 
 app = FastAPI(lifespan=lifespan)
@@ -31,6 +53,8 @@ app.add_middleware(
 )
 
 app.include_router(route_notes.router)
+app.include_router(route_jobs.router)
 app.include_router(route_topics.router)
 app.include_router(route_query.router)
 app.include_router(route_healthcheck.router)
+app.include_router(route_metrics.router)
@@ -1,5 +1,7 @@
+import functools
 from ..config import Config
 
 
+@functools.cache
 def get_config() -> Config:
     return Config.from_env()
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Any, Optional
+from pydantic import BaseModel, Field
+
+from .. import services
+from ..config import Config
+from ..db import SqlTopic
+from ..workflow_ingest.jobs import aenqueue_ingest, aget_job
+from .deps import get_config
+
+
+router = APIRouter()
+
+
+class IngestRequest(BaseModel):
+    """Pydantic model for ingestion request"""
+
+    urls: list[str] = Field(min_length=1)
+    topic_id: Optional[str] = None
+
+
+class JobResponse(BaseModel):
+    """Pydantic model for job status response"""
+
+    id: str
+    # queued, running, succeeded or failed
+    status: str
+    attempts: int
+    max_attempts: int
+    created_at: datetime
+    updated_at: datetime
+    # report of the last attempt, with the outcome of each URL
+    result: Optional[dict[str, Any]]
+    error: Optional[str]
+
+
+@router.post("/ingest", operation_id="ingest", status_code=202)
+async def ingest(request: IngestRequest, config: Config = Depends(get_config)):
+    """Queue the ingestion of HTTP URLs; follow it with `GET /jobs/{job_id}`"""
+    # other schemes would read the server's files
+    invalid = [u for u in request.urls if not u.startswith(("http://", "https://"))]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid URLs: {invalid}")
+
+    if request.topic_id:
+        db = services.get_async_db(config)
+        async with AsyncSession(db) as session:
+            topic = await session.scalar(
+                select(SqlTopic).where(SqlTopic.id == request.topic_id)
+            )
+            if topic is None:
+                raise HTTPException(status_code=400, detail="Invalid topic")
+
+    job_id = await aenqueue_ingest(request.urls, request.topic_id, config)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse, operation_id="get_job")
+async def get_job(job_id: str, config: Config = Depends(get_config)):
+    """Get the status of a queued job, and its result once run"""
+    job = await aget_job(job_id, config)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
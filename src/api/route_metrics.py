@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from .. import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", operation_id="metrics")
+def get_metrics():
+    """In-process counters and latency summaries"""
+    return metrics.snapshot()
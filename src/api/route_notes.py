@@ -1,14 +1,18 @@
+import asyncio
 import pprint
 from fastapi import APIRouter, HTTPException, Query, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from pydantic import BaseModel
 from enum import Enum
 from data_uri_parser import DataURI  # type: ignore[import-untyped]
 
-from .. import services, workflow_ingest
+from .. import services
 from ..db import SqlTopic, SqlKnowledgeBaseDocument
 from ..config import Config
+from ..workflow_ingest.jobs import aenqueue_ingest
+from ..workflow_query.caches import increment_answer_generations, invalidate_answers
 from .deps import get_config
 
 
@@ -27,14 +31,17 @@ class NoteCreate(BaseModel):
     topic_id: Optional[str] = None
 
 
-@router.post("/notes", operation_id="create_note")
-def create_note(note: NoteCreate, config: Config = Depends(get_config)):
-    """Add a new note to the knowledge base"""
+@router.post("/notes", operation_id="create_note", status_code=202)
+async def create_note(note: NoteCreate, config: Config = Depends(get_config)):
+    """Queue a new note for addition to the knowledge base; the id of the note
+    is among the `document_ids` of the job's result (see `GET /jobs/{job_id}`)"""
 
     if note.topic_id:
-        db = services.get_db(config)
-        with Session(db) as session:
-            topic = session.query(SqlTopic).filter(SqlTopic.id == note.topic_id).first()
+        db = services.get_async_db(config)
+        async with AsyncSession(db) as session:
+            topic = await session.scalar(
+                select(SqlTopic).where(SqlTopic.id == note.topic_id)
+            )
             if topic is None:
                 raise HTTPException(status_code=400, detail="Invalid topic")
 
@@ -45,81 +52,73 @@ def create_note(note: NoteCreate, config: Config = Depends(get_config)):
         data=note.content.encode("utf-8"),
     )
 
-    initial_state = workflow_ingest.AgentState(
-        url=data_uri,
-        source_content=None,
-        extracted_data=[],
-        topic_id=note.topic_id,
-    )
-
     try:
-        result = workflow_ingest.get_graph().invoke(
-            initial_state, config.to_runnable_config()
-        )
-
-        # Get the ID of the first extracted document
-        if result["extracted_data"]:
-            note_id = result["extracted_data"][0].id()
-            return {"id": note_id}
-        else:
-            raise HTTPException(status_code=500, detail="No note was created")
+        job_id = await aenqueue_ingest([str(data_uri)], note.topic_id, config)
+        return {"job_id": job_id, "status": "queued"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/notes", operation_id="list_notes")
-def get_notes(
+async def get_notes(
     topic_id: str = Query(
         description="Topic ID to filter notes by. Use 'default' to get notes without a topic."
     ),
     config: Config = Depends(get_config),
 ):
     """Get notes filtered by topic"""
-    db = services.get_db(config)
+    db = services.get_async_db(config)
 
-    with Session(db) as session:
-        query = session.query(SqlKnowledgeBaseDocument)
+    async with AsyncSession(db) as session:
+        query = select(SqlKnowledgeBaseDocument)
 
         if topic_id == "default":
-            query = query.filter(SqlKnowledgeBaseDocument.topic_id.is_(None))
+            query = query.where(SqlKnowledgeBaseDocument.topic_id.is_(None))
         elif topic_id is not None:
-            db_topic = session.query(SqlTopic).filter(SqlTopic.id == topic_id).first()
+            db_topic = await session.scalar(
+                select(SqlTopic).where(SqlTopic.id == topic_id)
+            )
             if db_topic is None:
                 raise HTTPException(status_code=404, detail="Topic not found")
-            query = query.filter(SqlKnowledgeBaseDocument.topic_id == db_topic.id)
+            query = query.where(SqlKnowledgeBaseDocument.topic_id == db_topic.id)
 
-        notes = query.all()
+        notes = (await session.scalars(query)).all()
         return notes
 
 
 @router.delete("/notes/{note_id}", operation_id="delete_note")
-def delete_note(note_id: str, config: Config = Depends(get_config)):
+async def delete_note(note_id: str, config: Config = Depends(get_config)):
     """Delete a note from both database and vector store"""
-    db = services.get_db(config)
+    db = services.get_async_db(config)
     vector_store = services.get_vector_store(config)
 
-    with Session(db) as session:
+    async with AsyncSession(db) as session:
         # First check if note exists
-        note = (
-            session.query(SqlKnowledgeBaseDocument)
-            .filter(SqlKnowledgeBaseDocument.id == note_id)
-            .first()
+        note = await session.scalar(
+            select(SqlKnowledgeBaseDocument).where(
+                SqlKnowledgeBaseDocument.id == note_id
+            )
         )
         if note is None:
             raise HTTPException(status_code=404, detail="Note not found")
 
         try:
             # Delete from database
-            session.delete(note)
-            session.commit()
-
-            # Delete all chunks from vector store
-            # The vector store contains chunks with IDs in format "{note_id}-{chunk_id}"
-            vector_store.delete(
-                [f"{note_id}-{i}" for i in range(100)]
-            )  # Assuming max 100 chunks per note
+            await session.delete(note)
+            await session.execute(
+                increment_answer_generations(
+                    session.get_bind().dialect.name, [note.topic_id]
+                )
+            )
+            await session.commit()
+
+            # all of the note's chunks, found by their metadata
+            await asyncio.to_thread(
+                services.delete_document_chunks, vector_store, [note_id]
+            )
+            invalidate_answers(config, note.topic_id)
 
             return {"message": f"Note {note_id} deleted successfully"}
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,14 @@
+import json
 import pprint
+import time
+from typing import Any, AsyncIterator
 from pydantic import BaseModel
 from fastapi import APIRouter, Query, Depends
+from fastapi.responses import StreamingResponse
 from langchain.schema import HumanMessage
 
 from ..config import Config
-from .. import workflow_query
+from .. import metrics, services, workflow_query
 from .deps import get_config
 
 
@@ -19,27 +23,109 @@ class QueryResponse(BaseModel):
 
 
 @router.get("/query", response_model=QueryResponse, operation_id="query")
-def query(
+async def query(
     q: str = Query(description="The question to ask the knowledge base"),
     topic_id: str | None = Query(description="Optional topic id"),
     config: Config = Depends(get_config),
 ):
     """Query the knowledge base with a question"""
     graph = workflow_query.get_graph()
+    started_at = time.perf_counter()
 
-    # Initialize state with the user's question
+    result = await graph.ainvoke(
+        make_initial_state(q, topic_id), config.to_runnable_config()
+    )
+
+    metrics.observe("query.latency", time.perf_counter() - started_at)
+
+    return {
+        "answer": result["messages"][-1].content,
+        "sources": [doc.id for doc in result["retrieved_knowledge"]],
+    }
+
+
+@router.get("/query/stream", operation_id="query_stream")
+async def query_stream(
+    q: str = Query(description="The question to ask the knowledge base"),
+    topic_id: str | None = Query(default=None, description="Optional topic id"),
+    config: Config = Depends(get_config),
+):
+    """Query the knowledge base, streaming progress and answer tokens as server-sent events.
+
+    Emits `progress` events as workflow nodes complete, `token` events as
+    the answer is generated, and a final `done` event carrying the full
+    answer and its sources (or `error` if the workflow fails).
+    """
+    return StreamingResponse(
+        stream_query_events(make_initial_state(q, topic_id), config),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def make_initial_state(q: str, topic_id: str | None) -> workflow_query.AgentState:
     # TODO: we might want the entire chat history instead here
-    initial_state = workflow_query.AgentState(
+    return workflow_query.AgentState(
         messages=[HumanMessage(content=q)],
         retrieved_knowledge=[],
         query=None,
         topic_id=topic_id,
         external_knowledge_sources=[],
+        answer_cache=None,
     )
 
-    result = graph.invoke(initial_state, config.to_runnable_config())
 
-    return {
-        "answer": result["messages"][-1].content,
-        "sources": [doc.id for doc in result["retrieved_knowledge"]],
-    }
+async def stream_query_events(
+    initial_state: workflow_query.AgentState, config: Config
+) -> AsyncIterator[str]:
+    log = services.get_logger(config)
+    started_at = time.perf_counter()
+    first_token_at: float | None = None
+    answer = ""
+    sources: list[str] = []
+
+    try:
+        async for mode, chunk in workflow_query.get_graph().astream(
+            initial_state,
+            config.to_runnable_config(),
+            stream_mode=["updates", "messages"],
+        ):
+            if mode == "updates":
+                for node, update in chunk.items():
+                    yield format_sse_event("progress", {"node": node})
+                    if update and "retrieved_knowledge" in update:
+                        sources += [doc.id for doc in update["retrieved_knowledge"]]
+                    if update and "messages" in update:
+                        answer = update["messages"][-1].content
+
+            elif mode == "messages":
+                message, metadata = chunk
+                # only the answer is of interest, not e.g. classification output
+                if metadata.get("langgraph_node") != "generate" or not message.content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    metrics.observe(
+                        "query_stream.time_to_first_token", first_token_at - started_at
+                    )
+                yield format_sse_event("token", {"content": message.content})
+
+    except Exception as e:
+        log.exception("Error while streaming query")
+        metrics.increment("query_stream.errors")
+        yield format_sse_event("error", {"detail": str(e)})
+        return
+
+    total = time.perf_counter() - started_at
+    metrics.observe("query_stream.latency", total)
+    log.info(
+        "query stream completed: time to first token %s, total %.3fs",
+        "n/a" if first_token_at is None else f"{first_token_at - started_at:.3f}s",
+        total,
+    )
+
+    yield format_sse_event("done", {"answer": answer, "sources": sources})
+
+
+def format_sse_event(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
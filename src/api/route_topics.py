@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone
 from typing import List
 from pydantic import BaseModel
@@ -7,6 +9,8 @@ from pydantic import BaseModel
 from .. import services
 from ..config import Config
 from ..db import SqlTopic
+from ..workflow_ingest.refresh import arefresh_topic
+from ..workflow_query.caches import increment_answer_generations, invalidate_topic
 from .deps import get_config
 
 
@@ -31,17 +35,17 @@ class TopicResponse(BaseModel):
 
 
 @router.post("/topics", response_model=TopicResponse, operation_id="create_topic")
-def create_topic(topic: TopicCreate, config: Config = Depends(get_config)):
+async def create_topic(topic: TopicCreate, config: Config = Depends(get_config)):
     """Add a new topic to the database"""
-    db = services.get_db(config)
+    db = services.get_async_db(config)
 
     # Normalize the topic name
     normalized_name = topic.name.strip()
 
-    with Session(db) as session:
+    async with AsyncSession(db) as session:
         # Check for existing topic (case-insensitive)
-        existing_topic = (
-            session.query(SqlTopic).filter(SqlTopic.name.ilike(normalized_name)).first()
+        existing_topic = await session.scalar(
+            select(SqlTopic).where(SqlTopic.name.ilike(normalized_name))
         )
 
         if existing_topic:
@@ -52,53 +56,89 @@ def create_topic(topic: TopicCreate, config: Config = Depends(get_config)):
         db_topic = SqlTopic(name=normalized_name, created_at=datetime.now(timezone.utc))
         try:
             session.add(db_topic)
-            session.commit()
+            await session.commit()
             # Refresh to ensure we have the latest data including the generated ID
-            session.refresh(db_topic)
+            await session.refresh(db_topic)
+            invalidate_topic(config, db_topic.id)
             return db_topic
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/topics", response_model=List[TopicResponse], operation_id="list_topics")
-def list_topics(config: Config = Depends(get_config)):
+async def list_topics(config: Config = Depends(get_config)):
     """Get all topics from the database"""
-    db = services.get_db(config)
+    db = services.get_async_db(config)
 
-    with Session(db) as session:
-        topics = session.query(SqlTopic).all()
+    async with AsyncSession(db) as session:
+        topics = (await session.scalars(select(SqlTopic))).all()
         return topics
 
 
 @router.get(
     "/topics/{topic_id}", response_model=TopicResponse, operation_id="get_topic"
 )
-def get_topic(topic_id: str, config: Config = Depends(get_config)):
+async def get_topic(topic_id: str, config: Config = Depends(get_config)):
     """Get a topic by ID"""
-    db = services.get_db(config)
+    db = services.get_async_db(config)
 
-    with Session(db) as session:
-        topic = session.query(SqlTopic).filter(SqlTopic.id == topic_id).first()
+    async with AsyncSession(db) as session:
+        topic = await session.scalar(select(SqlTopic).where(SqlTopic.id == topic_id))
         if topic is None:
             raise HTTPException(status_code=404, detail="Topic not found")
         return topic
 
 
 @router.delete("/topics/{topic_id}", operation_id="delete_topic")
-def delete_topic(topic_id: str, config: Config = Depends(get_config)):
-    """Delete a topic by ID"""
-    db = services.get_db(config)
+async def delete_topic(topic_id: str, config: Config = Depends(get_config)):
+    """Delete a topic by ID, with its documents and their chunks"""
+    db = services.get_async_db(config)
 
-    with Session(db) as session:
-        topic = session.query(SqlTopic).filter(SqlTopic.id == topic_id).first()
+    async with AsyncSession(db) as session:
+        topic = await session.scalar(select(SqlTopic).where(SqlTopic.id == topic_id))
         if topic is None:
             raise HTTPException(status_code=404, detail="Topic not found")
 
         try:
-            session.delete(topic)
-            session.commit()
+            await session.delete(topic)
+            await session.execute(
+                increment_answer_generations(
+                    session.get_bind().dialect.name, [topic_id]
+                )
+            )
+            await session.commit()
+            await asyncio.to_thread(
+                services.delete_topic_chunks,
+                services.get_vector_store(config),
+                topic_id,
+            )
+            invalidate_topic(config, topic_id)
             return {"message": f"Topic {topic_id} deleted successfully"}
         except Exception as e:
-            session.rollback()
+            await session.rollback()
             raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/topics/{topic_id}/refresh", operation_id="refresh_topic")
+async def refresh_topic(
+    topic_id: str,
+    concurrency: int = Query(
+        default=8, ge=1, le=64, description="Source URLs re-checked at once"
+    ),
+    config: Config = Depends(get_config),
+):
+    """Re-check the source URLs of a topic's documents and re-ingest those that
+    changed. Use 'default' for documents without a topic."""
+    if topic_id != "default":
+        db = services.get_async_db(config)
+        async with AsyncSession(db) as session:
+            topic = await session.scalar(
+                select(SqlTopic).where(SqlTopic.id == topic_id)
+            )
+            if topic is None:
+                raise HTTPException(status_code=404, detail="Topic not found")
+
+    return await arefresh_topic(
+        None if topic_id == "default" else topic_id, config, concurrency=concurrency
+    )
@@ -0,0 +1,214 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, NamedTuple, TypeVar
+
+import numpy as np
+
+from . import metrics
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """Thread-safe, size-bounded LRU cache with per-entry time-to-live.
+
+    Hits and misses are counted in `metrics` as `cache.<name>.hits` and
+    `cache.<name>.misses`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        metrics.increment(f"cache.{self.name}.{'misses' if entry is None else 'hits'}")
+        return None if entry is None else entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[K], bool]) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _SemanticEntry(NamedTuple, Generic[K, V]):
+    partition: K
+    expires_at: float
+    # unit length, so that cosine similarity is a dot product
+    vector: np.ndarray
+    value: V
+
+
+class SemanticCache(Generic[K, V]):
+    """Thread-safe, size-bounded LRU cache looked up by embedding similarity.
+
+    Entries live in partitions (e.g. one per topic): a lookup returns the
+    value of the entry in the same partition whose vector is most similar to
+    the query vector, provided the cosine similarity reaches `threshold`.
+    Partitions can be invalidated as a whole; `generation()` lets a writer
+    detect that its partition was invalidated while it computed the value.
+
+    Counted in `metrics` as `cache.<name>.hits`, `.misses`, `.evictions` and
+    `.invalidations`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int,
+        ttl: float,
+        threshold: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # entry id -> entry, least recently used first
+        self._entries: OrderedDict[int, _SemanticEntry[K, V]] = OrderedDict()
+        self._partitions: dict[K, set[int]] = {}
+        # partition -> (entry ids, their vectors stacked in rows, their
+        # expiry times), built on lookup and dropped whenever the partition's
+        # entries change
+        self._rows: dict[K, tuple[list[int], np.ndarray, np.ndarray]] = {}
+        self._generations: dict[K, int] = {}
+
+    def get(self, partition: K, vector: list[float]) -> V | None:
+        query = _normalize(vector)
+        best_id = None
+        with self._lock:
+            rows = self._partition_rows(partition)
+            if rows is not None:
+                ids, matrix, expires_at = rows
+                # one product for all of the partition's entries
+                similarities = np.where(
+                    expires_at > self._clock(), matrix @ query, -np.inf
+                )
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    best_id = ids[best]
+                    self._entries.move_to_end(best_id)
+                    value = self._entries[best_id].value
+
+        metrics.increment(
+            f"cache.{self.name}.{'misses' if best_id is None else 'hits'}"
+        )
+        return None if best_id is None else value
+
+    def generation(self, partition: K) -> int:
+        with self._lock:
+            return self._generations.get(partition, 0)
+
+    def set(
+        self,
+        partition: K,
+        vector: list[float],
+        value: V,
+        generation: int | None = None,
+    ) -> bool:
+        """Store `value`, unless `partition` was invalidated since `generation`"""
+        with self._lock:
+            if generation is not None and generation != self._generations.get(
+                partition, 0
+            ):
+                return False
+
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _SemanticEntry(
+                partition, self._clock() + self.ttl, _normalize(vector), value
+            )
+            self._partitions.setdefault(partition, set()).add(entry_id)
+            self._rows.pop(partition, None)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                metrics.increment(f"cache.{self.name}.evictions")
+            return entry_id in self._entries
+
+    def invalidate(self, partition: K) -> None:
+        with self._lock:
+            self._generations[partition] = self._generations.get(partition, 0) + 1
+            for entry_id in self._partitions.pop(partition, set()):
+                del self._entries[entry_id]
+            self._rows.pop(partition, None)
+        metrics.increment(f"cache.{self.name}.invalidations")
+
+    def clear(self) -> None:
+        with self._lock:
+            for partition in self._partitions:
+                self._generations[partition] = self._generations.get(partition, 0) + 1
+            self._entries.clear()
+            self._partitions.clear()
+            self._rows.clear()
+
+    def _partition_rows(
+        self, partition: K
+    ) -> tuple[list[int], np.ndarray, np.ndarray] | None:
+        rows = self._rows.get(partition)
+        if rows is None and partition in self._partitions:
+            ids = list(self._partitions[partition])
+            entries = [self._entries[entry_id] for entry_id in ids]
+            rows = self._rows[partition] = (
+                ids,
+                np.stack([entry.vector for entry in entries]),
+                np.array([entry.expires_at for entry in entries]),
+            )
+        return rows
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._rows.pop(entry.partition, None)
+        ids = self._partitions[entry.partition]
+        ids.discard(entry_id)
+        if not ids:
+            del self._partitions[entry.partition]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _normalize(vector: list[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float64)
+    norm = np.linalg.norm(array)
+    return array if norm == 0 else array / norm
@@ -1,12 +1,17 @@
+import asyncio
 import click
+import json
 import logging
-from os import path
+import signal
+import sys
+import time
 from langchain_core.messages import HumanMessage, AIMessage
 from sqlalchemy.orm import Session
 
 from src import services, workflow_query, workflow_ingest, db
 from src.config import Config
 from src.db import SqlTopic
+from src.workflow_ingest import batch, checkpoints, crawl, jobs, orphans, refresh
 
 
 CONFIG = Config.from_env()
@@ -21,8 +26,10 @@ CONFIG = Config.from_env()
         ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], case_sensitive=False
     ),
 )
-def cli(log):
+@click.pass_context
+def cli(ctx: click.Context, log):
     logging.basicConfig(level=getattr(logging, log.upper()))
+    ctx.call_on_close(services.shutdown)
 
 
 @click.command(name="create_topic")
@@ -42,25 +49,342 @@ def cmd_create_topic(id: str | None, name: str):
 
 
 @click.command(name="ingest")
-@click.argument("path_or_url")
+@click.argument("inputs", nargs=-1)
 @click.option("--topic_id", required=False, help="Optional topic ID")
-def cmd_ingest(path_or_url: str, topic_id: str | None):
-    if path_or_url.startswith(("http://", "https://", "file://", "data://")):
-        input_url = path_or_url
+@click.option(
+    "--urls_file",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False),
+    help="File listing one URL or path per line (repeatable)",
+)
+@click.option(
+    "--concurrency", default=16, show_default=True, help="Inputs processed at once"
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Processes for extraction and embedding; 0 to use threads [default: CPU count, 0 for a single input]",
+)
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a JSON summary report to this file",
+)
+@click.option(
+    "--pending",
+    type=click.Choice(["resume", "discard"]),
+    default="resume",
+    show_default=True,
+    help="What to do with runs left pending by an interrupted ingest, not those of jobs (needs INGEST_CHECKPOINT_PATH)",
+)
+def cmd_ingest(
+    inputs: tuple[str, ...],
+    topic_id: str | None,
+    urls_file: tuple[str, ...],
+    concurrency: int,
+    workers: int | None,
+    report: str | None,
+    pending: str,
+):
+    """Ingest URLs, files, directories and glob patterns."""
+    urls = batch.expand_inputs(inputs, urls_file)
+    if not urls:
+        raise click.UsageError("No inputs to ingest")
+    checkpointer = checkpoints.get_checkpointer(CONFIG)
+    if checkpointer is None:
+        if pending == "discard":
+            raise click.UsageError("Checkpointing is disabled, no run is pending")
+    elif thread_ids := checkpointer.thread_ids(checkpoints.BATCH_RUN):
+        # those of jobs are resumed by their retries: left alone
+        if pending == "discard":
+            for thread_id in thread_ids:
+                checkpointer.delete_thread(thread_id)
+            click.echo(f"Discarded {len(thread_ids)} pending runs", err=True)
+        else:
+            resumed = len(
+                {checkpoints.to_thread_id(checkpoints.BATCH_RUN, url) for url in urls}
+                & set(thread_ids)
+            )
+            click.echo(
+                f"Resuming {resumed} of {len(thread_ids)} pending runs", err=True
+            )
+    if workers is None and len(urls) == 1:
+        # not worth starting a process
+        workers = 0
+
+    started = time.perf_counter()
+    completed = 0
+
+    def echo_progress(outcome: batch.IngestOutcome):
+        nonlocal completed
+        completed += 1
+        rate = completed / (time.perf_counter() - started)
+        detail = (
+            outcome["error"]
+            if outcome["status"] == "failed"
+            else f"{outcome['new_documents']} new and {outcome['skipped_documents']}"
+            f" unchanged documents, {outcome['chunks']} chunks"
+        )
+        click.echo(
+            f"[{completed}/{len(urls)}] {outcome['status']}: {outcome['url']}"
+            f" ({detail}) - {rate:.1f} inputs/s",
+            err=True,
+        )
+
+    summary = asyncio.run(
+        batch.aingest_many(
+            urls,
+            topic_id,
+            CONFIG,
+            concurrency=concurrency,
+            workers=workers,
+            on_outcome=echo_progress,
+        )
+    )
+
+    if report is not None:
+        with open(report, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    seconds = summary["seconds"]
+    click.echo()
+    click.echo(
+        f"Ingested {summary['ingested']} of {summary['inputs']} inputs"
+        f" ({summary['unchanged']} unchanged, {summary['empty']} without"
+        f" extractable data, {summary['failed']} failed) in {seconds:.1f}s"
+    )
+    click.echo(
+        f"{summary['new_documents']} new documents,"
+        f" {summary['skipped_documents']} already stored and skipped,"
+        f" {summary['chunks']} chunks;"
+        f" {summary['inputs'] / seconds:.1f} inputs/s,"
+        f" {summary['chunks'] / seconds:.1f} chunks/s"
+    )
+    for outcome in summary["outcomes"]:
+        if outcome["status"] == "failed":
+            click.echo(f"  failed: {outcome['url']}: {outcome['error']}")
+    click.echo()
+
+    if summary["failed"]:
+        sys.exit(1)
+
+
+@click.command(name="refresh")
+@click.option(
+    "--topic_id", required=False, help="Topic ID [default: documents without a topic]"
+)
+@click.option(
+    "--concurrency", default=8, show_default=True, help="Source URLs re-checked at once"
+)
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a JSON summary report to this file",
+)
+def cmd_refresh(topic_id: str | None, concurrency: int, report: str | None):
+    """Re-ingest documents of a topic whose source URLs changed."""
+    completed = 0
+
+    def echo_progress(outcome: refresh.RefreshOutcome):
+        nonlocal completed
+        completed += 1
+        detail = (
+            f" ({outcome['error']})"
+            if outcome["status"] == "failed"
+            else (
+                f" ({outcome['new_documents']} new and {outcome['deleted_documents']}"
+                f" deleted documents, {outcome['chunks']} chunks)"
+                if outcome["status"] == "updated"
+                else ""
+            )
+        )
+        click.echo(
+            f"[{completed}] {outcome['status']}: {outcome['url']}{detail}", err=True
+        )
+
+    summary = asyncio.run(
+        refresh.arefresh_topic(
+            topic_id, CONFIG, concurrency=concurrency, on_outcome=echo_progress
+        )
+    )
+
+    if report is not None:
+        with open(report, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    click.echo()
+    click.echo(
+        f"Refreshed {summary['sources']} source URLs in {summary['seconds']:.1f}s:"
+        f" {summary['updated']} updated, {summary['not_modified']} not modified,"
+        f" {summary['unchanged']} unchanged, {summary['failed']} failed"
+    )
+    click.echo(
+        f"{summary['new_documents']} new documents,"
+        f" {summary['deleted_documents']} superseded documents deleted,"
+        f" {summary['chunks']} chunks"
+    )
+    click.echo()
+
+    if summary["failed"]:
+        sys.exit(1)
+
+
+@click.command(name="crawl")
+@click.argument("seeds", nargs=-1)
+@click.option("--topic_id", required=False, help="Optional topic ID")
+@click.option(
+    "--max_depth",
+    default=2,
+    show_default=True,
+    help="Links followed from a seed or sitemap entry",
+)
+@click.option("--max_pages", default=1000, show_default=True, help="URLs crawled")
+@click.option(
+    "--concurrency", default=8, show_default=True, help="Pages fetched at once"
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Processes for extraction and embedding; 0 to use threads [default: CPU count]",
+)
+@click.option(
+    "--sitemaps/--no_sitemaps",
+    default=True,
+    show_default=True,
+    help="Also crawl the pages listed by the sites' sitemaps",
+)
+@click.option(
+    "--resume",
+    "crawl_id",
+    required=False,
+    help="ID of an interrupted crawl to resume, instead of seeds",
+)
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a JSON summary report to this file",
+)
+def cmd_crawl(
+    seeds: tuple[str, ...],
+    topic_id: str | None,
+    max_depth: int,
+    max_pages: int,
+    concurrency: int,
+    workers: int | None,
+    sitemaps: bool,
+    crawl_id: str | None,
+    report: str | None,
+):
+    """Crawl sites from seed URLs, ingesting pages as they are fetched."""
+    if crawl_id is not None:
+        if seeds:
+            raise click.UsageError("Either seeds or --resume, not both")
+        try:
+            state = crawl.load_crawl(crawl_id, CONFIG)
+        except ValueError as e:
+            raise click.UsageError(str(e))
     else:
-        abs_path = path.abspath(path_or_url)
-        input_url = f"file://{abs_path}"
-    initial_agent_state = workflow_ingest.AgentState(
-        url=input_url, source_content=None, extracted_data=[], topic_id=topic_id
+        if not seeds:
+            raise click.UsageError("No seed URLs to crawl")
+        try:
+            state = crawl.create_crawl(
+                list(seeds), topic_id, CONFIG, max_depth=max_depth, max_pages=max_pages
+            )
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    click.echo(f"Crawl {state['id']} (resume with --resume {state['id']})", err=True)
+
+    completed = 0
+
+    def echo_progress(outcome: batch.IngestOutcome):
+        nonlocal completed
+        completed += 1
+        detail = (
+            outcome["error"]
+            if outcome["status"] == "failed"
+            else f"{outcome['new_documents']} new documents, {outcome['chunks']} chunks"
+        )
+        click.echo(
+            f"[{completed}] {outcome['status']}: {outcome['url']} ({detail})", err=True
+        )
+
+    summary = asyncio.run(
+        crawl.arun_crawl(
+            state,
+            CONFIG,
+            concurrency=concurrency,
+            workers=workers,
+            discover_sitemaps=sitemaps,
+            on_outcome=echo_progress,
+        )
     )
 
-    workflow_ingest.get_graph().invoke(initial_agent_state, CONFIG.to_runnable_config())
+    if report is not None:
+        with open(report, "w") as f:
+            json.dump(summary, f, indent=2)
 
     click.echo()
-    click.echo("Data ingested successfully")
+    click.echo(
+        f"Crawled {summary['urls']} URLs in {summary['seconds']:.1f}s:"
+        f" {summary['ingested']} ingested, {summary['unchanged']} unchanged,"
+        f" {summary['empty']} without extractable data, {summary['failed']} failed,"
+        f" {summary['disallowed']} disallowed by robots.txt,"
+        f" {summary['skipped']} skipped, {summary['redirected']} redirected"
+    )
+    click.echo(f"{summary['new_documents']} new documents, {summary['chunks']} chunks")
     click.echo()
 
 
+@click.command(name="gc")
+@click.option(
+    "--batch_size",
+    default=1000,
+    show_default=True,
+    help="Chunks scanned and deleted at once",
+)
+@click.option(
+    "--grace_period",
+    default=3600.0,
+    show_default=True,
+    help="Seconds during which orphaned chunks are kept, e.g. those of documents"
+    " being ingested",
+)
+@click.option(
+    "--dry_run", is_flag=True, help="Count orphaned chunks without deleting them"
+)
+def cmd_gc(batch_size: int, grace_period: float, dry_run: bool):
+    """Delete chunks of documents no longer stored and compact the vector store."""
+
+    def echo_progress(scanned: int, orphaned: int):
+        click.echo(f"Scanned {scanned} chunks, {orphaned} orphaned", err=True)
+
+    summary = orphans.collect_orphaned_chunks(
+        CONFIG,
+        batch_size=batch_size,
+        grace_period=grace_period,
+        dry_run=dry_run,
+        on_batch=echo_progress,
+    )
+
+    click.echo()
+    click.echo(
+        f"{'Found' if dry_run else 'Deleted'} {summary['orphaned_chunks']} orphaned"
+        f" chunks of {summary['orphaned_documents']} documents, out of"
+        f" {summary['chunks']} chunks, in {summary['seconds']:.1f}s"
+    )
+    if summary["unowned_chunks"]:
+        click.echo(f"Left {summary['unowned_chunks']} chunks without a source_id alone")
+    if summary["recent_chunks"]:
+        click.echo(
+            f"Kept {summary['recent_chunks']} orphaned chunks written in the last"
+            f" {grace_period:g}s"
+        )
+    if not dry_run:
+        click.echo(f"Reclaimed {summary['bytes_reclaimed']} bytes")
+
+
 @click.command(name="list_topics")
 def cmd_list_topics():
     """List all available topics."""
@@ -122,6 +446,7 @@ def cmd_query(user_query: str, topic_id: str | None):
         query=None,
         topic_id=topic_id,
         external_knowledge_sources=[],
+        answer_cache=None,
     )
 
     response = workflow_query.get_graph().invoke(
@@ -137,11 +462,62 @@ def cmd_query(user_query: str, topic_id: str | None):
     click.echo()
 
 
+@click.command(name="worker")
+@click.option(
+    "--concurrency",
+    default=4,
+    show_default=True,
+    help="Jobs, and inputs across jobs, processed at once",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Processes for extraction and embedding; 0 to use threads [default: CPU count]",
+)
+@click.option(
+    "--drain",
+    is_flag=True,
+    default=False,
+    help="Exit once no job is left to run instead of waiting for more",
+)
+def cmd_worker(concurrency: int, workers: int | None, drain: bool):
+    """Run queued ingestion jobs until interrupted."""
+
+    def echo_job(job_id: str, status: jobs.JobStatus | None):
+        click.echo(f"Job {job_id}: {status or 'claimed by another worker'}", err=True)
+
+    async def run() -> int:
+        # finish running jobs on SIGINT or SIGTERM, rather than dropping them
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        return await jobs.arun_worker(
+            CONFIG,
+            concurrency=concurrency,
+            workers=workers,
+            stop=stop,
+            drain=drain,
+            on_job=echo_job,
+        )
+
+    count = asyncio.run(run())
+
+    click.echo()
+    click.echo(f"Ran {count} jobs")
+    click.echo()
+
+
 if __name__ == "__main__":
     cli.add_command(cmd_create_topic)
+    cli.add_command(cmd_crawl)
+    cli.add_command(cmd_gc)
     cli.add_command(cmd_ingest)
     cli.add_command(cmd_info)
     cli.add_command(cmd_initdb)
     cli.add_command(cmd_list_topics)
     cli.add_command(cmd_query)
+    cli.add_command(cmd_refresh)
+    cli.add_command(cmd_worker)
     cli()
@@ -4,6 +4,12 @@ from typing import Self, Union, Literal
 
 from .settings import Settings
 
+# the validated instance, passed along in `configurable` to every runnable:
+# keys starting with "__" are left out of the metadata that checkpoints and
+# traces take from `configurable`. Runnable configs are not sent to other
+# processes, which are given the `Config` itself
+VALIDATED_CONFIG_KEY = "__validated_config__"
+
 
 class PineconeVectorStoreConfig(BaseModel):
     type: Literal["pinecone"]
@@ -31,6 +37,92 @@ class ChromaInternalEmbeddingsConfig(BaseModel):
 class IndexingConfig(BaseModel):
     chunk_size: int
     chunk_overlap: int
+    # chunks from concurrently ingested documents are embedded and written
+    # together, in batches of at most this many chunks...
+    embedding_batch_size: int = 256
+    # ...waiting at most this many seconds for a batch to fill; 0 writes
+    # each document's chunks on their own
+    batch_max_latency: float = 0.05
+    # local files larger than this many bytes are streamed in blocks of
+    # `streaming_block_size` bytes rather than read whole (see `stream`)
+    streaming_threshold: int = 64 * 1024 * 1024
+    streaming_block_size: int = 1024 * 1024
+    # tables left to the LLM (see `GenericTabularData`) are sent in prompts
+    # of this many rows, besides the repeated header rows...
+    tabular_rows_per_group: int = 100
+    # ...with at most this many prompts in flight at once for one page
+    tabular_max_concurrency: int = 4
+
+
+class ClassificationConfig(BaseModel):
+    # local tiers consulted, in order, before falling back to the LLM
+    local_tiers: list[Literal["lexicon", "prototype"]] = ["lexicon", "prototype"]
+    # minimum confidence for a local decision to be accepted
+    confidence_threshold: float = 0.8
+
+
+class CachingConfig(BaseModel):
+    # ttl values are in seconds
+    topic_ttl: float = 300
+    topic_maxsize: int = 1024
+    classification_ttl: float = 3600
+    classification_maxsize: int = 10_000
+    # answers are reused for queries on the same topic whose embedding has
+    # at least this cosine similarity with the cached query's
+    answer_similarity_threshold: float = 0.95
+    answer_ttl: float = 3600
+    # 0 disables the answer cache
+    answer_maxsize: int = 1024
+    # embeddings are cached by model and text: in memory, up to this many...
+    embedding_memory_maxsize: int = 10_000
+    # ...and in this SQLite file, if set, up to this many across models
+    embedding_path: str | None = None
+    embedding_max_entries: int = 1_000_000
+
+
+class FetchingConfig(BaseModel):
+    # seconds to establish a connection, and to wait for each read
+    connect_timeout: float = 5
+    read_timeout: float = 20
+    max_connections: int = 100
+    max_connections_per_host: int = 6
+    # retries of connection errors, timeouts and transient statuses, waiting
+    # `retry_backoff * 2**attempt` seconds (or as told by Retry-After), at
+    # most `max_retry_backoff`
+    max_retries: int = 3
+    retry_backoff: float = 0.5
+    max_retry_backoff: float = 30
+    # larger responses are abandoned
+    max_content_size: int = 20 * 1024 * 1024
+    user_agent: str = "rag-engine/0.1"
+
+
+class CrawlingConfig(BaseModel):
+    # seconds between requests to the same host, unless robots.txt asks for more
+    min_host_delay: float = 1.0
+    respect_robots_txt: bool = True
+    # entries read from a site's sitemaps
+    max_sitemap_urls: int = 50_000
+
+
+class CheckpointingConfig(BaseModel):
+    # SQLite file where ingestion runs are checkpointed, to resume those
+    # interrupted; None disables checkpointing
+    path: str | None = None
+
+
+class JobsConfig(BaseModel):
+    # seconds a claimed job is hidden from other workers, renewed while it
+    # runs: the job of a worker that died is claimed again once this expires
+    visibility_timeout: float = 300
+    max_attempts: int = 3
+    # seconds before retrying a failed job, doubled at each attempt
+    retry_delay: float = 10
+    # seconds between polls for jobs of an idle worker
+    poll_interval: float = 1.0
+    # seconds a stopping worker waits for its running jobs before handing
+    # them back to the queue
+    shutdown_timeout: float = 30
 
 
 class OpenaiLlmConfig(BaseModel):
@@ -51,6 +143,17 @@ class DbConfig(BaseModel):
 
 class OpenWeatherMapConfig(BaseModel):
     api_key: str
+    # observations younger than this (seconds) are served without a request
+    cache_ttl: float = 600
+    # older observations, up to this age, are served while being refreshed in
+    # the background; past it they are only used when the service fails
+    stale_ttl: float = 3600
+    cache_maxsize: int = 1024
+    # seconds a query waits for the weather service before giving up
+    deadline: float = 3
+    # e.g. an egress proxy, "http://host:port"
+    proxy: str | None = None
+    use_ssl: bool = True
 
 
 class Config(BaseModel):
@@ -63,20 +166,38 @@ class Config(BaseModel):
         discriminator="type"
     )
     indexing: IndexingConfig = IndexingConfig(chunk_size=1000, chunk_overlap=100)
+    classification: ClassificationConfig = ClassificationConfig()
+    caching: CachingConfig = CachingConfig()
+    fetching: FetchingConfig = FetchingConfig()
+    crawling: CrawlingConfig = CrawlingConfig()
+    jobs: JobsConfig = JobsConfig()
+    checkpointing: CheckpointingConfig = CheckpointingConfig()
     weather: OpenWeatherMapConfig
     log_level: Literal["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"] = (
         "INFO"
     )
 
     def to_runnable_config(self) -> RunnableConfig:
-        return RunnableConfig(configurable=self.model_dump())
+        """Serialize to a runnable config.
+
+        The plain dump is what a runnable config built elsewhere must carry;
+        the validated instance rides along so that nodes can skip validation.
+        """
+        return RunnableConfig(
+            configurable={**self.model_dump(), VALIDATED_CONFIG_KEY: self}
+        )
 
     @classmethod
     def from_runnable_config(cls, config: RunnableConfig) -> Self:
-        """Validate runnable config"""
+        """Validate runnable config, unless it carries an already validated instance"""
         configurable = config.get("configurable")
         assert configurable is not None
-        return cls(**configurable)
+        validated = configurable.get(VALIDATED_CONFIG_KEY)
+        if isinstance(validated, cls):
+            return validated
+        return cls(
+            **{k: v for k, v in configurable.items() if k != VALIDATED_CONFIG_KEY}
+        )
 
     @classmethod
     def from_env(cls) -> Self:
@@ -102,6 +223,12 @@ class Config(BaseModel):
                     "collection_name": "documents",
                     "path": settings.chroma_db_path,
                 },
+                "caching": {
+                    "embedding_path": settings.embedding_cache_path,
+                },
+                "checkpointing": {
+                    "path": settings.ingest_checkpoint_path,
+                },
                 # ignoring type errors here due to https://docs.pydantic.dev/latest/integrations/visual_studio_code/#strict-errors
             }  # type: ignore
         )
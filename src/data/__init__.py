@@ -1,9 +1,12 @@
-from .base import IndexableData
+from .base import Extractor, IndexableData
 from .generic_tabular import GenericTabularData
+from .html_tables import HtmlTableExtractor
 from .textual import TextualData
 
 __all__ = [
+    "Extractor",
     "IndexableData",
     "GenericTabularData",
+    "HtmlTableExtractor",
     "TextualData",
 ]
@@ -1,21 +1,53 @@
+import asyncio
 import hashlib
-from typing import Self, Optional
+from functools import cached_property
+from typing import Protocol, Self, Optional
 from langchain_core.language_models import BaseChatModel
-from pydantic import BaseModel
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pydantic import BaseModel, ConfigDict
+
+from ..config import IndexingConfig
 
 
 class IndexableData(BaseModel):
+    # immutable, so that text, id and chunks are derived once per instance
+    model_config = ConfigDict(frozen=True)
+
     title: Optional[str]
     source_url: str
 
-    def id(self) -> str:
-        content_hash = hashlib.sha256(self.to_text().encode("utf-8")).hexdigest()
+    @cached_property
+    def text(self) -> str:
+        return self.to_text()
+
+    @cached_property
+    def content_id(self) -> str:
+        content_hash = hashlib.sha256(self.text.encode("utf-8")).hexdigest()
         # TODO consider using a url-based id (allows replacing/updating as long as urls are stable)
         return f"{self.__class__.__name__}-{content_hash[:8]}"
 
+    def id(self) -> str:
+        return self.content_id
+
     def to_text(self) -> str:
+        """Build the text to store and index; use `text` for the memoized value"""
         raise Exception("to_text() not defined")
 
+    def chunk_texts(self, chunk_size: int, chunk_overlap: int) -> list[str]:
+        key = (chunk_size, chunk_overlap)
+        chunks = self._chunk_texts.get(key)
+        if chunks is None:
+            chunks = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size, chunk_overlap=chunk_overlap
+            ).split_text(self.text)
+            self._chunk_texts[key] = chunks
+        return chunks
+
+    @cached_property
+    def _chunk_texts(self) -> dict[tuple[int, int], list[str]]:
+        # by chunk size and overlap
+        return {}
+
     @classmethod
     def from_content(
         cls,
@@ -23,5 +55,48 @@ class IndexableData(BaseModel):
         content_type: str,
         source_url: str,
         llm: BaseChatModel | None,
+        indexing: IndexingConfig,
     ) -> Self | None:
         raise Exception("from_content() not defined")
+
+    @classmethod
+    async def afrom_content(
+        cls,
+        content_data: str,
+        content_type: str,
+        source_url: str,
+        llm: BaseChatModel | None,
+        indexing: IndexingConfig,
+    ) -> Self | None:
+        """Async variant of from_content(). Extractors that do I/O should override it."""
+        return await asyncio.to_thread(
+            cls.from_content,
+            content_data=content_data,
+            content_type=content_type,
+            source_url=source_url,
+            llm=llm,
+            indexing=indexing,
+        )
+
+
+class Extractor(Protocol):
+    """Produces indexable data from fetched content, or None if it does not
+    apply to it: `IndexableData` classes themselves, or local parsers"""
+
+    def from_content(
+        self,
+        content_data: str,
+        content_type: str,
+        source_url: str,
+        llm: BaseChatModel | None,
+        indexing: IndexingConfig,
+    ) -> IndexableData | None: ...
+
+    async def afrom_content(
+        self,
+        content_data: str,
+        content_type: str,
+        source_url: str,
+        llm: BaseChatModel | None,
+        indexing: IndexingConfig,
+    ) -> IndexableData | None: ...
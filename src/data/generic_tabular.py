@@ -1,24 +1,46 @@
+from itertools import takewhile
 from typing import Dict, Any, Self
+from bs4 import BeautifulSoup, Tag
 from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain.schema import HumanMessage, SystemMessage
 from pydantic import BaseModel
 
 
+from ..config import IndexingConfig
 from .base import IndexableData
 
 
+class GenericTabularDataExtraction(BaseModel):
+    title: str
+    data: list[Dict[str, Any]]
+
+
+# `with_structured_output` consistently causes the `data` field to not
+# be generated, so we fall back to old-style output parser
+EXTRACTION_PARSER = PydanticOutputParser(pydantic_object=GenericTabularDataExtraction)
+
+# not part of the content
+STRIPPED_TAGS = ["script", "style", "noscript", "template", "nav", "aside", "form"]
+
+KEPT_ATTRIBUTES = ("colspan", "rowspan")
+
+# of text outside of tables, sent along with each group of rows
+MAX_CONTEXT_CHARS = 2000
+
+
 class GenericTabularData(IndexableData):
     data: list[Dict[str, Any]]
 
     def to_text(self) -> str:
-        md = f"# {self.title}\n\n"
-        for kv_pair in self.data:
-            line = ", ".join([f"{k}: {v}" for k, v in kv_pair.items()])
-            line += "\n\n"
-            md += line
-
-        return md
+        lines = [f"# {self.title}"]
+        lines.extend(
+            ", ".join([f"{k}: {v}" for k, v in kv_pair.items()])
+            for kv_pair in self.data
+        )
+        lines.append("")
+        return "\n\n".join(lines)
 
     @classmethod
     def from_content(
@@ -27,37 +49,110 @@ class GenericTabularData(IndexableData):
         content_type: str,
         source_url: str,
         llm: BaseChatModel | None,
+        indexing: IndexingConfig,
     ) -> Self | None:
         assert llm is not None
 
-        if content_type != "text/html":
-            return None
-        if "<table>" not in content_data:
+        if not cls._is_candidate(content_data, content_type):
             return None
 
-        class GenericTabularDataExtraction(BaseModel):
-            title: str
-            data: list[Dict[str, Any]]
-
         try:
-            # `with_structured_output` consistently causes the
-            # `data` field to not be generated, so we fall back to
-            # old-style output parser
-            parser = PydanticOutputParser(pydantic_object=GenericTabularDataExtraction)
-            response = llm.invoke(
-                [
-                    SystemMessage(f"""You are an assistant for data extraction tasks. Extract a title
-                        and tabular data from the provided html.
-                        Provide the output in JSON format: {parser.get_format_instructions()}.`"""),
-                    HumanMessage(content_data),
-                ]
+            responses = llm.batch(
+                cls._extraction_prompts(content_data, indexing),
+                config={"max_concurrency": indexing.tabular_max_concurrency},
             )
-            raw_generic_data = parser.parse(str(response.content))
+            return cls._from_responses(responses, source_url)
+        except:  # TODO log errors
+            return None
 
-            return cls(
-                source_url=source_url,
-                **raw_generic_data.model_dump(),
-            )
+    @classmethod
+    async def afrom_content(
+        cls,
+        content_data: str,
+        content_type: str,
+        source_url: str,
+        llm: BaseChatModel | None,
+        indexing: IndexingConfig,
+    ) -> Self | None:
+        assert llm is not None
+
+        if not cls._is_candidate(content_data, content_type):
+            return None
 
+        try:
+            responses = await llm.abatch(
+                cls._extraction_prompts(content_data, indexing),
+                config={"max_concurrency": indexing.tabular_max_concurrency},
+            )
+            return cls._from_responses(responses, source_url)
         except:  # TODO log errors
             return None
+
+    @staticmethod
+    def _is_candidate(content_data: str, content_type: str) -> bool:
+        return content_type == "text/html" and "<table" in content_data
+
+    @staticmethod
+    def _extraction_prompt(content_data: str) -> list[BaseMessage]:
+        return [
+            SystemMessage(
+                f"""You are an assistant for data extraction tasks. Extract a title
+                        and tabular data from the provided html.
+                        Provide the output in JSON format: {EXTRACTION_PARSER.get_format_instructions()}.`"""
+            ),
+            HumanMessage(content_data),
+        ]
+
+    @classmethod
+    def _extraction_prompts(
+        cls, content_data: str, indexing: IndexingConfig
+    ) -> list[list[BaseMessage]]:
+        groups = split_tables(content_data, indexing.tabular_rows_per_group)
+        if not groups:
+            raise ValueError("No table rows")
+        return [cls._extraction_prompt(group) for group in groups]
+
+    @classmethod
+    def _from_responses(cls, responses: list[BaseMessage], source_url: str) -> Self:
+        """Records of all groups of rows, in order, under the first title"""
+        extractions = [
+            EXTRACTION_PARSER.parse(str(response.content)) for response in responses
+        ]
+        return cls(
+            title=extractions[0].title,
+            source_url=source_url,
+            data=[record for e in extractions for record in e.data],
+        )
+
+
+def split_tables(content_data: str, rows_per_group: int) -> list[str]:
+    """Tables of an HTML page stripped of attributes and other markup, in
+    groups of at most `rows_per_group` rows that each repeat the table's
+    header rows and follow the page's text outside of tables (for titles,
+    units and notes)"""
+    soup = BeautifulSoup(content_data, "html.parser")
+    for element in soup(STRIPPED_TAGS):
+        element.decompose()
+
+    groups: list[tuple[list[Tag], list[Tag]]] = []
+    # layout tables are left to their nested tables
+    for table in [t for t in soup.find_all("table") if t.find("table") is None]:
+        for element in [table, *table.find_all(True)]:
+            element.attrs = {
+                k: v for k, v in element.attrs.items() if k in KEPT_ATTRIBUTES
+            }
+        rows = table.find_all("tr")
+        header_rows = [tr for tr in rows if tr.find_parent("thead") is not None]
+        if not header_rows:
+            header_rows = list(takewhile(lambda tr: tr.find("td") is None, rows))
+        body = [tr for tr in rows if all(tr is not h for h in header_rows)]
+        header = [*table.find_all("caption"), *header_rows]
+        for start in range(0, len(body), rows_per_group):
+            groups.append((header, body[start : start + rows_per_group]))
+        table.extract()
+
+    context = " ".join(soup.get_text(" ").split())[:MAX_CONTEXT_CHARS]
+    return [
+        f"{context}\n<table>{''.join(map(str, header))}{''.join(map(str, rows))}</table>"
+        for header, rows in groups
+    ]
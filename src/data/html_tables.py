@@ -0,0 +1,288 @@
+"""Local extraction of HTML tables, without an LLM.
+
+Data tables (as opposed to tables used for layout, which contain other tables)
+are read into rows of cells, with column and row spans expanded, and headers
+taken from `<thead>` or leading rows of `<th>` cells. Headers repeated side by
+side, as in tables wrapped into several column groups to save space, are read
+as one record per group. Each table gets a confidence, lower for headers
+guessed from the first row and for rows not matching the header's width; below
+`HtmlTableExtractor.MIN_CONFIDENCE`, the page is left to the LLM extractor.
+"""
+
+import asyncio
+import re
+from typing import Any, TypedDict
+from bs4 import BeautifulSoup, Tag
+from langchain_core.language_models import BaseChatModel
+
+from ..config import IndexingConfig
+from .generic_tabular import GenericTabularData
+
+# cells spanning more are assumed to be malformed
+MAX_SPAN = 100
+
+# confidence in headers guessed from a first row of text over numeric rows
+GUESSED_HEADER_CONFIDENCE = 0.6
+
+# e.g. "(1)" or "*" after a title, referring to footnotes
+FOOTNOTE_MARKER = re.compile(r"\s*(\(\d+\)|\[\d+\]|\*+)$")
+
+NUMERIC = re.compile(r"^[-+(]?[$€£%]?\s?[\d.,]+\s?[%)]?$")
+
+
+class ParsedTable(TypedDict):
+    title: str | None
+    headers: list[str]
+    rows: list[list[str]]
+    confidence: float
+
+
+class HtmlTableExtractor:
+    """Extracts the data tables of an HTML page as `GenericTabularData`"""
+
+    MIN_CONFIDENCE = 0.8
+
+    @classmethod
+    def from_content(
+        cls,
+        content_data: str,
+        content_type: str,
+        source_url: str,
+        llm: BaseChatModel | None,
+        indexing: IndexingConfig,
+    ) -> GenericTabularData | None:
+        if content_type != "text/html" or "<table" not in content_data:
+            return None
+
+        soup = BeautifulSoup(content_data, "html.parser")
+        tables = parse_tables(soup)
+        if not tables or min(t["confidence"] for t in tables) < cls.MIN_CONFIDENCE:
+            return None
+
+        page_title = find_page_title(soup)
+        if len(tables) == 1:
+            table = tables[0]
+            return GenericTabularData(
+                title=table["title"] or page_title,
+                source_url=source_url,
+                data=to_records(table),
+            )
+        return GenericTabularData(
+            title=page_title or tables[0]["title"],
+            source_url=source_url,
+            data=[
+                # records of several tables are told apart by the table title
+                {"Table": table["title"], **record} if table["title"] else record
+                for table in tables
+                for record in to_records(table)
+            ],
+        )
+
+    @classmethod
+    async def afrom_content(
+        cls,
+        content_data: str,
+        content_type: str,
+        source_url: str,
+        llm: BaseChatModel | None,
+        indexing: IndexingConfig,
+    ) -> GenericTabularData | None:
+        return await asyncio.to_thread(
+            cls.from_content,
+            content_data=content_data,
+            content_type=content_type,
+            source_url=source_url,
+            llm=llm,
+            indexing=indexing,
+        )
+
+
+def parse_tables(soup: BeautifulSoup) -> list[ParsedTable]:
+    """Data tables of a page, in document order"""
+    tables = []
+    for table in soup.find_all("table"):
+        # a layout table: its nested tables are parsed on their own
+        if table.find("table") is not None:
+            continue
+        parsed = parse_table(table)
+        if parsed is not None:
+            tables.append(parsed)
+    return tables
+
+
+def parse_table(table: Tag) -> ParsedTable | None:
+    """Headers and rows of a table; None if it has less than two columns or no
+    data rows, i.e. is no data table"""
+    grid = to_grid(table.find_all("tr"))
+    if not grid:
+        return None
+    width = max(len(row) for row in grid)
+    if width < 2:
+        return None
+
+    header_rows = count_header_rows(table, grid)
+    header_confidence = 1.0
+    if header_rows == 0 and looks_like_header(grid):
+        header_rows = 1
+        header_confidence = GUESSED_HEADER_CONFIDENCE
+
+    body = [row for row in grid[header_rows:] if any(text for text, _ in row)]
+    if not body:
+        return None
+
+    if header_rows:
+        headers = merge_header_rows(grid[:header_rows], width)
+        confidence = header_confidence
+    else:
+        headers = [""] * width
+        confidence = 0.0
+    # ragged rows: cells may not be under the headers they belong to
+    consistent = sum(len(row) == width for row in body) / len(body)
+
+    return {
+        "title": find_table_title(table),
+        "headers": [h or f"Column {i + 1}" for i, h in enumerate(headers)],
+        "rows": [[text for text, _ in row] + [""] * (width - len(row)) for row in body],
+        "confidence": confidence * consistent,
+    }
+
+
+def to_grid(rows: list[Tag]) -> list[list[tuple[str, bool]]]:
+    """Cells of each row as (text, is header), with spans expanded"""
+    grid: list[list[tuple[str, bool]]] = []
+    # column -> (rows left, cell) spanning down from rows above
+    spanning: dict[int, tuple[int, tuple[str, bool]]] = {}
+
+    for tr in rows:
+        row: list[tuple[str, bool]] = []
+
+        def fill_spanned() -> None:
+            while len(row) in spanning:
+                left, cell = spanning[len(row)]
+                if left > 1:
+                    spanning[len(row)] = (left - 1, cell)
+                else:
+                    del spanning[len(row)]
+                row.append(cell)
+
+        for td in tr.find_all(["td", "th"], recursive=False):
+            fill_spanned()
+            cell = (" ".join(td.get_text(" ").split()), td.name == "th")
+            colspan = parse_span(td.get("colspan"))
+            rowspan = parse_span(td.get("rowspan"))
+            for _ in range(colspan):
+                if rowspan > 1:
+                    spanning[len(row)] = (rowspan - 1, cell)
+                row.append(cell)
+        fill_spanned()
+
+        grid.append(row)
+    return grid
+
+
+def parse_span(value: Any) -> int:
+    try:
+        return min(max(int(value), 1), MAX_SPAN)
+    except (TypeError, ValueError):
+        return 1
+
+
+def count_header_rows(table: Tag, grid: list[list[tuple[str, bool]]]) -> int:
+    thead = table.find("thead")
+    if thead is not None:
+        return len(thead.find_all("tr"))
+    count = 0
+    for row in grid:
+        if not row or not all(is_header for _, is_header in row):
+            break
+        count += 1
+    # all header cells: a table of one-column records, not headers
+    return count if count < len(grid) else 0
+
+
+def looks_like_header(grid: list[list[tuple[str, bool]]]) -> bool:
+    """Whether the first row is all text over rows with numbers"""
+    first, rest = grid[0], grid[1:]
+    return (
+        bool(rest)
+        and all(text and not NUMERIC.match(text) for text, _ in first)
+        and any(NUMERIC.match(text) for row in rest for text, _ in row)
+    )
+
+
+def merge_header_rows(rows: list[list[tuple[str, bool]]], width: int) -> list[str]:
+    """One header per column, joining those of several header rows"""
+    headers = []
+    for column in range(width):
+        parts: list[str] = []
+        for row in rows:
+            text = row[column][0] if column < len(row) else ""
+            # spanning cells repeat in each column they span
+            if text and text not in parts:
+                parts.append(text)
+        headers.append(" ".join(parts))
+    return headers
+
+
+def to_records(table: ParsedTable) -> list[dict[str, Any]]:
+    """One record per row, or per row and group of repeated headers"""
+    headers = table["headers"]
+    group = repeated_group_width(headers)
+    names = unique_names(headers[:group])
+    return [
+        dict(zip(names, cells))
+        for start in range(0, len(headers), group)
+        for row in table["rows"]
+        if any(cells := row[start : start + group])
+    ]
+
+
+def repeated_group_width(headers: list[str]) -> int:
+    """Width of the group of headers that `headers` repeats, e.g. 2 for
+    State, Total, State, Total; the number of headers if none"""
+    for width in range(1, len(headers) // 2 + 1):
+        if len(headers) % width == 0 and headers == headers[:width] * (
+            len(headers) // width
+        ):
+            return width
+    return len(headers)
+
+
+def unique_names(headers: list[str]) -> list[str]:
+    names: list[str] = []
+    for header in headers:
+        name, n = header, 1
+        while name in names:
+            n += 1
+            name = f"{header} {n}"
+        names.append(name)
+    return names
+
+
+def find_table_title(table: Tag) -> str | None:
+    """The table's caption, else the closest preceding text that reads like a
+    title (e.g. not a unit such as "($000)")"""
+    caption = table.find("caption")
+    if caption is not None and caption.get_text(strip=True):
+        return clean_title(caption.get_text(" "))
+    for text in table.find_all_previous(string=True, limit=20):
+        if text.parent is not None and text.parent.name in ("script", "style", "title"):
+            continue
+        title = clean_title(text)
+        if any(c.isalpha() for c in title) and not (
+            title.startswith("(") and title.endswith(")")
+        ):
+            return title
+    return None
+
+
+def find_page_title(soup: BeautifulSoup) -> str | None:
+    for tag in ["title", "h1"]:
+        element = soup.find(tag)
+        if element is not None and element.get_text(strip=True):
+            return clean_title(element.get_text(" "))
+    return None
+
+
+def clean_title(text: str) -> str:
+    return FOOTNOTE_MARKER.sub("", " ".join(text.split()))
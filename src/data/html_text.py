@@ -0,0 +1,125 @@
+"""Extraction of the title and text of HTML documents.
+
+Backends, selected by name (see `HTML_TEXT_BACKENDS`), return the same title
+and text:
+
+- "html_text", the default, reads a document in a single pass of an
+  event-driven parser, `HtmlTextParser`, without building a tree. It can also
+  be fed a document in pieces and its text drained as it goes, so that memory
+  does not grow with the document.
+- "beautifulsoup" builds the document's tree, as `TextualData` used to, and
+  searches it for the title, then the `<h1>`, then the text.
+
+Text is that of BeautifulSoup's `get_text(separator="\\n", strip=True)` (both
+build on `html.parser`), skipping boilerplate: scripts, styles and navigation.
+"""
+
+from html.parser import HTMLParser
+from typing import Callable, TypedDict
+from bs4 import BeautifulSoup
+
+# their content is not text, or not the document's
+SKIPPED_TAGS = frozenset({"script", "style", "template", "nav"})
+
+
+class HtmlText(TypedDict):
+    # the first <title>, else the first <h1>, if it has text
+    title: str | None
+    text: str
+
+
+class HtmlTextParser(HTMLParser):
+    """Collects the stripped text nodes of a document, and the text of its
+    first `<title>` and `<h1>` elements"""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.title: str | None = None
+        self.h1: str | None = None
+        self._texts: list[str] = []
+        # data of the text node being read, which may come in several calls
+        self._pending: list[str] = []
+        self._skipping = 0
+        # text of the <title> or <h1> being read, if any
+        self._capturing: dict[str, list[str]] = {}
+
+    def drain(self) -> list[str]:
+        """Text nodes read since the last call"""
+        texts, self._texts = self._texts, []
+        return texts
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._flush()
+        if tag in SKIPPED_TAGS:
+            self._skipping += 1
+        elif (
+            tag in ("title", "h1") and not self._skipping and getattr(self, tag) is None
+        ):
+            self._capturing.setdefault(tag, [])
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._flush()
+
+    def handle_endtag(self, tag: str) -> None:
+        self._flush()
+        if tag in SKIPPED_TAGS:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self._capturing:
+            # as get_text(strip=True): no separator
+            setattr(self, tag, "".join(self._capturing.pop(tag)))
+
+    def handle_data(self, data: str) -> None:
+        if not self._skipping:
+            self._pending.append(data)
+
+    def handle_comment(self, data: str) -> None:
+        self._flush()
+
+    def handle_decl(self, decl: str) -> None:
+        self._flush()
+
+    def handle_pi(self, data: str) -> None:
+        self._flush()
+
+    def _flush(self) -> None:
+        text = "".join(self._pending).strip()
+        self._pending = []
+        if not text:
+            return
+        self._texts.append(text)
+        for parts in self._capturing.values():
+            parts.append(text)
+
+
+def extract_html_text(content: str) -> HtmlText:
+    parser = HtmlTextParser()
+    parser.feed(content)
+    parser.close()
+    return {
+        "title": parser.title or parser.h1 or None,
+        "text": "\n".join(parser.drain()),
+    }
+
+
+def extract_html_text_with_beautifulsoup(content: str) -> HtmlText:
+    soup = BeautifulSoup(content, "html.parser")
+    for element in soup.find_all(SKIPPED_TAGS):
+        element.decompose()
+
+    title = None
+    for tag in ["title", "h1"]:
+        element = soup.find(tag)
+        if element is not None and element.get_text(strip=True):
+            title = element.get_text(strip=True)
+            break
+    return {"title": title, "text": soup.get_text(separator="\n", strip=True)}
+
+
+HTML_TEXT_BACKENDS: dict[str, Callable[[str], HtmlText]] = {
+    "html_text": extract_html_text,
+    "beautifulsoup": extract_html_text_with_beautifulsoup,
+}
@@ -1,13 +1,18 @@
-from typing import Self
+from typing import ClassVar, Self
 from langchain_core.language_models import BaseChatModel
-from bs4 import BeautifulSoup
 
+from ..config import IndexingConfig
 from .base import IndexableData
+from .html_text import HTML_TEXT_BACKENDS
 
 
 class TextualData(IndexableData):
     data: str
 
+    # name of the backend extracting the title and text of HTML, in
+    # `HTML_TEXT_BACKENDS`
+    HTML_TEXT_BACKEND: ClassVar[str] = "html_text"
+
     @classmethod
     def from_content(
         cls,
@@ -15,33 +20,19 @@ class TextualData(IndexableData):
         content_type: str,
         source_url: str,
         llm: BaseChatModel | None,
+        indexing: IndexingConfig,
     ) -> Self | None:
         if content_type == "text/plain":
             return cls(title=None, data=content_data, source_url=source_url)
         elif content_type == "text/html":
-            soup = BeautifulSoup(content_data, "html.parser")
-
-            # Try to find title in order of preference: <title>, <h1>, URL
-            title_tag = soup.find("title")
-            h1_tag = soup.find("h1")
-
-            if title_tag and title_tag.get_text(strip=True):
-                title = title_tag.get_text(strip=True)
-            elif h1_tag and h1_tag.get_text(strip=True):
-                title = h1_tag.get_text(strip=True)
-            else:
-                title = None
-
-            # Get text content, preserving some structture
-            converted_text = soup.get_text(separator="\n", strip=True)
-
-            return cls(title=title, source_url=source_url, data=converted_text)
+            extracted = HTML_TEXT_BACKENDS[cls.HTML_TEXT_BACKEND](content_data)
+            return cls(
+                title=extracted["title"], source_url=source_url, data=extracted["text"]
+            )
         else:
             return None
 
     def to_text(self) -> str:
-        text = ""
-        if self.title is not None:
-            text += self.title + "\n\n"
-        text += self.data
-        return text
+        if self.title is None:
+            return self.data
+        return f"{self.title}\n\n{self.data}"
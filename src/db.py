@@ -1,8 +1,9 @@
 import uuid
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timezone
 from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
-from sqlalchemy import inspect, DateTime, ForeignKey
+from sqlalchemy import inspect, DateTime, ForeignKey, Insert
+from sqlalchemy.dialects import postgresql, sqlite
 
 
 class SqlAlchemyBase(DeclarativeBase):
@@ -48,9 +49,159 @@ class SqlKnowledgeBaseDocument(SqlAlchemyBase):
         nullable=True,
     )
     topic: Mapped[SqlTopic] = relationship(back_populates="knowledge_documents")
+    sources: Mapped[List["SqlDocumentSource"]] = relationship(
+        back_populates="document", cascade="all, delete-orphan"
+    )
 
     def __repr__(self) -> str:
         return f"SqlKnowledgeBaseDocument(id={self.id}, data={self.data}, content={self.content}"
 
     def to_dict(self):
         return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
+
+
+class SqlDocumentSource(SqlAlchemyBase):
+    """SqlAlchemy model for a URL a stored document was fetched from; URLs with
+    the same content are sources of the same documents"""
+
+    __tablename__ = "document_sources"
+
+    document_id: Mapped[str] = mapped_column(
+        ForeignKey("documents.id"), primary_key=True
+    )
+    url: Mapped[str] = mapped_column(primary_key=True, index=True)
+    # validators of the response, for conditional requests
+    etag: Mapped[Optional[str]] = mapped_column(nullable=True)
+    last_modified: Mapped[Optional[str]] = mapped_column(nullable=True)
+    # of the fetched content, before extraction
+    content_hash: Mapped[str] = mapped_column(nullable=False)
+    fetched_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+    document: Mapped[SqlKnowledgeBaseDocument] = relationship(back_populates="sources")
+
+    def __repr__(self) -> str:
+        return f"SqlDocumentSource(document_id={self.document_id}, url={self.url})"
+
+
+class SqlAnswerGeneration(SqlAlchemyBase):
+    """SqlAlchemy model for the number of times a topic's documents changed,
+    telling processes when their cached answers for the topic are stale"""
+
+    __tablename__ = "answer_generations"
+
+    # "" for documents without a topic
+    topic_key: Mapped[str] = mapped_column(primary_key=True)
+    generation: Mapped[int] = mapped_column(nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        return f"SqlAnswerGeneration(topic_key={self.topic_key}, generation={self.generation})"
+
+
+class SqlCrawl(SqlAlchemyBase):
+    """SqlAlchemy model for a site crawl, kept to resume it"""
+
+    __tablename__ = "crawls"
+
+    id: Mapped[str] = mapped_column(primary_key=True, default=lambda: str(uuid.uuid4()))
+    # JSON list of seed URLs
+    seeds: Mapped[str] = mapped_column(nullable=False)
+    topic_id: Mapped[Optional[str]] = mapped_column(
+        ForeignKey("topics.id"), nullable=True
+    )
+    max_depth: Mapped[int] = mapped_column(nullable=False)
+    max_pages: Mapped[int] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return f"SqlCrawl(id={self.id}, seeds={self.seeds})"
+
+
+class SqlCrawlUrl(SqlAlchemyBase):
+    """SqlAlchemy model for a URL discovered by a crawl"""
+
+    __tablename__ = "crawl_urls"
+
+    crawl_id: Mapped[str] = mapped_column(ForeignKey("crawls.id"), primary_key=True)
+    # normalized
+    url: Mapped[str] = mapped_column(primary_key=True)
+    depth: Mapped[int] = mapped_column(nullable=False)
+    # "pending" until fetched and ingested, or found not to be ingestible
+    status: Mapped[str] = mapped_column(nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"SqlCrawlUrl(url={self.url}, status={self.status})"
+
+
+class SqlJob(SqlAlchemyBase):
+    """SqlAlchemy model for a queued ingestion job"""
+
+    __tablename__ = "jobs"
+
+    id: Mapped[str] = mapped_column(primary_key=True, default=lambda: str(uuid.uuid4()))
+    # JSON arguments: URLs and topic id
+    payload: Mapped[str] = mapped_column(nullable=False)
+    # queued, running, succeeded or failed
+    status: Mapped[str] = mapped_column(nullable=False, index=True)
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(nullable=False)
+    # not claimed before: when queued, the time of a retry; when running, the
+    # end of the claiming worker's lease
+    available_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+    claimed_by: Mapped[Optional[str]] = mapped_column(nullable=True)
+    # JSON report of the last attempt
+    result: Mapped[Optional[str]] = mapped_column(nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return f"SqlJob(id={self.id}, status={self.status})"
+
+
+def insert_or_ignore(dialect_name: str, model: type[SqlAlchemyBase]) -> Insert:
+    """INSERT statement that skips rows whose primary key is already stored"""
+    if dialect_name == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing()
+    elif dialect_name == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing()
+    else:
+        raise Exception(f"Not implemented: insert-or-ignore for {dialect_name}")
+
+
+def insert_or_update(
+    dialect_name: str, model: type[SqlAlchemyBase], update_columns: list[str]
+) -> Insert:
+    """INSERT statement that updates `update_columns` of rows whose primary key
+    is already stored"""
+    primary_key = list(model.__table__.primary_key.columns)
+    if dialect_name == "postgresql":
+        pg_insert = postgresql.insert(model)
+        return pg_insert.on_conflict_do_update(
+            index_elements=primary_key,
+            set_={c: pg_insert.excluded[c] for c in update_columns},
+        )
+    elif dialect_name == "sqlite":
+        sqlite_insert = sqlite.insert(model)
+        return sqlite_insert.on_conflict_do_update(
+            index_elements=primary_key,
+            set_={c: sqlite_insert.excluded[c] for c in update_columns},
+        )
+    else:
+        raise Exception(f"Not implemented: insert-or-update for {dialect_name}")
@@ -0,0 +1,260 @@
+"""Content-addressed cache of text embeddings.
+
+Identical texts recur across documents (navigation boilerplate, repeated
+table headers) and across re-ingestions with the same chunking settings;
+`CachedEmbeddings` embeds each distinct text once per embedding model.
+Vectors are kept in a size-bounded in-memory LRU, in front of an optional
+SQLite file shared by processes (e.g. batch ingestion workers) and runs.
+"""
+
+import array
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, TypedDict
+from langchain_core.embeddings import Embeddings
+
+from . import metrics
+
+# bound on the number of host parameters in a single sqlite statement
+SQLITE_BATCH_SIZE = 500
+
+
+class EmbeddingCacheStats(TypedDict):
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    hit_rate: float
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings served from cache when the same model embedded the same text before.
+
+    Counted in `metrics` as `cache.embeddings.memory_hits`, `.disk_hits` and
+    `.misses`, one per text.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_identity: str,
+        path: str | None = None,
+        max_entries: int = 1_000_000,
+        memory_maxsize: int = 10_000,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model_identity = model_identity
+        self.memory_maxsize = memory_maxsize
+        self._lock = threading.Lock()
+        # text hash -> vector, least recently used first
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._disk = (
+            None
+            if path is None
+            else SqliteVectorStore(path, model_identity, max_entries)
+        )
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(text) for text in texts]
+        found, missing = self._lookup(hashes, texts)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            found.update(self._store(list(missing), vectors))
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(text) for text in texts]
+        found, missing = await asyncio.to_thread(self._lookup, hashes, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            found.update(await asyncio.to_thread(self._store, list(missing), vectors))
+        return [found[h] for h in hashes]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> EmbeddingCacheStats:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        return {
+            "memory_hits": stats["memory_hits"],
+            "disk_hits": stats["disk_hits"],
+            "misses": stats["misses"],
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    def _lookup(
+        self, hashes: list[str], texts: list[str]
+    ) -> tuple[dict[str, list[float]], dict[str, str]]:
+        """Cached vectors by hash, and texts to embed by hash"""
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            for h in hashes:
+                if h in self._memory:
+                    self._memory.move_to_end(h)
+                    found[h] = self._memory[h]
+        memory_hits = sum(h in found for h in hashes)
+
+        on_disk: dict[str, list[float]] = {}
+        if self._disk is not None:
+            on_disk = self._disk.get_many({h for h in hashes if h not in found})
+            self._remember(on_disk)
+            found.update(on_disk)
+        disk_hits = sum(h in on_disk for h in hashes)
+
+        missing = {h: text for h, text in zip(hashes, texts) if h not in found}
+        self._count(memory_hits, disk_hits, len(hashes) - memory_hits - disk_hits)
+        return found, missing
+
+    def _store(
+        self, hashes: list[str], vectors: list[list[float]]
+    ) -> dict[str, list[float]]:
+        computed = dict(zip(hashes, vectors))
+        self._remember(computed)
+        if self._disk is not None:
+            self._disk.put_many(computed)
+        return computed
+
+    def _remember(self, vectors: dict[str, list[float]]) -> None:
+        with self._lock:
+            for h, vector in vectors.items():
+                self._memory[h] = vector
+                self._memory.move_to_end(h)
+            while len(self._memory) > self.memory_maxsize:
+                self._memory.popitem(last=False)
+
+    def _count(self, memory_hits: int, disk_hits: int, misses: int) -> None:
+        with self._lock:
+            self._stats["memory_hits"] += memory_hits
+            self._stats["disk_hits"] += disk_hits
+            self._stats["misses"] += misses
+        for name, value in [
+            ("memory_hits", memory_hits),
+            ("disk_hits", disk_hits),
+            ("misses", misses),
+        ]:
+            if value:
+                metrics.increment(f"cache.embeddings.{name}", value)
+
+
+class SqliteVectorStore:
+    """Vectors of one model by text hash, in a SQLite file holding at most
+    `max_entries` vectors across models; least recently used ones go first."""
+
+    # how many insertions may go by between checks of the size bound
+    EVICTION_INTERVAL = 1000
+
+    def __init__(self, path: str, model_identity: str, max_entries: int) -> None:
+        self.model_identity = model_identity
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        # readers do not block the writer, e.g. of another ingestion worker
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " used_at REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash)"
+            ") WITHOUT ROWID"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_used_at ON embeddings (used_at)"
+        )
+        self._inserted_since_eviction = self.EVICTION_INTERVAL
+
+    def get_many(self, hashes: Iterable[str]) -> dict[str, list[float]]:
+        found: dict[str, list[float]] = {}
+        with self._lock:
+            for batch in batched(list(hashes), SQLITE_BATCH_SIZE):
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    "SELECT text_hash, vector FROM embeddings"
+                    f" WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_identity, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = decode_vector(blob)
+                if rows:
+                    self._connection.execute(
+                        "UPDATE embeddings SET used_at = ?"
+                        f" WHERE model = ? AND text_hash IN ({placeholders})",
+                        [time.time(), self.model_identity, *batch],
+                    )
+        return found
+
+    def put_many(self, vectors: dict[str, list[float]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, used_at)"
+                " VALUES (?, ?, ?, ?)",
+                [
+                    (self.model_identity, h, encode_vector(vector), now)
+                    for h, vector in vectors.items()
+                ],
+            )
+            self._inserted_since_eviction += len(vectors)
+            if self._inserted_since_eviction >= self.EVICTION_INTERVAL:
+                self._evict()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self) -> None:
+        self._inserted_since_eviction = 0
+        (count,) = self._connection.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()
+        if count <= self.max_entries:
+            return
+        # make room for the next interval's insertions too
+        excess = (
+            count - self.max_entries + min(self.EVICTION_INTERVAL, self.max_entries)
+        )
+        self._connection.execute(
+            "DELETE FROM embeddings WHERE (model, text_hash) IN ("
+            " SELECT model, text_hash FROM embeddings ORDER BY used_at LIMIT ?"
+            ")",
+            [excess],
+        )
+        metrics.increment("cache.embeddings.evictions", excess)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_vector(vector: list[float]) -> bytes:
+    # double precision: cached vectors are identical to freshly computed ones
+    return array.array("d", vector).tobytes()
+
+
+def decode_vector(blob: bytes) -> list[float]:
+    vector = array.array("d")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def batched(items: list[str], size: int) -> Iterable[list[str]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
@@ -0,0 +1,345 @@
+"""Pooled HTTP fetching of source content.
+
+One `Fetcher` per configuration is shared by the process (see `get_fetcher`),
+so that connections to a host are reused across documents rather than opened
+once per request. On top of the connection pool it adds:
+
+- at most `fetching.max_connections_per_host` concurrent requests per host;
+- connect and read timeouts;
+- retries with exponential backoff of connection errors, timeouts and
+  transient statuses (429, 5xx gateway errors), honoring Retry-After;
+- streamed downloads, abandoned past `fetching.max_content_size` bytes;
+- decoding by the declared charset, else the one in an HTML `<meta>` tag,
+  else a detected one.
+
+`file://` and `data:` URIs are read directly.
+"""
+
+import asyncio
+import codecs
+import logging
+import random
+import re
+import threading
+import time
+from email.message import Message
+from email.utils import parsedate_to_datetime
+from typing import Iterable
+from urllib.parse import urlparse
+
+import httpx
+from charset_normalizer import from_bytes
+
+from . import metrics, services
+from .config import Config, FetchingConfig
+from .util import FetchResult, read_data_uri, read_file, validate_content_type
+
+logger = logging.getLogger()
+
+RETRIED_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+META_CHARSET = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_-]+)""", re.I
+)
+
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+class ContentTooLargeError(ValueError):
+    def __init__(self, url: str, max_size: int) -> None:
+        super().__init__(f"Content of {url} exceeds {max_size} bytes")
+
+
+class Fetcher:
+    """Fetches URIs through pooled, per-host limited HTTP clients.
+
+    Blocking and async callers get distinct clients; the async one is bound to
+    the event loop it was first used from, and replaced when used from
+    another. Requests are counted in `metrics` as `fetch.requests`,
+    `fetch.retries`, `fetch.errors`, `fetch.not_modified` and `fetch.bytes`.
+    """
+
+    def __init__(self, config: FetchingConfig) -> None:
+        self.config = config
+        self._lock = threading.Lock()
+        self._client = httpx.Client(**self._client_options())
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._async_client: httpx.AsyncClient | None = None
+        self._async_host_slots: dict[str, asyncio.Semaphore] = {}
+
+    def fetch(self, uri: str) -> FetchResult:
+        parsed = urlparse(uri)
+        if parsed.scheme not in ("http", "https"):
+            return read_local(uri)
+
+        for attempt in range(self.config.max_retries + 1):
+            with self._host_slot(parsed.netloc):
+                try:
+                    metrics.increment("fetch.requests")
+                    with self._client.stream("GET", uri) as response:
+                        if not self._should_retry(response.status_code, attempt):
+                            response.raise_for_status()
+                            body = self._read(uri, response, response.iter_bytes())
+                            return to_fetch_result(response, body)
+                        delay = self._retry_delay(attempt, response)
+                except httpx.TransportError as e:
+                    if attempt == self.config.max_retries:
+                        metrics.increment("fetch.errors")
+                        raise
+                    logger.debug(f"Retrying {uri} after {e!r}")
+                    delay = self._retry_delay(attempt, None)
+            metrics.increment("fetch.retries")
+            time.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    async def afetch(self, uri: str, follow_redirects: bool = True) -> FetchResult:
+        """Fetch `uri`; unless `follow_redirects`, a redirect is raised as an
+        `httpx.HTTPStatusError` whose response has the `Location` header."""
+        parsed = urlparse(uri)
+        if parsed.scheme not in ("http", "https"):
+            return await asyncio.to_thread(read_local, uri)
+        received = await self._aget(uri, {}, follow_redirects)
+        assert received is not None
+        return to_fetch_result(*received)
+
+    async def afetch_if_modified(
+        self, uri: str, etag: str | None, last_modified: str | None
+    ) -> FetchResult | None:
+        """Fetch `uri` unless the server confirms that the content identified by
+        the validators of a previous response is current, then return None."""
+        headers = {}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+        received = await self._aget(uri, headers)
+        return None if received is None else to_fetch_result(*received)
+
+    async def afetch_bytes(self, uri: str) -> bytes:
+        """Fetch an HTTP resource of any content type, e.g. a sitemap"""
+        received = await self._aget(uri, {})
+        assert received is not None
+        return received[1]
+
+    async def _aget(
+        self, uri: str, headers: dict[str, str], follow_redirects: bool = True
+    ) -> tuple[httpx.Response, bytes] | None:
+        """Response and body; None if not modified"""
+        client = self._bind()
+        for attempt in range(self.config.max_retries + 1):
+            async with self._async_host_slot(urlparse(uri).netloc):
+                try:
+                    metrics.increment("fetch.requests")
+                    async with client.stream(
+                        "GET", uri, headers=headers, follow_redirects=follow_redirects
+                    ) as response:
+                        if response.status_code == 304:
+                            metrics.increment("fetch.not_modified")
+                            return None
+                        if not self._should_retry(response.status_code, attempt):
+                            response.raise_for_status()
+                            body = await self._aread(
+                                uri, response, response.aiter_bytes()
+                            )
+                            return response, body
+                        delay = self._retry_delay(attempt, response)
+                except httpx.TransportError as e:
+                    if attempt == self.config.max_retries:
+                        metrics.increment("fetch.errors")
+                        raise
+                    logger.debug(f"Retrying {uri} after {e!r}")
+                    delay = self._retry_delay(attempt, None)
+            metrics.increment("fetch.retries")
+            await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    async def afetch_many(
+        self, uris: Iterable[str], concurrency: int = 32
+    ) -> list[FetchResult | Exception]:
+        """Fetch `uris` concurrently, within the per-host limits.
+
+        Results are in the order of `uris`; a failed fetch is represented by
+        its exception.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_one(uri: str) -> FetchResult:
+            async with semaphore:
+                return await self.afetch(uri)
+
+        results = await asyncio.gather(
+            *(fetch_one(uri) for uri in uris), return_exceptions=True
+        )
+        for result in results:
+            # e.g. cancellation: not a failure of the fetch
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        return results  # type: ignore[return-value]
+
+    def close(self) -> None:
+        self._client.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        if self._async_client is not None and self._loop is asyncio.get_running_loop():
+            await self._async_client.aclose()
+        self._async_client = None
+
+    def _client_options(self) -> dict:
+        return {
+            "timeout": httpx.Timeout(
+                self.config.read_timeout, connect=self.config.connect_timeout
+            ),
+            "limits": httpx.Limits(max_connections=self.config.max_connections),
+            "headers": {"User-Agent": self.config.user_agent},
+            "follow_redirects": True,
+        }
+
+    def _bind(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or loop is not self._loop:
+            # connections of a client cannot be used from another loop; those
+            # of a previous loop went away with it
+            self._loop = loop
+            self._async_client = httpx.AsyncClient(**self._client_options())
+            self._async_host_slots = {}
+        return self._async_client
+
+    def _host_slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.config.max_connections_per_host)
+                self._host_slots[host] = slot
+        return slot
+
+    def _async_host_slot(self, host: str) -> asyncio.Semaphore:
+        slot = self._async_host_slots.get(host)
+        if slot is None:
+            slot = asyncio.Semaphore(self.config.max_connections_per_host)
+            self._async_host_slots[host] = slot
+        return slot
+
+    def _should_retry(self, status_code: int, attempt: int) -> bool:
+        return status_code in RETRIED_STATUSES and attempt < self.config.max_retries
+
+    def _retry_delay(self, attempt: int, response: httpx.Response | None) -> float:
+        delay = self.config.retry_backoff * 2**attempt
+        # spreads out retries of requests that failed together
+        delay *= random.uniform(0.5, 1.0)
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("retry-after"))
+            if retry_after is not None:
+                delay = retry_after
+        return min(delay, self.config.max_retry_backoff)
+
+    def _read(
+        self, uri: str, response: httpx.Response, chunks: Iterable[bytes]
+    ) -> bytes:
+        self._check_declared_size(uri, response)
+        body = bytearray()
+        for chunk in chunks:
+            body += chunk
+            if len(body) > self.config.max_content_size:
+                raise ContentTooLargeError(uri, self.config.max_content_size)
+        metrics.increment("fetch.bytes", len(body))
+        return bytes(body)
+
+    async def _aread(self, uri: str, response: httpx.Response, chunks) -> bytes:
+        self._check_declared_size(uri, response)
+        body = bytearray()
+        async for chunk in chunks:
+            body += chunk
+            if len(body) > self.config.max_content_size:
+                raise ContentTooLargeError(uri, self.config.max_content_size)
+        metrics.increment("fetch.bytes", len(body))
+        return bytes(body)
+
+    def _check_declared_size(self, uri: str, response: httpx.Response) -> None:
+        content_length = response.headers.get("content-length")
+        if content_length is not None and content_length.isdigit():
+            if int(content_length) > self.config.max_content_size:
+                raise ContentTooLargeError(uri, self.config.max_content_size)
+
+
+def get_fetcher(config: Config) -> Fetcher:
+    return services.registry.get_or_create(
+        "fetcher",
+        config.fetching.model_dump_json(),
+        lambda: Fetcher(config.fetching),
+        close=lambda fetcher: fetcher.aclose(),
+    )
+
+
+def read_local(uri: str) -> FetchResult:
+    parsed = urlparse(uri)
+    if not parsed.scheme or parsed.scheme == "file":
+        return read_file(parsed.path)
+    if parsed.scheme == "data":
+        return read_data_uri(uri)
+    raise ValueError(f"Unsupported source type: {parsed.scheme}")
+
+
+def to_fetch_result(response: httpx.Response, body: bytes) -> FetchResult:
+    media_type, charset = parse_content_type(response.headers.get("content-type", ""))
+    type = validate_content_type(media_type)
+    result: FetchResult = {"data": decode(body, charset, type), "type": type}
+    if "etag" in response.headers:
+        result["etag"] = response.headers["etag"]
+    if "last-modified" in response.headers:
+        result["last_modified"] = response.headers["last-modified"]
+    return result
+
+
+def parse_content_type(header: str) -> tuple[str, str | None]:
+    """Media type and charset parameter of a Content-Type header"""
+    message = Message()
+    message["content-type"] = header
+    charset = message.get_param("charset")
+    return message.get_content_type(), charset if isinstance(charset, str) else None
+
+
+def decode(body: bytes, charset: str | None, type: str) -> str:
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return body.decode(encoding, errors="replace")
+
+    candidates = [charset]
+    if type == "text/html":
+        match = META_CHARSET.search(body[:4096])
+        candidates.append(match.group(1).decode("ascii") if match else None)
+    for candidate in candidates:
+        if candidate is not None and is_known_encoding(candidate):
+            return body.decode(candidate, errors="replace")
+
+    best = from_bytes(body).best()
+    return str(best) if best is not None else body.decode("utf-8", errors="replace")
+
+
+def is_known_encoding(encoding: str) -> bool:
+    try:
+        codecs.lookup(encoding)
+        return True
+    except LookupError:
+        return False
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait per a Retry-After header, in seconds or as an HTTP date"""
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
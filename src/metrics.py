@@ -0,0 +1,55 @@
+"""Minimal in-process metrics: counters and latency summaries.
+
+Values live in process memory and are exposed as JSON through the
+/metrics endpoint; a scraper or log shipper can take it from there.
+"""
+
+import threading
+from typing import TypedDict
+
+
+class Summary(TypedDict):
+    count: int
+    sum: float
+    max: float
+
+
+class Snapshot(TypedDict):
+    counters: dict[str, int]
+    summaries: dict[str, Summary]
+
+
+_lock = threading.Lock()
+_counters: dict[str, int] = {}
+_summaries: dict[str, Summary] = {}
+
+
+def increment(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample (e.g. a latency in seconds) for a summary"""
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            _summaries[name] = {"count": 1, "sum": value, "max": value}
+        else:
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+
+def snapshot() -> Snapshot:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "summaries": {name: Summary(**s) for name, s in _summaries.items()},
+        }
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _summaries.clear()
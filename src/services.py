@@ -1,25 +1,143 @@
+import asyncio
+import copy
+import inspect
 import logging
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Awaitable, Callable, TypeVar
 from chromadb.utils.embedding_functions import (
     DefaultEmbeddingFunction as ChromaDefaultEmbeddingFunction,
 )
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Engine, create_engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from langchain_openai import ChatOpenAI
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from chromadb.api.types import EmbeddingFunction
 from langchain_chroma import Chroma
-from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain.vectorstores import VectorStore
 from langchain_core.language_models.chat_models import BaseChatModel
 from pydantic import SecretStr
 from pyowm import OWM  # type: ignore[import-untyped]
+from pyowm.utils.config import get_default_config  # type: ignore[import-untyped]
 from .config import Config
+from .embedding_cache import CachedEmbeddings
 
 logger = logging.getLogger()
 
+T = TypeVar("T")
+
+
+class ServiceRegistry:
+    """Process-wide store of long-lived service instances.
+
+    Instances are keyed by kind and by the serialized slice of configuration
+    they depend on, so runnables keep obtaining their dependencies from the
+    configuration object while distinct configurations (e.g. per-test
+    databases) still get distinct instances.
+    """
+
+    def __init__(self) -> None:
+        # reentrant because factories may request other services
+        self._lock = threading.RLock()
+        self._instances: dict[tuple[str, str], Any] = {}
+        self._finalizers: list[Callable[[], None | Awaitable[None]]] = []
+
+    def get_or_create(
+        self,
+        kind: str,
+        key: str,
+        factory: Callable[[], T],
+        close: Callable[[T], None | Awaitable[None]] | None = None,
+    ) -> T:
+        instance = self._instances.get((kind, key))
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            instance = self._instances.get((kind, key))
+            if instance is None:
+                instance = factory()
+                self._instances[(kind, key)] = instance
+                if close is not None:
+                    self._finalizers.append(lambda: close(instance))
+            return instance
+
+    def shutdown(self) -> None:
+        """Release all instances. Subsequent requests create fresh ones."""
+        for finalize in self._drain():
+            try:
+                result = finalize()
+                if inspect.iscoroutine(result):
+                    asyncio.run(result)
+            except Exception:
+                logger.exception("Error while shutting down service")
+
+    async def ashutdown(self) -> None:
+        """Release all instances from within a running event loop."""
+        for finalize in self._drain():
+            try:
+                result = finalize()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Error while shutting down service")
+
+    def _drain(self) -> list[Callable[[], None | Awaitable[None]]]:
+        with self._lock:
+            finalizers = self._finalizers
+            self._instances = {}
+            self._finalizers = []
+        return list(reversed(finalizers))
+
+
+registry = ServiceRegistry()
+
+
+def shutdown() -> None:
+    """Dispose of pooled services, e.g. on application exit or between tests."""
+    registry.shutdown()
+
+
+async def ashutdown() -> None:
+    await registry.ashutdown()
+
 
 def get_db(config: Config) -> Engine:
-    return create_engine(config.db.url)
+    return registry.get_or_create(
+        "db",
+        config.db.model_dump_json(),
+        lambda: create_engine(config.db.url, pool_pre_ping=True),
+        close=lambda engine: engine.dispose(),
+    )
+
+
+def get_async_db(config: Config) -> AsyncEngine:
+    return registry.get_or_create(
+        "async_db",
+        config.db.model_dump_json(),
+        lambda: create_async_engine(to_async_db_url(config.db.url), pool_pre_ping=True),
+        close=lambda engine: engine.dispose(),
+    )
+
+
+ASYNC_DB_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+}
+
+
+def to_async_db_url(url: str) -> str:
+    """Map a database URL to the equivalent one using an asyncio driver"""
+    parsed = make_url(url)
+    async_driver = ASYNC_DB_DRIVERS.get(parsed.drivername)
+    if async_driver is None:
+        return url
+    return parsed.set(drivername=async_driver).render_as_string(hide_password=False)
 
 
 def get_logger(config: Config) -> logging.Logger:
@@ -27,35 +145,100 @@ def get_logger(config: Config) -> logging.Logger:
 
 
 def get_weather_client(config: Config) -> OWM:
-    return OWM(config.weather.api_key)
+    return registry.get_or_create(
+        "weather",
+        config.weather.model_dump_json(),
+        lambda: _create_weather_client(config),
+    )
+
+
+def _create_weather_client(config: Config) -> OWM:
+    owm_config = copy.deepcopy(get_default_config())
+    connection = owm_config["connection"]
+    # pyowm applies the timeout to each connect and read; the overall wait
+    # is bounded by the weather service deadline
+    connection["timeout_secs"] = config.weather.deadline
+    connection["use_ssl"] = config.weather.use_ssl
+    if config.weather.proxy is not None:
+        connection["use_proxy"] = True
+        owm_config["proxies"] = {
+            "http": config.weather.proxy,
+            "https": config.weather.proxy,
+        }
+    return OWM(config.weather.api_key, owm_config)
 
 
 def get_llm(config: Config) -> BaseChatModel:
+    return registry.get_or_create(
+        "llm", config.llm.model_dump_json(), lambda: _create_llm(config)
+    )
+
+
+def _create_llm(config: Config) -> BaseChatModel:
     if config.llm.type == "openai":
         return ChatOpenAI(model=config.llm.model)
     else:
         raise Exception(f"Unsupported LLM backend: {config.llm.type}")
 
 
+def embeddings_key(config: Config) -> str:
+    """Registry key of the embeddings: their model and how they are cached"""
+    return config.embeddings.model_dump_json() + config.caching.model_dump_json(
+        include={"embedding_memory_maxsize", "embedding_path", "embedding_max_entries"}
+    )
+
+
+def get_embeddings(config: Config) -> Embeddings:
+    return registry.get_or_create(
+        "embeddings",
+        embeddings_key(config),
+        lambda: _create_cached_embeddings(config),
+        close=lambda embeddings: (
+            embeddings.close() if isinstance(embeddings, CachedEmbeddings) else None
+        ),
+    )
+
+
+def _create_cached_embeddings(config: Config) -> Embeddings:
+    embeddings, model_identity = _create_embeddings(config)
+    return CachedEmbeddings(
+        embeddings,
+        model_identity,
+        path=config.caching.embedding_path,
+        max_entries=config.caching.embedding_max_entries,
+        memory_maxsize=config.caching.embedding_memory_maxsize,
+    )
+
+
+def _create_embeddings(config: Config) -> tuple[Embeddings, str]:
+    """The embeddings, and an identity of the model for cache keys"""
+    if config.embeddings.type == "chroma-internal":
+        default_chroma_embedding_function = ChromaDefaultEmbeddingFunction()
+        assert default_chroma_embedding_function is not None
+        return (
+            ChromaEmbeddingsAdapter(default_chroma_embedding_function),
+            f"chroma/{default_chroma_embedding_function.name()}",
+        )
+    elif config.embeddings.type == "openai":
+        embeddings = OpenAIEmbeddings(api_key=SecretStr(config.embeddings.api_key))
+        return embeddings, f"openai/{embeddings.model}/{embeddings.dimensions}"
+    else:
+        raise Exception(f"Unknown embedding type: {config.embeddings.type}")
+
+
 def get_vector_store(config: Config) -> VectorStore:
-    if config.vector_store.type == "chroma":
-        embedding_function: ChromaEmbeddingsAdapter | OpenAIEmbeddings
-        if config.embeddings.type == "chroma-internal":
-            default_chroma_embedding_function = ChromaDefaultEmbeddingFunction()
-            assert default_chroma_embedding_function is not None
-            embedding_function = ChromaEmbeddingsAdapter(
-                default_chroma_embedding_function
-            )
-        elif config.embeddings.type == "openai":
-            embedding_function = OpenAIEmbeddings(
-                api_key=SecretStr(config.embeddings.api_key)
-            )
-        else:
-            raise Exception(f"Unknown embedding type: {config.vector_store.type}")
+    return registry.get_or_create(
+        "vector_store",
+        config.vector_store.model_dump_json() + embeddings_key(config),
+        lambda: _create_vector_store(config),
+    )
+
 
+def _create_vector_store(config: Config) -> VectorStore:
+    if config.vector_store.type == "chroma":
         return Chroma(
             collection_name=config.vector_store.collection_name,
-            embedding_function=embedding_function,
+            embedding_function=get_embeddings(config),
             persist_directory=config.vector_store.path,
             # Prevents negative scores and consequent UserWarning. See https://github.com/langchain-ai/langchain/issues/10864
             collection_metadata={"hnsw:space": "cosine"},
@@ -64,6 +247,74 @@ def get_vector_store(config: Config) -> VectorStore:
         raise Exception(f"Not implemented: {config.vector_store.type}")
 
 
+def add_embedded_documents(
+    vector_store: VectorStore, documents: list[Document], embeddings: list[list[float]]
+) -> None:
+    """Add documents whose embeddings were already computed, e.g. in another process"""
+    if not documents:
+        return
+    if isinstance(vector_store, Chroma):
+        vector_store._collection.upsert(
+            ids=[document.id or str(uuid.uuid4()) for document in documents],
+            embeddings=embeddings,  # type: ignore[arg-type]
+            documents=[document.page_content for document in documents],
+            metadatas=[document.metadata for document in documents],
+        )
+    else:
+        # no generic interface for precomputed embeddings: embed again
+        vector_store.add_documents(documents)
+
+
+def delete_document_chunks(vector_store: VectorStore, document_ids: list[str]) -> None:
+    """Delete the chunks of stored documents, however many there are"""
+    if not document_ids:
+        return
+    if isinstance(vector_store, Chroma):
+        vector_store._collection.delete(where={"source_id": {"$in": document_ids}})
+    else:
+        raise Exception(
+            f"Not implemented: deleting chunks from {vector_store.__class__.__name__}"
+        )
+
+
+def delete_topic_chunks(vector_store: VectorStore, topic_id: str) -> None:
+    """Delete the chunks of a topic's documents, however many there are"""
+    if isinstance(vector_store, Chroma):
+        vector_store._collection.delete(where={"topic_id": topic_id})
+    else:
+        raise Exception(
+            f"Not implemented: deleting chunks from {vector_store.__class__.__name__}"
+        )
+
+
+def vector_store_size(config: Config) -> int:
+    """Bytes taken on disk by the vector store"""
+    if config.vector_store.type == "chroma":
+        return sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, names in os.walk(config.vector_store.path)
+            for name in names
+        )
+    else:
+        raise Exception(f"Not implemented: size of {config.vector_store.type}")
+
+
+def compact_vector_store(config: Config) -> None:
+    """Give back to the file system the space freed by deleted chunks"""
+    if config.vector_store.type == "chroma":
+        # Chroma keeps its records in SQLite, whose deleted pages are only
+        # reused, not released, until the database is vacuumed
+        path = os.path.join(config.vector_store.path, "chroma.sqlite3")
+        if os.path.exists(path):
+            connection = sqlite3.connect(path)
+            try:
+                connection.execute("VACUUM")
+            finally:
+                connection.close()
+    else:
+        raise Exception(f"Not implemented: compacting {config.vector_store.type}")
+
+
 # https://cookbook.chromadb.dev/integrations/langchain/embeddings/#custom-adapter
 class ChromaEmbeddingsAdapter(Embeddings):
     def __init__(self, ef: EmbeddingFunction):
@@ -16,6 +16,8 @@ class Settings(BaseSettings):
     openweathermap_api_key: SecretStr
     db_url: SecretStr
     chroma_db_path: str
+    embedding_cache_path: str | None = None
+    ingest_checkpoint_path: str | None = None
     log_level: Literal["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"] = (
         "INFO"
     )
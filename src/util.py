@@ -1,56 +1,57 @@
-from typing import TypedDict, Literal
-import requests
+from typing import NotRequired, TypedDict, Literal
 from data_uri_parser import DataURI  # type: ignore[import-untyped]
-from urllib.parse import urlparse
 
 
 class FetchResult(TypedDict):
     data: str
     type: Literal["text/plain", "text/html"]
+    # validators of HTTP responses, if sent
+    etag: NotRequired[str]
+    last_modified: NotRequired[str]
 
 
-def fetch_content(uri: str) -> FetchResult:
+def read_file(path: str) -> FetchResult:
     """
-    Fetch HTML content from various sources: local file, HTTP URL, or data URL.
+    Read content from a local file, sniffing its format.
 
     Args:
-        source_url: file URL, HTTP URL, or data URL containing HTML content
+        path: path of the file
 
     Returns:
-        HTML content as string
+        File content and type
+    """
+    with open(path, "r") as file:
+        data = file.read()
+        type = sniff_text_format(data)
+        return {"data": data, "type": type}
+
+
+def read_data_uri(uri: str) -> FetchResult:
+    """
+    Read content embedded in a data URL.
+
+    Args:
+        uri: data URL
+
+    Returns:
+        Embedded content and type
 
     Raises:
-        ValueError: If the source type is not supported or content cannot be retrieved
+        ValueError: If the content type is not supported
     """
-    parsed = urlparse(str(uri))
-
-    if not parsed.scheme or parsed.scheme == "file":
-        with open(parsed.path, "r") as file:
-            data = file.read()
-            type = sniff_text_format(data)
-            return {"data": data, "type": type}
-
-    if parsed.scheme in ["http", "https"]:
-        response = requests.get(str(uri))
-        response.raise_for_status()
-        data = response.text
-        type = validate_content_type(
-            response.headers.get("content-type", "").lower().split(";")[0]
-        )
-        return {"data": data, "type": type}
+    parsed_uri = DataURI(uri)
+    assert parsed_uri.mimetype is not None
+    type = validate_content_type(parsed_uri.mimetype)
+    data = (
+        parsed_uri.data.decode("utf-8")
+        if isinstance(parsed_uri.data, bytes)
+        else parsed_uri.data
+    )
+    return {"data": data, "type": type}
 
-    if parsed.scheme == "data":
-        parsed_uri = DataURI(uri)
-        assert parsed_uri.mimetype is not None
-        type = validate_content_type(parsed_uri.mimetype)
-        data = (
-            parsed_uri.data.decode("utf-8")
-            if isinstance(parsed_uri.data, bytes)
-            else parsed_uri.data
-        )
-        return {"data": data, "type": type}
 
-    raise ValueError(f"Unsupported source type: {parsed.scheme}")
+# length of the start of a text in which HTML is looked for
+SNIFF_LENGTH = 64 * 1024
 
 
 def sniff_text_format(content: str) -> Literal["text/plain", "text/html"]:
@@ -66,7 +67,8 @@ def sniff_text_format(content: str) -> Literal["text/plain", "text/html"]:
 
     html_indicators = ["<html", "<!doctype html", "<body"]
 
-    content_lower = content.lower()
+    # only the start: a document is not copied whole
+    content_lower = content[:SNIFF_LENGTH].lower()
     for indicator in html_indicators:
         if indicator in content_lower:
             return "text/html"
@@ -0,0 +1,197 @@
+"""Cached access to the weather service.
+
+Current conditions change slowly compared to how often the same locations
+are asked about, so observations are cached per location:
+
+- younger than `cache_ttl`, an observation is served as is;
+- younger than `stale_ttl`, it is served immediately while a refresh runs in
+  the background (stale-while-revalidate);
+- otherwise the caller waits, at most `deadline` seconds, for a fresh one and
+  falls back to whatever is cached if the service is slow or failing.
+
+Concurrent requests for the same location share a single upstream call.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, TypedDict
+
+from . import metrics, services
+from .config import Config
+
+logger = logging.getLogger()
+
+
+class WeatherReport(TypedDict):
+    location: str
+    temperature: float
+    feels_like: float
+    humidity: int
+    detailed_status: str
+
+
+class WeatherService:
+    """Per-location cache in front of a blocking `fetch` function.
+
+    Upstream calls run on a private thread pool so that callers can stop
+    waiting at the deadline without abandoning a call other callers (or the
+    cache) may still benefit from. Outcomes are counted in `metrics` under
+    `weather.*`.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], WeatherReport],
+        cache_ttl: float,
+        stale_ttl: float,
+        deadline: float,
+        maxsize: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+        max_workers: int = 8,
+    ) -> None:
+        self._fetch = fetch
+        self.cache_ttl = cache_ttl
+        self.stale_ttl = stale_ttl
+        self.deadline = deadline
+        self.maxsize = maxsize
+        self._clock = clock
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="weather"
+        )
+        self._lock = threading.Lock()
+        # location key -> (fetched_at, report), least recently used first
+        self._entries: OrderedDict[str, tuple[float, WeatherReport]] = OrderedDict()
+        self._in_flight: dict[str, concurrent.futures.Future[WeatherReport]] = {}
+
+    def get(self, location: str) -> WeatherReport:
+        cached, future = self._lookup(location)
+        if future is None:
+            assert cached is not None
+            return cached
+        try:
+            return future.result(timeout=self.deadline)
+        except concurrent.futures.TimeoutError:
+            metrics.increment("weather.timeouts")
+            return self._fallback(location, cached)
+        except Exception:
+            return self._fallback(location, cached)
+
+    async def aget(self, location: str) -> WeatherReport:
+        cached, future = self._lookup(location)
+        if future is None:
+            assert cached is not None
+            return cached
+        try:
+            # shielded: the upstream call must outlive this caller's timeout
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), self.deadline
+            )
+        except asyncio.TimeoutError:
+            metrics.increment("weather.timeouts")
+            return self._fallback(location, cached)
+        except Exception:
+            return self._fallback(location, cached)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _lookup(
+        self, location: str
+    ) -> tuple[WeatherReport | None, concurrent.futures.Future[WeatherReport] | None]:
+        """The cached report, if any, and the refresh the caller must wait for,
+        if the cached report cannot be served right away"""
+        key = location.strip().lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            age = None if entry is None else self._clock() - entry[0]
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if entry is not None and age is not None and age < self.cache_ttl:
+                metrics.increment("weather.hits")
+                return entry[1], None
+
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._refresh, key, location)
+                self._in_flight[key] = future
+            else:
+                metrics.increment("weather.coalesced")
+
+            if entry is not None and age is not None and age < self.stale_ttl:
+                metrics.increment("weather.stale_hits")
+                return entry[1], None
+
+            metrics.increment("weather.misses")
+            return None if entry is None else entry[1], future
+
+    def _refresh(self, key: str, location: str) -> WeatherReport:
+        started = time.perf_counter()
+        try:
+            report = self._fetch(location)
+        except Exception:
+            metrics.increment("weather.errors")
+            logger.exception("weather service request failed for %r", location)
+            with self._lock:
+                self._in_flight.pop(key, None)
+            raise
+        finally:
+            metrics.observe("weather.latency", time.perf_counter() - started)
+
+        # stored before the call stops being in flight, so that no lookup in
+        # between finds neither and calls the service again
+        with self._lock:
+            self._entries[key] = (self._clock(), report)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._in_flight.pop(key, None)
+        return report
+
+    def _fallback(self, location: str, cached: WeatherReport | None) -> WeatherReport:
+        if cached is None:
+            raise WeatherUnavailableError(location)
+        metrics.increment("weather.stale_fallbacks")
+        return cached
+
+
+class WeatherUnavailableError(Exception):
+    """No observation could be obtained within the deadline, and none is cached"""
+
+    def __init__(self, location: str) -> None:
+        super().__init__(f"Weather for {location!r} is currently unavailable")
+        self.location = location
+
+
+def get_weather_service(config: Config) -> WeatherService:
+    return services.registry.get_or_create(
+        "weather_service",
+        config.weather.model_dump_json(),
+        lambda: WeatherService(
+            lambda location: fetch_weather(config, location),
+            cache_ttl=config.weather.cache_ttl,
+            stale_ttl=config.weather.stale_ttl,
+            deadline=config.weather.deadline,
+            maxsize=config.weather.cache_maxsize,
+        ),
+        close=lambda service: service.close(),
+    )
+
+
+def fetch_weather(config: Config, location: str) -> WeatherReport:
+    weather_manager = services.get_weather_client(config).weather_manager()
+    observation = weather_manager.weather_at_place(location)
+    if observation is None:
+        raise WeatherUnavailableError(location)
+
+    temperature = observation.weather.temperature("celsius")
+    return {
+        "location": location,
+        "temperature": temperature["temp"],
+        "feels_like": temperature["feels_like"],
+        "humidity": observation.weather.humidity,
+        "detailed_status": observation.weather.detailed_status,
+    }
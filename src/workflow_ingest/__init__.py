@@ -1,14 +1,17 @@
 from .state import AgentState, SourceContent
-from .node_fetch import fetch
-from .node_extract import extract
-from .node_index_and_store import index_and_store
+from .node_fetch import fetch, afetch
+from .node_extract import extract, aextract
+from .node_index_and_store import index_and_store, aindex_and_store
 from .graph import get_graph
 
 __all__ = [
     "AgentState",
     "SourceContent",
     "fetch",
+    "afetch",
     "extract",
+    "aextract",
     "index_and_store",
+    "aindex_and_store",
     "get_graph",
 ]
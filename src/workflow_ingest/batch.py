@@ -0,0 +1,365 @@
+"""Ingestion of many inputs at once.
+
+Runs the same steps as the ingest graph, arranged for throughput:
+
+- fetching is I/O-bound and overlaps across up to `concurrency` inputs;
+- extraction and chunking are CPU-bound and run in a pool of `workers`
+  processes (or in threads of this process, if `workers` is 0);
+- chunks are embedded in batches across documents, also in the pool, and
+  written to the vector store in bulk (see `batching`);
+- database and vector store writes happen in this process.
+
+A failing input is recorded in the report and does not stop the batch.
+"""
+
+import asyncio
+import glob
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator, Literal, TypedDict
+from langchain.schema import Document
+from sqlalchemy.orm import Session
+
+from .. import services
+from ..config import Config
+from ..data import IndexableData
+from ..workflow_query.caches import invalidate_answers
+from .node_extract import extract
+from .node_fetch import afetch
+from .batching import ChunkBatcher
+from .checkpoints import (
+    BATCH_RUN,
+    arun_checkpointed,
+    get_checkpointer,
+    to_thread_id,
+)
+from .node_index_and_store import (
+    DocumentChanges,
+    changed_topic_ids,
+    select_document_changes,
+    store_documents,
+    to_chunk_documents,
+)
+from .sources import store_sources
+from .state import AgentState, SourceContent
+
+URL_SCHEMES = ("http://", "https://", "file://", "data:")
+
+
+class IngestOutcome(TypedDict):
+    url: str
+    # "unchanged" if every extracted document was already stored
+    status: Literal["ingested", "unchanged", "empty", "failed"]
+    documents: int
+    # stored (or moved to the topic) by this run, then embedded
+    new_documents: int
+    # already stored: not embedded again
+    skipped_documents: int
+    chunks: int
+    # of the extracted documents, whether new or not
+    document_ids: list[str]
+    error: str | None
+    seconds: float
+
+
+class BatchReport(TypedDict):
+    started_at: str
+    seconds: float
+    inputs: int
+    ingested: int
+    unchanged: int
+    empty: int
+    failed: int
+    documents: int
+    new_documents: int
+    skipped_documents: int
+    chunks: int
+    outcomes: list[IngestOutcome]
+
+
+class ProcessedContent(TypedDict):
+    extracted_data: list[IndexableData]
+    # by document id
+    chunks: dict[str, list[Document]]
+
+
+def to_input_url(path_or_url: str) -> str:
+    if path_or_url.startswith(URL_SCHEMES):
+        return path_or_url
+    return f"file://{os.path.abspath(path_or_url)}"
+
+
+def expand_inputs(inputs: Iterable[str], url_files: Iterable[str] = ()) -> list[str]:
+    """Input URLs for the given URLs, paths, directories (recursively) and glob
+    patterns, followed by those listed one per line in `url_files`, without
+    duplicates"""
+
+    def expand(path_or_url: str) -> Iterator[str]:
+        if path_or_url.startswith(URL_SCHEMES):
+            yield path_or_url
+        elif glob.has_magic(path_or_url):
+            for match in sorted(glob.glob(path_or_url, recursive=True)):
+                if os.path.isfile(match):
+                    yield to_input_url(match)
+        elif os.path.isdir(path_or_url):
+            for dirpath, dirnames, filenames in os.walk(path_or_url):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+                for filename in sorted(filenames):
+                    if not filename.startswith("."):
+                        yield to_input_url(os.path.join(dirpath, filename))
+        else:
+            # a missing file is reported as a failed input
+            yield to_input_url(path_or_url)
+
+    def listed(url_file: str) -> Iterator[str]:
+        with open(url_file) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+
+    urls: dict[str, None] = {}
+    for path_or_url in inputs:
+        urls.update(dict.fromkeys(expand(path_or_url)))
+    for url_file in url_files:
+        for path_or_url in listed(url_file):
+            urls.update(dict.fromkeys(expand(path_or_url)))
+    return list(urls)
+
+
+async def aingest_many(
+    urls: list[str],
+    topic_id: str | None,
+    config: Config,
+    concurrency: int = 16,
+    workers: int | None = None,
+    on_outcome: Callable[[IngestOutcome], None] | None = None,
+) -> BatchReport:
+    """Ingest `urls`, calling `on_outcome` as each one completes.
+
+    `workers` defaults to the number of CPUs.
+    """
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    pending = iter(urls)
+    outcomes: list[IngestOutcome] = []
+
+    executor = make_executor(workers, len(urls))
+    batcher = ChunkBatcher(config, executor)
+    # sqlite does not take well to concurrent writers
+    write_lock = asyncio.Lock()
+
+    async def ingest_pending() -> None:
+        for url in pending:
+            outcome = await aingest_one(
+                url, topic_id, config, executor, batcher, write_lock
+            )
+            outcomes.append(outcome)
+            if on_outcome is not None:
+                on_outcome(outcome)
+
+    try:
+        await asyncio.gather(
+            *(ingest_pending() for _ in range(max(1, min(concurrency, len(urls)))))
+        )
+    finally:
+        await batcher.aclose()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    return to_report(started_at, time.perf_counter() - started, outcomes)
+
+
+def to_report(
+    started_at: datetime, seconds: float, outcomes: list[IngestOutcome]
+) -> BatchReport:
+    return {
+        "started_at": started_at.isoformat(),
+        "seconds": seconds,
+        "inputs": len(outcomes),
+        "ingested": sum(o["status"] == "ingested" for o in outcomes),
+        "unchanged": sum(o["status"] == "unchanged" for o in outcomes),
+        "empty": sum(o["status"] == "empty" for o in outcomes),
+        "failed": sum(o["status"] == "failed" for o in outcomes),
+        "documents": sum(o["documents"] for o in outcomes),
+        "new_documents": sum(o["new_documents"] for o in outcomes),
+        "skipped_documents": sum(o["skipped_documents"] for o in outcomes),
+        "chunks": sum(o["chunks"] for o in outcomes),
+        "outcomes": outcomes,
+    }
+
+
+def make_executor(workers: int | None, inputs: int | None = None) -> Executor | None:
+    """Process pool of `workers` processes (default: the number of CPUs), no
+    more than there are `inputs`; None for 0 workers, to use threads"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 0:
+        return None
+    return ProcessPoolExecutor(
+        max_workers=workers if inputs is None else min(workers, inputs or 1),
+        # forking would copy threads, connection pools and open handles
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+async def aingest_one(
+    url: str,
+    topic_id: str | None,
+    config: Config,
+    executor: Executor | None,
+    batcher: ChunkBatcher,
+    write_lock: asyncio.Lock,
+    source_content: SourceContent | None = None,
+    run_id: str = BATCH_RUN,
+) -> IngestOutcome:
+    """Ingest `url`, fetching it unless its `source_content` is given.
+
+    With checkpointing, the ingestion is the thread of `url` in run `run_id`
+    of the checkpointer, resumed if it was interrupted.
+    """
+    log = services.get_logger(config)
+    started = time.perf_counter()
+    state = AgentState(
+        url=url, topic_id=topic_id, source_content=None, extracted_data=[]
+    )
+
+    if source_content is None:
+        # imported here: `stream` builds on this module
+        from .stream import aingest_stream, streamed_path
+
+        path = streamed_path(url, config)
+        if path is not None:
+            return await aingest_stream(
+                url, path, topic_id, config, batcher, write_lock
+            )
+
+    checkpointer = get_checkpointer(config) if source_content is None else None
+    thread_id = to_thread_id(run_id, url)
+
+    try:
+        loop = asyncio.get_running_loop()
+        if checkpointer is not None:
+            # fetched and extracted once, even if storing is interrupted
+            source_content, extracted_data = await arun_checkpointed(
+                url, topic_id, config, thread_id
+            )
+            processed = {
+                "extracted_data": extracted_data,
+                "chunks": await loop.run_in_executor(
+                    executor, chunk_documents, extracted_data, topic_id, config
+                ),
+            }
+        else:
+            if source_content is None:
+                fetched = await afetch(state, config.to_runnable_config())
+                source_content = fetched["source_content"]
+            processed = await loop.run_in_executor(
+                executor, process_content, url, source_content, topic_id, config
+            )
+
+        changes = await asyncio.to_thread(
+            select_sql_changes, processed["extracted_data"], topic_id, config
+        )
+        # ids are content hashes: stored documents need no new embeddings
+        chunks = [
+            chunk
+            for r in changes["new"] + changes["moved"]
+            for chunk in processed["chunks"][r.id()]
+        ]
+        # documents are stored once their chunks are written, so that a failed
+        # write leaves them to be embedded by the next run
+        if chunks:
+            await batcher.add(chunks)
+        async with write_lock:
+            await asyncio.to_thread(
+                store_sql_documents,
+                url,
+                source_content,
+                processed["extracted_data"],
+                changes,
+                topic_id,
+                config,
+            )
+        if chunks:
+            for changed_topic_id in changed_topic_ids(changes, topic_id):
+                invalidate_answers(config, changed_topic_id)
+        if checkpointer is not None:
+            await checkpointer.adelete_thread(thread_id)
+
+    except Exception as e:
+        log.warning(f"Failed to ingest {url}: {e}")
+        return {
+            "url": url,
+            "status": "failed",
+            "documents": 0,
+            "new_documents": 0,
+            "skipped_documents": 0,
+            "chunks": 0,
+            "document_ids": [],
+            "error": f"{e.__class__.__name__}: {e}",
+            "seconds": time.perf_counter() - started,
+        }
+
+    new_documents = len(changes["new"]) + len(changes["moved"])
+    return {
+        "url": url,
+        "status": (
+            "empty"
+            if not processed["extracted_data"]
+            else "ingested" if new_documents else "unchanged"
+        ),
+        "documents": len(processed["extracted_data"]),
+        "new_documents": new_documents,
+        "skipped_documents": len(changes["unchanged"]),
+        "chunks": len(chunks),
+        "document_ids": [r.id() for r in processed["extracted_data"]],
+        "error": None,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def process_content(
+    url: str, source_content: SourceContent, topic_id: str | None, config: Config
+) -> ProcessedContent:
+    """Extract and chunk; runs in a worker process"""
+    state = AgentState(
+        url=url, topic_id=topic_id, source_content=source_content, extracted_data=[]
+    )
+    extracted_data = extract(state, config.to_runnable_config())["extracted_data"]
+
+    return {
+        "extracted_data": extracted_data,
+        "chunks": chunk_documents(extracted_data, topic_id, config),
+    }
+
+
+def chunk_documents(
+    extracted_data: list[IndexableData], topic_id: str | None, config: Config
+) -> dict[str, list[Document]]:
+    """Chunks by document id"""
+    return {r.id(): to_chunk_documents(r, topic_id, config) for r in extracted_data}
+
+
+def select_sql_changes(
+    extracted_data: list[IndexableData], topic_id: str | None, config: Config
+) -> DocumentChanges:
+    with Session(services.get_db(config)) as session:
+        return select_document_changes(session, extracted_data, topic_id)
+
+
+def store_sql_documents(
+    url: str,
+    source_content: SourceContent,
+    extracted_data: list[IndexableData],
+    changes: DocumentChanges,
+    topic_id: str | None,
+    config: Config,
+) -> None:
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            store_documents(session, changes, topic_id)
+            store_sources(session, url, source_content, extracted_data)
@@ -0,0 +1,166 @@
+"""Batching of embedding and vector store writes across documents.
+
+Ingesting documents one at a time makes each one its own embedding request
+and vector store write. `ChunkBatcher` instead collects the chunks of
+documents ingested concurrently (API requests arriving in a burst, inputs of
+a batch CLI run) and embeds and writes them together, in batches of
+`indexing.embedding_batch_size` chunks, waiting at most
+`indexing.batch_max_latency` seconds for a batch to fill.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import NamedTuple
+from langchain.schema import Document
+
+from .. import metrics, services
+from ..config import Config
+
+
+class _Pending(NamedTuple):
+    chunks: list[Document]
+    written: asyncio.Future[None]
+
+
+class ChunkBatcher:
+    """Embeds and writes chunks to the vector store in batches.
+
+    Embedding runs on `executor` if given (e.g. a process pool), otherwise
+    through the embeddings' async interface; writes are serialized.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        executor: Executor | None = None,
+        max_concurrent_batches: int = 4,
+    ) -> None:
+        self._config = config
+        self._executor = executor
+        self._max_concurrent_batches = max_concurrent_batches
+        self.batch_size = config.indexing.embedding_batch_size
+        self.max_latency = config.indexing.batch_max_latency
+        self._pending: list[_Pending] = []
+        self._pending_chunks = 0
+        self._oldest_pending_at = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        self._batches: set[asyncio.Task[None]] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._slots: asyncio.Semaphore
+        self._write_lock: asyncio.Lock
+
+    async def add(self, chunks: list[Document]) -> None:
+        """Queue chunks for embedding and writing; return once they are written."""
+        if not chunks:
+            return
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._bind(loop)
+        written = loop.create_future()
+        if not self._pending:
+            self._oldest_pending_at = time.perf_counter()
+        self._pending.append(_Pending(chunks, written))
+        self._pending_chunks += len(chunks)
+
+        if self._pending_chunks >= self.batch_size or self.max_latency <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_latency, self._flush)
+
+        # the write goes ahead even if the caller stops waiting for it
+        await asyncio.shield(written)
+
+    async def flush(self) -> None:
+        """Write everything queued so far."""
+        self._flush()
+        while self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def aclose(self) -> None:
+        await self.flush()
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        # e.g. a test client running each request in its own event loop; a
+        # loop can only go away once its requests, and so their writes, are done
+        assert not self._pending and not self._batches
+        self._loop = loop
+        self._slots = asyncio.Semaphore(self._max_concurrent_batches)
+        self._write_lock = asyncio.Lock()
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        pending, self._pending, self._pending_chunks = self._pending, [], 0
+        metrics.observe(
+            "ingest.batch_wait", time.perf_counter() - self._oldest_pending_at
+        )
+        task = asyncio.create_task(self._write(pending))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _write(self, pending: list[_Pending]) -> None:
+        # documents with the same content ingested at once (e.g. from mirrored
+        # URLs) have the same chunk ids: embedded and written once
+        chunks = list(
+            {
+                chunk.id or id(chunk): chunk for p in pending for chunk in p.chunks
+            }.values()
+        )
+        vector_store = services.get_vector_store(self._config)
+
+        try:
+            async with self._slots:
+                for start in range(0, len(chunks), self.batch_size):
+                    batch = chunks[start : start + self.batch_size]
+                    embeddings = await self._embed(
+                        [chunk.page_content for chunk in batch]
+                    )
+                    async with self._write_lock:
+                        await asyncio.to_thread(
+                            services.add_embedded_documents,
+                            vector_store,
+                            batch,
+                            embeddings,
+                        )
+                    metrics.increment("ingest.batches")
+                    metrics.observe("ingest.batch_chunks", len(batch))
+        except Exception as e:
+            for p in pending:
+                if not p.written.done():
+                    p.written.set_exception(e)
+            return
+
+        for p in pending:
+            if not p.written.done():
+                p.written.set_result(None)
+
+    async def _embed(self, texts: list[str]) -> list[list[float]]:
+        if self._executor is None:
+            return await services.get_embeddings(self._config).aembed_documents(texts)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, embed_texts, self._config, texts
+        )
+
+
+def embed_texts(config: Config, texts: list[str]) -> list[list[float]]:
+    """Embed with the configured embeddings; runs in a worker process"""
+    return services.get_embeddings(config).embed_documents(texts)
+
+
+def get_chunk_batcher(config: Config) -> ChunkBatcher:
+    """The batcher shared by concurrent API requests; flushed on shutdown"""
+    return services.registry.get_or_create(
+        "chunk_batcher",
+        config.vector_store.model_dump_json()
+        + services.embeddings_key(config)
+        + config.indexing.model_dump_json(),
+        lambda: ChunkBatcher(config),
+        close=lambda batcher: batcher.aclose(),
+    )
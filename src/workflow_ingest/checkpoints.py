@@ -0,0 +1,359 @@
+"""Checkpoints of ingestion runs, to resume those that were interrupted.
+
+With `checkpointing.path` set, inputs ingested by `batch.aingest_one` go
+through the fetch and extract nodes of the ingestion graph compiled with a
+`SqliteCheckpointSaver`, one thread per run and URL (see `to_thread_id`):
+the state is saved after each node, so that a run interrupted before its
+documents are stored resumes from its last completed node, without fetching
+or extracting (possibly with an LLM) again. Threads are deleted once their
+documents are stored; those left are the pending runs.
+"""
+
+import asyncio
+import sqlite3
+import threading
+from typing import Any, AsyncIterator, Iterator, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from .. import services
+from ..config import Config
+from ..data import IndexableData
+from .graph import compile_graph
+from .state import AgentState, SourceContent
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+# the graph is not run past extraction: storing is up to `batch`
+LAST_NODE = "extract"
+
+# run of the inputs ingested by `batch` (e.g. the CLI), as opposed to jobs,
+# each of which is its own run
+BATCH_RUN = "batch"
+
+
+def to_thread_id(run_id: str, url: str) -> str:
+    return f"{run_id} {url}"
+
+
+def job_run_id(job_id: str) -> str:
+    return f"job {job_id}"
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """Checkpoint saver backed by a local SQLite file, safe to share between
+    threads of a process"""
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return next(self.list(config, limit=1), None)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        """Checkpoints matching `config`, newest first"""
+        where, params = [], []
+        if config is not None:
+            configurable = config["configurable"]
+            where.append("thread_id = ?")
+            params.append(configurable["thread_id"])
+            if "checkpoint_ns" in configurable:
+                where.append("checkpoint_ns = ?")
+                params.append(configurable["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,"
+            " type, checkpoint, metadata_type, metadata FROM checkpoints"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + " ORDER BY checkpoint_id DESC"
+        )
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+
+        count = 0
+        for (
+            thread_id,
+            checkpoint_ns,
+            checkpoint_id,
+            parent_checkpoint_id,
+            type,
+            checkpoint,
+            metadata_type,
+            metadata,
+        ) in rows:
+            loaded_metadata = self.serde.loads_typed((metadata_type, metadata))
+            if filter and any(loaded_metadata.get(k) != v for k, v in filter.items()):
+                continue
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            with self.lock:
+                writes = self.connection.execute(
+                    "SELECT task_id, channel, type, value FROM writes"
+                    " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+                    " ORDER BY task_id, idx",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchall()
+            yield CheckpointTuple(
+                config=to_config(thread_id, checkpoint_ns, checkpoint_id),
+                checkpoint=self.serde.loads_typed((type, checkpoint)),
+                metadata=loaded_metadata,
+                parent_config=(
+                    to_config(thread_id, checkpoint_ns, parent_checkpoint_id)
+                    if parent_checkpoint_id
+                    else None
+                ),
+                pending_writes=[
+                    (task_id, channel, self.serde.loads_typed((type, value)))
+                    for task_id, channel, type, value in writes
+                ],
+            )
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type, serialized = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type,
+                    serialized,
+                    metadata_type,
+                    serialized_metadata,
+                ),
+            )
+        return to_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type, serialized = self.serde.dumps_typed(value)
+            rows.append(
+                (
+                    configurable["thread_id"],
+                    configurable.get("checkpoint_ns", ""),
+                    configurable["checkpoint_id"],
+                    task_id,
+                    WRITES_IDX_MAP.get(channel, idx),
+                    channel,
+                    type,
+                    serialized,
+                    task_path,
+                )
+            )
+        # special writes (errors, interrupts) replace those of a previous try
+        with self.lock, self.connection:
+            self.connection.executemany(
+                (
+                    "INSERT OR REPLACE"
+                    if all(w[0] in WRITES_IDX_MAP for w in writes)
+                    else "INSERT OR IGNORE"
+                )
+                + " INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            )
+            self.connection.execute(
+                "DELETE FROM writes WHERE thread_id = ?", (thread_id,)
+            )
+
+    def thread_ids(self, run_id: str | None = None) -> Sequence[str]:
+        """Threads with checkpoints, only those of run `run_id` if given"""
+        prefix = "" if run_id is None else to_thread_id(run_id, "")
+        with self.lock:
+            return [
+                row[0]
+                for row in self.connection.execute(
+                    "SELECT DISTINCT thread_id FROM checkpoints"
+                    " WHERE substr(thread_id, 1, ?) = ? ORDER BY thread_id",
+                    (len(prefix), prefix),
+                )
+            ]
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def to_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+def get_checkpointer(config: Config) -> SqliteCheckpointSaver | None:
+    """The process's checkpoint saver, None if checkpointing is disabled"""
+    path = config.checkpointing.path
+    if path is None:
+        return None
+    return services.registry.get_or_create(
+        "checkpointer",
+        path,
+        lambda: SqliteCheckpointSaver(path),
+        close=lambda checkpointer: checkpointer.close(),
+    )
+
+
+def get_checkpointed_graph(config: Config) -> CompiledStateGraph:
+    """The ingestion graph compiled with the process's checkpoint saver, which
+    must be enabled; released along with the saver"""
+    checkpointer = get_checkpointer(config)
+    assert checkpointer is not None and config.checkpointing.path is not None
+    # by path, as the saver: not by the saver, kept alive once closed
+    return services.registry.get_or_create(
+        "checkpointed_graph",
+        config.checkpointing.path,
+        lambda: compile_graph(checkpointer),
+    )
+
+
+async def arun_checkpointed(
+    url: str,
+    topic_id: str | None,
+    config: Config,
+    thread_id: str,
+) -> tuple[SourceContent, list[IndexableData]]:
+    """Fetch and extract `url` in thread `thread_id`, resuming its pending run
+    if any"""
+    graph = get_checkpointed_graph(config)
+    runnable_config = config.to_runnable_config()
+    runnable_config["configurable"]["thread_id"] = thread_id
+
+    snapshot = await graph.aget_state(runnable_config)
+    if "ingest" not in snapshot.next:
+        await graph.ainvoke(
+            # None resumes from the last completed node
+            (
+                None
+                if snapshot.next
+                else AgentState(
+                    url=url, topic_id=topic_id, source_content=None, extracted_data=[]
+                )
+            ),
+            runnable_config,
+            interrupt_after=[LAST_NODE],
+        )
+        snapshot = await graph.aget_state(runnable_config)
+
+    state: AgentState = snapshot.values  # type: ignore[assignment]
+    assert state["source_content"] is not None
+    return state["source_content"], state["extracted_data"]
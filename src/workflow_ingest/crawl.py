@@ -0,0 +1,591 @@
+"""Crawling of sites into the knowledge base.
+
+Starting from seed URLs, pages are fetched and handed over to ingestion as
+they arrive, while the links they contain are followed:
+
+- only to hosts of the seeds, up to `max_depth` links away from a seed or
+  from an entry of the sites' sitemaps, and up to `max_pages` pages;
+- as allowed by the sites' robots.txt, whose Crawl-delay is honored;
+- at most one request per `crawling.min_host_delay` seconds per host;
+- once per URL, compared after normalization.
+
+Redirects are not followed by the fetch: their target is queued like a link,
+so that it goes through the same scope, robots.txt and per-host checks.
+
+The URLs discovered and what became of them are stored as they go, so that an
+interrupted crawl can be resumed with `load_crawl` and `arun_crawl`.
+"""
+
+import asyncio
+import gzip
+import json
+import time
+from collections import Counter
+import xml.etree.ElementTree as ET
+from concurrent.futures import Executor
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from typing import Callable, Literal, TypedDict
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from urllib.robotparser import RobotFileParser
+import httpx
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .. import services
+from ..config import Config
+from ..db import SqlCrawl, SqlCrawlUrl, insert_or_ignore
+from ..fetcher import get_fetcher
+from .batch import IngestOutcome, aingest_one, make_executor
+from .batching import ChunkBatcher
+from .node_fetch import to_source_content
+from .state import SourceContent
+
+# not worth a request: never text or HTML
+SKIPPED_EXTENSIONS = (
+    ".7z",
+    ".avi",
+    ".css",
+    ".doc",
+    ".docx",
+    ".gif",
+    ".gz",
+    ".ico",
+    ".jpeg",
+    ".jpg",
+    ".js",
+    ".mov",
+    ".mp3",
+    ".mp4",
+    ".pdf",
+    ".png",
+    ".svg",
+    ".tar",
+    ".webp",
+    ".woff",
+    ".woff2",
+    ".xls",
+    ".xlsx",
+    ".zip",
+)
+
+CrawlUrlStatus = Literal[
+    "pending",
+    "ingested",
+    "unchanged",
+    "empty",
+    "failed",
+    # by robots.txt
+    "disallowed",
+    # not text or HTML, or too large
+    "skipped",
+    # to another URL, queued in its place
+    "redirected",
+]
+
+
+class CrawlUrl(TypedDict):
+    depth: int
+    status: CrawlUrlStatus
+
+
+class CrawlState(TypedDict):
+    id: str
+    seeds: list[str]
+    topic_id: str | None
+    max_depth: int
+    max_pages: int
+    # by normalized URL
+    urls: dict[str, CrawlUrl]
+
+
+class CrawlReport(TypedDict):
+    crawl_id: str
+    started_at: str
+    seconds: float
+    # known to the crawl, including by previous runs
+    urls: int
+    # handled by this run
+    ingested: int
+    unchanged: int
+    empty: int
+    failed: int
+    disallowed: int
+    skipped: int
+    redirected: int
+    new_documents: int
+    chunks: int
+
+
+def create_crawl(
+    seeds: list[str],
+    topic_id: str | None,
+    config: Config,
+    max_depth: int = 2,
+    max_pages: int = 1000,
+) -> CrawlState:
+    urls = list(dict.fromkeys(u for u in map(normalize_url, seeds) if u is not None))
+    if not urls:
+        raise ValueError("No valid HTTP seed URLs")
+
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            crawl = SqlCrawl(
+                seeds=json.dumps(urls),
+                topic_id=topic_id,
+                max_depth=max_depth,
+                max_pages=max_pages,
+            )
+            session.add(crawl)
+            session.flush()
+            session.add_all(
+                SqlCrawlUrl(crawl_id=crawl.id, url=url, depth=0, status="pending")
+                for url in urls
+            )
+            crawl_id = crawl.id
+
+    return {
+        "id": crawl_id,
+        "seeds": urls,
+        "topic_id": topic_id,
+        "max_depth": max_depth,
+        "max_pages": max_pages,
+        "urls": {url: {"depth": 0, "status": "pending"} for url in urls},
+    }
+
+
+def load_crawl(crawl_id: str, config: Config) -> CrawlState:
+    with Session(services.get_db(config)) as session:
+        crawl = session.get(SqlCrawl, crawl_id)
+        if crawl is None:
+            raise ValueError(f"Unknown crawl: {crawl_id}")
+        urls = session.scalars(
+            select(SqlCrawlUrl).where(SqlCrawlUrl.crawl_id == crawl_id)
+        )
+        return {
+            "id": crawl.id,
+            "seeds": json.loads(crawl.seeds),
+            "topic_id": crawl.topic_id,
+            "max_depth": crawl.max_depth,
+            "max_pages": crawl.max_pages,
+            "urls": {
+                u.url: {"depth": u.depth, "status": u.status}  # type: ignore[typeddict-item]
+                for u in urls
+            },
+        }
+
+
+async def arun_crawl(
+    crawl: CrawlState,
+    config: Config,
+    concurrency: int = 8,
+    workers: int | None = 0,
+    discover_sitemaps: bool = True,
+    on_outcome: Callable[[IngestOutcome], None] | None = None,
+) -> CrawlReport:
+    """Crawl the pending URLs of `crawl` and those discovered from them,
+    fetching up to `concurrency` pages at a time and calling `on_outcome` as
+    each page is ingested. `workers` is as for `batch.aingest_many`."""
+    executor = make_executor(workers)
+    try:
+        return await SiteCrawler(crawl, config, concurrency, executor, on_outcome).run(
+            discover_sitemaps
+        )
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+class SiteCrawler:
+    def __init__(
+        self,
+        crawl: CrawlState,
+        config: Config,
+        concurrency: int,
+        executor: Executor | None,
+        on_outcome: Callable[[IngestOutcome], None] | None,
+    ) -> None:
+        self.crawl = crawl
+        self.config = config
+        self.concurrency = concurrency
+        self.executor = executor
+        self.on_outcome = on_outcome
+        self.log = services.get_logger(config)
+        self.fetcher = get_fetcher(config)
+        self.sites = {site_of(url) for url in crawl["seeds"]}
+        self.batcher = ChunkBatcher(config, executor)
+        # sqlite does not take well to concurrent writers
+        self.write_lock = asyncio.Lock()
+        # (url, depth) to fetch
+        self.frontier: asyncio.Queue[tuple[str, int]] = asyncio.Queue()
+        # fetched pages waiting for ingestion; bounded, so that fetching does
+        # not run ahead of ingestion
+        self.pages: asyncio.Queue[tuple[str, SourceContent]] = asyncio.Queue(
+            maxsize=2 * concurrency
+        )
+        self.robots: dict[str, asyncio.Task[RobotFileParser]] = {}
+        # earliest time of the next request, by host
+        self.next_request_at: dict[str, float] = {}
+        self.counts: Counter[CrawlUrlStatus] = Counter()
+        self.new_documents = 0
+        self.chunks = 0
+
+    async def run(self, discover_sitemaps: bool) -> CrawlReport:
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+
+        pending = sorted(
+            (u["depth"], url)
+            for url, u in self.crawl["urls"].items()
+            if u["status"] == "pending"
+        )
+        for depth, url in pending:
+            self.frontier.put_nowait((url, depth))
+
+        tasks = [
+            asyncio.create_task(worker())
+            for worker in [self.crawl_pending, self.ingest_pages]
+            for _ in range(self.concurrency)
+        ]
+        try:
+            if discover_sitemaps:
+                await self.discover_sitemaps()
+            # pages are only queued for ingestion by crawled urls
+            await self.frontier.join()
+            await self.pages.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.batcher.aclose()
+
+        return {
+            "crawl_id": self.crawl["id"],
+            "started_at": started_at.isoformat(),
+            "seconds": time.perf_counter() - started,
+            "urls": len(self.crawl["urls"]),
+            "ingested": self.counts["ingested"],
+            "unchanged": self.counts["unchanged"],
+            "empty": self.counts["empty"],
+            "failed": self.counts["failed"],
+            "disallowed": self.counts["disallowed"],
+            "skipped": self.counts["skipped"],
+            "redirected": self.counts["redirected"],
+            "new_documents": self.new_documents,
+            "chunks": self.chunks,
+        }
+
+    async def crawl_pending(self) -> None:
+        while True:
+            url, depth = await self.frontier.get()
+            try:
+                await self.crawl_one(url, depth)
+            except Exception as e:
+                self.log.warning(f"Failed to crawl {url}: {e}")
+            finally:
+                self.frontier.task_done()
+
+    async def crawl_one(self, url: str, depth: int) -> None:
+        started = time.perf_counter()
+        if not await self.allowed(url):
+            await self.record(url, "disallowed")
+            return
+
+        await self.wait_turn(url)
+        try:
+            fetched = await self.fetcher.afetch(url, follow_redirects=False)
+        except httpx.HTTPStatusError as e:
+            if not e.response.has_redirect_location:
+                self.log.warning(f"Failed to fetch {url}: {e}")
+                await self.fail(url, e, started)
+                return
+            location = urljoin(url, e.response.headers["location"])
+            self.log.info(f"{url} redirects to {location}")
+            # not a link: as far from the seeds as the redirecting URL
+            await self.admit([location], depth)
+            await self.record(url, "redirected")
+            return
+        except ValueError as e:
+            # unsupported content type, or too large
+            self.log.info(f"Skipping {url}: {e}")
+            await self.record(url, "skipped")
+            return
+        except Exception as e:
+            self.log.warning(f"Failed to fetch {url}: {e}")
+            await self.fail(url, e, started)
+            return
+
+        if fetched["type"] == "text/html" and depth < self.crawl["max_depth"]:
+            await self.admit(extract_links(fetched["data"], url), depth + 1)
+        await self.pages.put((url, to_source_content(fetched)))
+
+    async def fail(self, url: str, e: Exception, started: float) -> None:
+        await self.finish(
+            url,
+            {
+                "url": url,
+                "status": "failed",
+                "documents": 0,
+                "new_documents": 0,
+                "skipped_documents": 0,
+                "chunks": 0,
+                "document_ids": [],
+                "error": f"{e.__class__.__name__}: {e}",
+                "seconds": time.perf_counter() - started,
+            },
+        )
+
+    async def ingest_pages(self) -> None:
+        while True:
+            url, source_content = await self.pages.get()
+            started = time.perf_counter()
+            try:
+                outcome = await aingest_one(
+                    url,
+                    self.crawl["topic_id"],
+                    self.config,
+                    self.executor,
+                    self.batcher,
+                    self.write_lock,
+                    source_content,
+                )
+                await self.finish(url, outcome)
+            except Exception as e:
+                self.log.warning(f"Failed to ingest {url}: {e}")
+                try:
+                    await self.fail(url, e, started)
+                except Exception as e:
+                    self.log.warning(f"Failed to record the failure of {url}: {e}")
+            finally:
+                self.pages.task_done()
+
+    async def finish(self, url: str, outcome: IngestOutcome) -> None:
+        self.new_documents += outcome["new_documents"]
+        self.chunks += outcome["chunks"]
+        await self.record(url, outcome["status"])
+        if self.on_outcome is not None:
+            self.on_outcome(outcome)
+
+    async def record(self, url: str, status: CrawlUrlStatus) -> None:
+        self.counts[status] += 1
+        self.crawl["urls"][url]["status"] = status
+        async with self.write_lock:
+            await asyncio.to_thread(
+                set_crawl_url_status, self.crawl["id"], url, status, self.config
+            )
+
+    async def admit(self, urls: list[str], depth: int) -> None:
+        """Queue the URLs in scope not seen yet, within the page budget"""
+        admitted: list[str] = []
+        for url in urls:
+            normalized = normalize_url(url)
+            if (
+                normalized is None
+                or normalized in self.crawl["urls"]
+                or site_of(normalized) not in self.sites
+                or urlsplit(normalized).path.lower().endswith(SKIPPED_EXTENSIONS)
+            ):
+                continue
+            if len(self.crawl["urls"]) >= self.crawl["max_pages"]:
+                break
+            self.crawl["urls"][normalized] = {"depth": depth, "status": "pending"}
+            admitted.append(normalized)
+
+        if not admitted:
+            return
+        async with self.write_lock:
+            await asyncio.to_thread(
+                add_crawl_urls, self.crawl["id"], admitted, depth, self.config
+            )
+        for url in admitted:
+            self.frontier.put_nowait((url, depth))
+
+    async def allowed(self, url: str) -> bool:
+        if not self.config.crawling.respect_robots_txt:
+            return True
+        robots = await self.robots_for(url)
+        return robots.can_fetch(self.config.fetching.user_agent, url)
+
+    async def wait_turn(self, url: str) -> None:
+        """Wait until the host of `url` may be sent another request"""
+        delay = self.config.crawling.min_host_delay
+        if self.config.crawling.respect_robots_txt:
+            robots = await self.robots_for(url)
+            crawl_delay = robots.crawl_delay(self.config.fetching.user_agent)
+            if crawl_delay is not None:
+                delay = max(delay, float(crawl_delay))
+        await self.wait_host_turn(urlsplit(url).netloc, delay)
+
+    async def wait_host_turn(self, host: str, delay: float) -> None:
+        """Wait for the next request to `host`, then keep it for `delay` seconds"""
+        now = time.monotonic()
+        turn = max(now, self.next_request_at.get(host, now))
+        self.next_request_at[host] = turn + delay
+        if turn > now:
+            await asyncio.sleep(turn - now)
+
+    def robots_for(self, url: str) -> asyncio.Task[RobotFileParser]:
+        root = root_of(url)
+        task = self.robots.get(root)
+        if task is None:
+            task = asyncio.create_task(self.fetch_robots(root))
+            self.robots[root] = task
+        return task
+
+    async def fetch_robots(self, root: str) -> RobotFileParser:
+        robots = RobotFileParser(f"{root}/robots.txt")
+        # before its Crawl-delay is known: the minimal one
+        await self.wait_host_turn(
+            urlsplit(root).netloc, self.config.crawling.min_host_delay
+        )
+        try:
+            body = await self.fetcher.afetch_bytes(f"{root}/robots.txt")
+        except httpx.HTTPStatusError as e:
+            # per RFC 9309: no rules when missing
+            if e.response.status_code < 500:
+                robots.allow_all = True
+                return robots
+            self.log.warning(f"Failed to fetch {root}/robots.txt: {e}")
+        except Exception as e:
+            self.log.warning(f"Failed to fetch {root}/robots.txt: {e}")
+        else:
+            robots.parse(body.decode("utf-8", errors="replace").splitlines())
+            return robots
+
+        # per RFC 9309, unreachable (server error or no response): everything
+        # disallowed, but only until it is fetched again, for the next URL of
+        # the host
+        robots.disallow_all = True
+        if self.robots.get(root) is asyncio.current_task():
+            del self.robots[root]
+        return robots
+
+    async def discover_sitemaps(self) -> None:
+        """Queue the pages listed by the sitemaps of the seeds' sites"""
+        budget = self.config.crawling.max_sitemap_urls
+        for root in dict.fromkeys(root_of(seed) for seed in self.crawl["seeds"]):
+            robots = await self.robots_for(root)
+            sitemaps = list(robots.site_maps() or [f"{root}/sitemap.xml"])
+            seen: set[str] = set()
+            while sitemaps and budget > 0:
+                sitemap = sitemaps.pop(0)
+                if sitemap in seen:
+                    continue
+                seen.add(sitemap)
+                try:
+                    await self.wait_turn(sitemap)
+                    body = await self.fetcher.afetch_bytes(sitemap)
+                except Exception as e:
+                    self.log.info(f"No sitemap at {sitemap}: {e}")
+                    continue
+                pages, nested = parse_sitemap(body)
+                sitemaps.extend(nested)
+                await self.admit(pages[:budget], 0)
+                budget -= len(pages)
+
+
+class LinkParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.base: str | None = None
+        self.links: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        attributes = dict(attrs)
+        href = attributes.get("href")
+        if not href:
+            return
+        if tag == "base" and self.base is None:
+            self.base = href
+        elif tag == "a" and "nofollow" not in (attributes.get("rel") or "").split():
+            self.links.append(href)
+
+
+def extract_links(html: str, page_url: str) -> list[str]:
+    parser = LinkParser()
+    parser.feed(html)
+    parser.close()
+    base = page_url if parser.base is None else urljoin(page_url, parser.base)
+    return [urljoin(base, href.strip()) for href in parser.links]
+
+
+def parse_sitemap(body: bytes) -> tuple[list[str], list[str]]:
+    """Page URLs of a sitemap, and URLs of the sitemaps listed by a sitemap index"""
+    if body.startswith(b"\x1f\x8b"):
+        body = gzip.decompress(body)
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError:
+        return [], []
+    locs = [
+        element.text.strip()
+        for element in root.iter()
+        if element.tag.rsplit("}", 1)[-1] == "loc" and element.text
+    ]
+    if root.tag.rsplit("}", 1)[-1] == "sitemapindex":
+        return [], locs
+    return locs, []
+
+
+def normalize_url(url: str) -> str | None:
+    """Canonical form of an HTTP URL, or None if it is not one.
+
+    Lowercases the scheme and host, drops default ports, credentials and
+    fragments, resolves dot segments and sorts query parameters.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = parts.hostname
+    if scheme not in ("http", "https") or not host:
+        return None
+
+    if ":" in host:
+        host = f"[{host}]"
+    if port is not None and (scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    path = urlsplit(urljoin(f"{scheme}://{host}/", parts.path or "/")).path
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def root_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def site_of(url: str) -> str:
+    """Host of a normalized URL, with and without "www." being the same site"""
+    return urlsplit(url).netloc.removeprefix("www.")
+
+
+def add_crawl_urls(crawl_id: str, urls: list[str], depth: int, config: Config) -> None:
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            session.execute(
+                insert_or_ignore(session.get_bind().dialect.name, SqlCrawlUrl),
+                [
+                    {
+                        "crawl_id": crawl_id,
+                        "url": url,
+                        "depth": depth,
+                        "status": "pending",
+                    }
+                    for url in urls
+                ],
+            )
+
+
+def set_crawl_url_status(
+    crawl_id: str, url: str, status: CrawlUrlStatus, config: Config
+) -> None:
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            session.execute(
+                update(SqlCrawlUrl)
+                .where(SqlCrawlUrl.crawl_id == crawl_id, SqlCrawlUrl.url == url)
+                .values(status=status)
+            )
@@ -1,19 +1,35 @@
+import functools
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import StateGraph, START, END
 from ..config import Config
 from .state import AgentState
-from .node_extract import extract
-from .node_fetch import fetch
-from .node_index_and_store import index_and_store
+from .node_extract import extract, aextract
+from .node_fetch import fetch, afetch
+from .node_index_and_store import index_and_store, aindex_and_store
 
 
+@functools.cache
 def get_graph():
+    """Build and compile the graph once per process.
+
+    The compiled graph holds no per-run state and is safe to share across
+    concurrent invocations. Nodes have sync and async implementations,
+    selected by calling `invoke` or `ainvoke`.
+    """
+    return compile_graph()
+
+
+def compile_graph(checkpointer: BaseCheckpointSaver | None = None):
+    """Build and compile the graph. With a `checkpointer`, runs need a
+    `thread_id` and can be resumed (see `checkpoints`)."""
     builder = StateGraph(AgentState, Config)
-    builder.add_node("fetch", fetch)
-    builder.add_node("extract", extract)
-    builder.add_node("ingest", index_and_store)
+    builder.add_node("fetch", RunnableLambda(fetch, afunc=afetch))
+    builder.add_node("extract", RunnableLambda(extract, afunc=aextract))
+    builder.add_node("ingest", RunnableLambda(index_and_store, afunc=aindex_and_store))
     builder.add_edge(START, "fetch")
     builder.add_edge("fetch", "extract")
     builder.add_edge("extract", "ingest")
     builder.add_edge("ingest", END)
-    graph = builder.compile()
+    graph = builder.compile(checkpointer=checkpointer)
     return graph
@@ -0,0 +1,447 @@
+"""Durable queue of ingestion jobs, run by workers (`python src/cli.py worker`).
+
+Jobs are rows of the `jobs` table, so that they outlive the API process that
+queued them and can be run by workers on any host sharing the database:
+
+- a worker claims queued jobs in one statement, which skips rows locked by
+  other workers on Postgres (`FOR UPDATE SKIP LOCKED`); SQLite serializes
+  writes, so no two workers claim the same job there either;
+- a claimed job is hidden from other workers for `jobs.visibility_timeout`
+  seconds, a lease the worker renews while the job runs: the jobs of a worker
+  that died are claimed again once their lease expires;
+- a job with failed inputs is retried after `jobs.retry_delay` seconds,
+  doubled at each attempt, up to `jobs.max_attempts` attempts; a retry only
+  runs the inputs that failed, whose interrupted runs it resumes, and the
+  job's result accumulates the outcomes of all its attempts;
+- a stopping worker claims no more jobs and waits up to
+  `jobs.shutdown_timeout` seconds for those it runs, then hands the others
+  back to the queue.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Literal, TypedDict
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .. import metrics, services
+from ..config import Config
+from ..db import SqlJob
+from .batch import (
+    BatchReport,
+    IngestOutcome,
+    aingest_one,
+    make_executor,
+    to_report,
+)
+from .batching import ChunkBatcher
+from .checkpoints import job_run_id
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+
+class IngestJobPayload(TypedDict):
+    urls: list[str]
+    topic_id: str | None
+
+
+class ClaimedJob(TypedDict):
+    id: str
+    payload: IngestJobPayload
+    attempts: int
+    # of the previous attempts
+    result: BatchReport | None
+
+
+class JobInfo(TypedDict):
+    id: str
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    created_at: datetime
+    updated_at: datetime
+    result: BatchReport | None
+    error: str | None
+
+
+def to_job_values(
+    urls: list[str], topic_id: str | None, config: Config
+) -> dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "payload": json.dumps({"urls": urls, "topic_id": topic_id}),
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": config.jobs.max_attempts,
+        "available_at": now,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def enqueue_ingest(urls: list[str], topic_id: str | None, config: Config) -> str:
+    """Queue the ingestion of `urls`; return the job's id"""
+    values = to_job_values(urls, topic_id, config)
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            session.execute(insert(SqlJob).values(values))
+    return values["id"]
+
+
+async def aenqueue_ingest(urls: list[str], topic_id: str | None, config: Config) -> str:
+    """Queue the ingestion of `urls`; return the job's id"""
+    values = to_job_values(urls, topic_id, config)
+    async with AsyncSession(services.get_async_db(config)) as session:
+        async with session.begin():
+            await session.execute(insert(SqlJob).values(values))
+    return values["id"]
+
+
+def to_job_info(job: SqlJob) -> JobInfo:
+    return {
+        "id": job.id,
+        "status": job.status,  # type: ignore[typeddict-item]
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "result": None if job.result is None else json.loads(job.result),
+        "error": job.error,
+    }
+
+
+def get_job(job_id: str, config: Config) -> JobInfo | None:
+    with Session(services.get_db(config)) as session:
+        job = session.get(SqlJob, job_id)
+        return None if job is None else to_job_info(job)
+
+
+async def aget_job(job_id: str, config: Config) -> JobInfo | None:
+    async with AsyncSession(services.get_async_db(config)) as session:
+        job = await session.get(SqlJob, job_id)
+        return None if job is None else to_job_info(job)
+
+
+def claim_jobs(worker_id: str, limit: int, config: Config) -> list[ClaimedJob]:
+    """Claim up to `limit` jobs for `worker_id`, oldest available first"""
+    now = datetime.now(timezone.utc)
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            # leases expired with no attempts left: the job keeps killing or
+            # stalling its workers
+            session.execute(
+                update(SqlJob)
+                .where(
+                    SqlJob.status == "running",
+                    SqlJob.available_at <= now,
+                    SqlJob.attempts >= SqlJob.max_attempts,
+                )
+                .values(
+                    status="failed",
+                    claimed_by=None,
+                    error="Visibility timeout exceeded",
+                    updated_at=now,
+                )
+            )
+
+            claimable = (
+                select(SqlJob.id)
+                .where(
+                    # running: its worker's lease expired
+                    SqlJob.status.in_(["queued", "running"]),
+                    SqlJob.available_at <= now,
+                    SqlJob.attempts < SqlJob.max_attempts,
+                )
+                .order_by(SqlJob.available_at)
+                .limit(limit)
+            )
+            dialect_name = session.get_bind().dialect.name
+            if dialect_name == "postgresql":
+                claimable = claimable.with_for_update(skip_locked=True)
+            elif dialect_name != "sqlite":
+                raise Exception(f"Not implemented: job claiming for {dialect_name}")
+
+            rows = session.execute(
+                update(SqlJob)
+                .where(SqlJob.id.in_(claimable.scalar_subquery()))
+                .values(
+                    status="running",
+                    attempts=SqlJob.attempts + 1,
+                    available_at=now
+                    + timedelta(seconds=config.jobs.visibility_timeout),
+                    claimed_by=worker_id,
+                    updated_at=now,
+                )
+                .returning(SqlJob.id, SqlJob.payload, SqlJob.attempts, SqlJob.result)
+            ).all()
+
+    return [
+        {
+            "id": id,
+            "payload": json.loads(payload),
+            "attempts": attempts,
+            "result": None if result is None else json.loads(result),
+        }
+        for id, payload, attempts, result in rows
+    ]
+
+
+def renew_claims(job_ids: list[str], worker_id: str, config: Config) -> None:
+    """Extend the lease of `worker_id` on running `job_ids`"""
+    now = datetime.now(timezone.utc)
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            session.execute(
+                update(SqlJob)
+                .where(
+                    SqlJob.id.in_(job_ids),
+                    SqlJob.claimed_by == worker_id,
+                    SqlJob.status == "running",
+                )
+                .values(
+                    available_at=now
+                    + timedelta(seconds=config.jobs.visibility_timeout),
+                    updated_at=now,
+                )
+            )
+
+
+def finish_job(
+    job_id: str,
+    worker_id: str,
+    result: BatchReport | None,
+    error: str | None,
+    config: Config,
+) -> JobStatus | None:
+    """Record the attempt of `worker_id` at a job, queueing it again on error
+    unless it has no attempts left; None if the worker lost its lease"""
+    now = datetime.now(timezone.utc)
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            job = session.scalar(
+                select(SqlJob).where(
+                    SqlJob.id == job_id,
+                    SqlJob.claimed_by == worker_id,
+                    SqlJob.status == "running",
+                )
+            )
+            if job is None:
+                return None
+
+            status: JobStatus
+            if error is None:
+                status = "succeeded"
+            elif job.attempts < job.max_attempts:
+                status = "queued"
+                job.available_at = now + timedelta(
+                    seconds=config.jobs.retry_delay * 2 ** (job.attempts - 1)
+                )
+            else:
+                status = "failed"
+            job.status = status
+            job.claimed_by = None
+            job.result = None if result is None else json.dumps(result)
+            job.error = error
+            job.updated_at = now
+            return status
+
+
+def release_jobs(job_ids: list[str], worker_id: str, config: Config) -> None:
+    """Hand jobs claimed by `worker_id` back to the queue, not counting the
+    interrupted attempt"""
+    now = datetime.now(timezone.utc)
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            session.execute(
+                update(SqlJob)
+                .where(
+                    SqlJob.id.in_(job_ids),
+                    SqlJob.claimed_by == worker_id,
+                    SqlJob.status == "running",
+                )
+                .values(
+                    status="queued",
+                    attempts=SqlJob.attempts - 1,
+                    available_at=now,
+                    claimed_by=None,
+                    updated_at=now,
+                )
+            )
+
+
+async def arun_worker(
+    config: Config,
+    concurrency: int = 4,
+    workers: int | None = None,
+    stop: asyncio.Event | None = None,
+    drain: bool = False,
+    on_job: Callable[[str, JobStatus | None], None] | None = None,
+) -> int:
+    """Run queued jobs, `concurrency` of them and of their inputs at a time,
+    until `stop` is set (or, with `drain`, no job is left to claim); call
+    `on_job` as each one is run, and return how many were.
+
+    `workers` defaults to the number of CPUs.
+    """
+    return await JobWorker(config, concurrency, workers, on_job).arun(
+        stop or asyncio.Event(), drain
+    )
+
+
+class JobWorker:
+    def __init__(
+        self,
+        config: Config,
+        concurrency: int,
+        workers: int | None,
+        on_job: Callable[[str, JobStatus | None], None] | None,
+    ) -> None:
+        self.config = config
+        self.log = services.get_logger(config)
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.concurrency = concurrency
+        self.workers = workers
+        self.on_job = on_job
+        # running job id -> task
+        self.running: dict[str, asyncio.Task] = {}
+        self.count = 0
+
+    async def arun(self, stop: asyncio.Event, drain: bool) -> int:
+        self.executor = make_executor(self.workers)
+        self.batcher = ChunkBatcher(self.config, self.executor)
+        # sqlite does not take well to concurrent writers
+        self.write_lock = asyncio.Lock()
+        # inputs ingested at a time, across jobs
+        self.slots = asyncio.Semaphore(self.concurrency)
+        renewing = asyncio.create_task(self.renew_claims())
+        stopping = asyncio.create_task(stop.wait())
+        self.log.info(f"Worker {self.id} started")
+
+        try:
+            while not stop.is_set():
+                free = self.concurrency - len(self.running)
+                # as of the claim: a job finishing meanwhile may queue itself
+                # again after it
+                idle = not self.running
+                claimed: list[ClaimedJob] = []
+                if free > 0:
+                    try:
+                        claimed = await asyncio.to_thread(
+                            claim_jobs, self.id, free, self.config
+                        )
+                    except Exception as e:
+                        # e.g. the database restarting: poll again later
+                        self.log.warning(f"Failed to claim jobs: {e}")
+                for job in claimed:
+                    self.running[job["id"]] = asyncio.create_task(self.run_job(job))
+                if drain and idle and not claimed:
+                    break
+                # until a job is done, the worker is stopped or it is time to poll
+                await asyncio.wait(
+                    [stopping, *self.running.values()],
+                    timeout=self.config.jobs.poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+        finally:
+            await self.shut_down()
+            renewing.cancel()
+            stopping.cancel()
+        return self.count
+
+    async def shut_down(self) -> None:
+        if self.running:
+            self.log.info(
+                f"Worker {self.id} stopping: waiting for {len(self.running)} jobs"
+            )
+            await asyncio.wait(
+                self.running.values(), timeout=self.config.jobs.shutdown_timeout
+            )
+        interrupted = list(self.running)
+        for task in self.running.values():
+            task.cancel()
+        await asyncio.gather(*self.running.values(), return_exceptions=True)
+        if interrupted:
+            await asyncio.to_thread(release_jobs, interrupted, self.id, self.config)
+            self.log.info(f"Worker {self.id} handed back jobs {interrupted}")
+
+        await self.batcher.aclose()
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def renew_claims(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.jobs.visibility_timeout / 3)
+            if self.running:
+                try:
+                    await asyncio.to_thread(
+                        renew_claims, list(self.running), self.id, self.config
+                    )
+                except Exception as e:
+                    self.log.warning(f"Failed to renew job claims: {e}")
+
+    async def run_job(self, job: ClaimedJob) -> None:
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        payload = job["payload"]
+        # kept if this attempt fails as a whole
+        result = job["result"]
+        error: str | None = None
+        # by url: the inputs previous attempts ingested are not again
+        done = {
+            o["url"]: o
+            for o in (result["outcomes"] if result is not None else [])
+            if o["status"] != "failed"
+        }
+        earlier_seconds = 0.0
+        if result is not None:
+            started_at = datetime.fromisoformat(result["started_at"])
+            earlier_seconds = result["seconds"]
+
+        async def ingest(url: str) -> IngestOutcome:
+            async with self.slots:
+                return await aingest_one(
+                    url,
+                    payload["topic_id"],
+                    self.config,
+                    self.executor,
+                    self.batcher,
+                    self.write_lock,
+                    # a retried job resumes its interrupted runs
+                    run_id=job_run_id(job["id"]),
+                )
+
+        try:
+            outcomes = await asyncio.gather(
+                *(ingest(url) for url in payload["urls"] if url not in done)
+            )
+            ingested = {o["url"]: o for o in outcomes}
+            result = to_report(
+                started_at,
+                earlier_seconds + time.perf_counter() - started,
+                [done.get(url) or ingested[url] for url in payload["urls"]],
+            )
+            if result["failed"]:
+                error = f"{result['failed']} of {result['inputs']} inputs failed"
+        except Exception as e:
+            self.log.warning(f"Job {job['id']} failed: {e}")
+            error = f"{e.__class__.__name__}: {e}"
+
+        status = await asyncio.to_thread(
+            finish_job, job["id"], self.id, result, error, self.config
+        )
+        if status is None:
+            self.log.warning(f"Job {job['id']} was claimed by another worker")
+        else:
+            metrics.increment(f"jobs.{status}")
+        metrics.observe("jobs.seconds", time.perf_counter() - started)
+        del self.running[job["id"]]
+        self.count += 1
+        if self.on_job is not None:
+            self.on_job(job["id"], status)
@@ -5,8 +5,10 @@ from .state import AgentState
 from ..config import Config
 from .. import services
 from ..data import (
+    Extractor,
     IndexableData,
     GenericTabularData,
+    HtmlTableExtractor,
     TextualData,
 )
 
@@ -15,7 +17,9 @@ class ExtractStateUpdate(TypedDict):
     extracted_data: list[IndexableData]
 
 
-EXTRACTORS: list[type[IndexableData]] = [
+EXTRACTORS: list[Extractor] = [
+    # well-formed tables are parsed locally; the LLM only gets the others
+    HtmlTableExtractor,
     GenericTabularData,
     TextualData,
 ]
@@ -45,6 +49,40 @@ def extract(state: AgentState, config: RunnableConfig) -> ExtractStateUpdate:
             source_url=url,
             content_type=content["type"],
             llm=llm,
+            indexing=conf.indexing,
+        )
+        if result is not None:
+            extracted_data.append(result)
+            break
+
+    if not extracted_data:
+        log.warning(f"No data could be extracted from {url}")
+
+    return {
+        "extracted_data": extracted_data,
+    }
+
+
+async def aextract(state: AgentState, config: RunnableConfig) -> ExtractStateUpdate:
+    conf = Config.from_runnable_config(config)
+
+    log = services.get_logger(conf)
+    log.debug("node/aextract")
+
+    url = state["url"]
+    content = state["source_content"]
+    assert content is not None
+
+    extracted_data: list[IndexableData] = []
+    llm = services.get_llm(conf)
+
+    for extractor in EXTRACTORS:
+        result = await extractor.afrom_content(
+            content_data=content["data"],
+            source_url=url,
+            content_type=content["type"],
+            llm=llm,
+            indexing=conf.indexing,
         )
         if result is not None:
             extracted_data.append(result)
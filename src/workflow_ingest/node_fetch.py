@@ -2,7 +2,8 @@ from typing import TypedDict
 from langchain_core.runnables.config import RunnableConfig
 
 from .. import services
-from ..util import fetch_content
+from ..fetcher import get_fetcher
+from ..util import FetchResult
 from ..config import Config
 from .state import AgentState, SourceContent
 
@@ -17,8 +18,30 @@ def fetch(state: AgentState, config: RunnableConfig) -> FetchStateUpdate:
     log = services.get_logger(conf)
     log.debug("node/fetch")
 
-    result = fetch_content(state["url"])
+    result = get_fetcher(conf).fetch(state["url"])
 
     return {
-        "source_content": SourceContent(data=result["data"], type=result["type"]),
+        "source_content": to_source_content(result),
     }
+
+
+async def afetch(state: AgentState, config: RunnableConfig) -> FetchStateUpdate:
+    conf = Config.from_runnable_config(config)
+
+    log = services.get_logger(conf)
+    log.debug("node/afetch")
+
+    result = await get_fetcher(conf).afetch(state["url"])
+
+    return {
+        "source_content": to_source_content(result),
+    }
+
+
+def to_source_content(result: FetchResult) -> SourceContent:
+    source_content = SourceContent(data=result["data"], type=result["type"])
+    if "etag" in result:
+        source_content["etag"] = result["etag"]
+    if "last_modified" in result:
+        source_content["last_modified"] = result["last_modified"]
+    return source_content
@@ -1,15 +1,31 @@
 import pprint
+import time
+from typing import Any, TypedDict
 from langchain_core.runnables.config import RunnableConfig
 from langchain.schema import Document
+from sqlalchemy import Select, Update, select, update
 from sqlalchemy.orm import Session
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import services
-from ..db import SqlKnowledgeBaseDocument
+from .. import metrics, services
+from ..data import IndexableData
+from ..db import SqlKnowledgeBaseDocument, insert_or_ignore
 from ..config import Config
+from ..workflow_query.caches import increment_answer_generations, invalidate_answers
+from .batching import get_chunk_batcher
+from .sources import astore_sources, store_sources
 from .state import AgentState
 
 
+class DocumentChanges(TypedDict):
+    new: list[IndexableData]
+    # already stored under a different topic...
+    moved: list[IndexableData]
+    # ...these ones, whose answers cite them no more
+    moved_from: list[str | None]
+    unchanged: list[IndexableData]
+
+
 def index_and_store(state: AgentState, config: RunnableConfig) -> None:
     conf = Config.from_runnable_config(config)
 
@@ -18,54 +34,242 @@ def index_and_store(state: AgentState, config: RunnableConfig) -> None:
 
     db = services.get_db(conf)
     vector_store = services.get_vector_store(conf)
-    documents: list[Document] = []
 
     topic_id = state["topic_id"]
-    extracted_data = state["extracted_data"]
+    with Session(db) as session:
+        changes = select_document_changes(session, state["extracted_data"], topic_id)
+
+    # ids are content hashes: stored documents need no new embeddings
+    documents = to_changed_chunk_documents(changes, topic_id, conf)
+    if documents:
+        vector_store.add_documents(documents)
+
+    # stored once their chunks are written, so that a failed write leaves
+    # them to be embedded by the next run
     with Session(db) as session:
         with session.begin():
-            for r in extracted_data:
-                # TODO: since hash-based id's reliably represent the
-                # document, use on_conflict_do_nothing instead to
-                # avoid the useless update
-                session.merge(
-                    SqlKnowledgeBaseDocument(
-                        id=r.id(),
-                        content=r.to_text(),
-                        data=r.model_dump_json(),
-                        topic_id=topic_id,
-                    )
-                )
-
-                chunks = RecursiveCharacterTextSplitter(
-                    chunk_size=conf.indexing.chunk_size,
-                    chunk_overlap=conf.indexing.chunk_overlap,
-                ).split_text(r.to_text())
-
-                for i, chunk in enumerate(chunks):
-                    doc_id = r.id()
-                    chunk_id = i
-                    metadata = {
-                        "source_id": doc_id,
-                        "chunk_id": chunk_id,
-                        "source_url": r.source_url,
-                    }
-                    if r.title is not None:
-                        metadata["title"] = r.title
-
-                    if state["topic_id"] is None:
-                        metadata["topic_id"] = "UNCATEGORIZED"
-                    else:
-                        metadata["topic_id"] = state["topic_id"]
-
-                    documents.append(
-                        Document(
-                            id=f"{doc_id}-{chunk_id}",
-                            page_content=chunk,
-                            metadata=metadata,
-                        )
-                    )
-
-    vector_store.add_documents(documents)
+            store_documents(session, changes, topic_id)
+            store_sources(
+                session, state["url"], state["source_content"], state["extracted_data"]
+            )
+    log.info(describe_changes(changes))
+    if documents:
+        for changed_topic_id in changed_topic_ids(changes, topic_id):
+            invalidate_answers(conf, changed_topic_id)
+
+    return None
+
+
+async def aindex_and_store(state: AgentState, config: RunnableConfig) -> None:
+    conf = Config.from_runnable_config(config)
+
+    log = services.get_logger(conf)
+    log.debug("node/aindex_and_store")
+
+    db = services.get_async_db(conf)
+
+    topic_id = state["topic_id"]
+    async with AsyncSession(db) as session:
+        changes = await aselect_document_changes(
+            session, state["extracted_data"], topic_id
+        )
+
+    documents = to_changed_chunk_documents(changes, topic_id, conf)
+    if documents:
+        # written together with chunks of documents ingested concurrently
+        await get_chunk_batcher(conf).add(documents)
+
+    async with AsyncSession(db) as session:
+        async with session.begin():
+            await astore_documents(session, changes, topic_id)
+            await astore_sources(
+                session, state["url"], state["source_content"], state["extracted_data"]
+            )
+    log.info(describe_changes(changes))
+    if documents:
+        for changed_topic_id in changed_topic_ids(changes, topic_id):
+            invalidate_answers(conf, changed_topic_id)
 
     return None
+
+
+def select_document_changes(
+    session: Session, extracted_data: list[IndexableData], topic_id: str | None
+) -> DocumentChanges:
+    """Documents not stored yet, stored under another topic, or stored as is"""
+    by_id = {r.id(): r for r in extracted_data}
+    stored = {
+        doc_id: stored_topic_id
+        for doc_id, stored_topic_id in session.execute(
+            select_stored_topic_ids(list(by_id))
+        )
+    }
+    return to_document_changes(by_id, stored, topic_id)
+
+
+async def aselect_document_changes(
+    session: AsyncSession, extracted_data: list[IndexableData], topic_id: str | None
+) -> DocumentChanges:
+    by_id = {r.id(): r for r in extracted_data}
+    stored = {
+        doc_id: stored_topic_id
+        for doc_id, stored_topic_id in await session.execute(
+            select_stored_topic_ids(list(by_id))
+        )
+    }
+    return to_document_changes(by_id, stored, topic_id)
+
+
+def store_documents(
+    session: Session, changes: DocumentChanges, topic_id: str | None
+) -> None:
+    """Insert new documents and move stored ones to `topic_id`; to be called
+    once their chunks are written"""
+    if changes["new"]:
+        session.execute(
+            insert_or_ignore(session.get_bind().dialect.name, SqlKnowledgeBaseDocument),
+            [to_sql_values(r, topic_id) for r in changes["new"]],
+        )
+    if changes["moved"]:
+        session.execute(update_topic_id(changes["moved"], topic_id))
+    if changes["new"] or changes["moved"]:
+        session.execute(
+            increment_answer_generations(
+                session.get_bind().dialect.name, changed_topic_ids(changes, topic_id)
+            )
+        )
+
+    record_changes(changes)
+
+
+async def astore_documents(
+    session: AsyncSession, changes: DocumentChanges, topic_id: str | None
+) -> None:
+    if changes["new"]:
+        await session.execute(
+            insert_or_ignore(session.get_bind().dialect.name, SqlKnowledgeBaseDocument),
+            [to_sql_values(r, topic_id) for r in changes["new"]],
+        )
+    if changes["moved"]:
+        await session.execute(update_topic_id(changes["moved"], topic_id))
+    if changes["new"] or changes["moved"]:
+        await session.execute(
+            increment_answer_generations(
+                session.get_bind().dialect.name, changed_topic_ids(changes, topic_id)
+            )
+        )
+
+    record_changes(changes)
+
+
+def select_stored_topic_ids(ids: list[str]) -> Select[tuple[str, str | None]]:
+    return select(SqlKnowledgeBaseDocument.id, SqlKnowledgeBaseDocument.topic_id).where(
+        SqlKnowledgeBaseDocument.id.in_(ids)
+    )
+
+
+def update_topic_id(moved: list[IndexableData], topic_id: str | None) -> Update:
+    return (
+        update(SqlKnowledgeBaseDocument)
+        .where(SqlKnowledgeBaseDocument.id.in_([r.id() for r in moved]))
+        .values(topic_id=topic_id)
+    )
+
+
+def to_document_changes(
+    by_id: dict[str, IndexableData],
+    stored: dict[str, str | None],
+    topic_id: str | None,
+) -> DocumentChanges:
+    changes: DocumentChanges = {
+        "new": [],
+        "moved": [],
+        "moved_from": [],
+        "unchanged": [],
+    }
+    for doc_id, r in by_id.items():
+        if doc_id not in stored:
+            changes["new"].append(r)
+        elif stored[doc_id] != topic_id:
+            changes["moved"].append(r)
+            changes["moved_from"].append(stored[doc_id])
+        else:
+            changes["unchanged"].append(r)
+    return changes
+
+
+def record_changes(changes: DocumentChanges) -> None:
+    for kind in ("new", "moved", "unchanged"):
+        if changes[kind]:
+            metrics.increment(f"ingest.documents.{kind}", len(changes[kind]))
+
+
+def changed_topic_ids(
+    changes: DocumentChanges, topic_id: str | None
+) -> set[str | None]:
+    """Topics whose cached answers the changes make stale"""
+    return {topic_id, *changes["moved_from"]}
+
+
+def describe_changes(changes: DocumentChanges) -> str:
+    return (
+        f"{len(changes['new'])} new, {len(changes['moved'])} moved, "
+        f"{len(changes['unchanged'])} unchanged documents"
+    )
+
+
+def to_sql_values(r: IndexableData, topic_id: str | None) -> dict[str, Any]:
+    return {
+        "id": r.id(),
+        "content": r.text,
+        "data": r.model_dump_json(),
+        "topic_id": topic_id,
+    }
+
+
+def to_changed_chunk_documents(
+    changes: DocumentChanges, topic_id: str | None, conf: Config
+) -> list[Document]:
+    return [
+        chunk
+        for r in changes["new"] + changes["moved"]
+        for chunk in to_chunk_documents(r, topic_id, conf)
+    ]
+
+
+def to_chunk_documents(
+    r: IndexableData, topic_id: str | None, conf: Config
+) -> list[Document]:
+    documents: list[Document] = []
+
+    chunks = r.chunk_texts(conf.indexing.chunk_size, conf.indexing.chunk_overlap)
+
+    doc_id = r.id()
+    ingested_at = time.time()
+    for i, chunk in enumerate(chunks):
+        chunk_id = i
+        metadata = {
+            "source_id": doc_id,
+            "chunk_id": chunk_id,
+            "source_url": r.source_url,
+            # spares the chunk from garbage collection until its document is
+            # stored (see `orphans`)
+            "ingested_at": ingested_at,
+        }
+        if r.title is not None:
+            metadata["title"] = r.title
+
+        if topic_id is None:
+            metadata["topic_id"] = "UNCATEGORIZED"
+        else:
+            metadata["topic_id"] = topic_id
+
+        documents.append(
+            Document(
+                id=f"{doc_id}-{chunk_id}",
+                page_content=chunk,
+                metadata=metadata,
+            )
+        )
+
+    return documents
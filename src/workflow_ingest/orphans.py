@@ -0,0 +1,122 @@
+"""Garbage collection of the chunks of documents no longer stored.
+
+Chunks are deleted along with their documents, but those of documents deleted
+before that was the case, or while the vector store could not be reached, stay
+in the index, where they bloat it and slow down filtered searches. The vector
+store is scanned in batches of `batch_size` chunks, the `source_id` of each
+batch's chunks looked up in the database, and chunks whose document is not
+there are deleted, then the vector store is compacted. Chunks without a
+`source_id` were not written by ingestion and are only counted.
+
+Ingestion writes the chunks of a document before the document itself, so the
+chunks of a document being ingested look orphaned for a while. Chunks are
+stamped with an `ingested_at` time, and those younger than `grace_period`
+seconds are left alone, which makes it safe to collect while ingesting.
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Callable, TypedDict
+from langchain_chroma import Chroma
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import metrics, services
+from ..config import Config
+from ..db import SqlKnowledgeBaseDocument
+
+
+class CollectionReport(TypedDict):
+    started_at: str
+    seconds: float
+    # scanned in the vector store
+    chunks: int
+    orphaned_chunks: int
+    # distinct missing documents the orphaned chunks were split from
+    orphaned_documents: int
+    # without a `source_id`, e.g. written by something else than ingestion:
+    # never deleted
+    unowned_chunks: int
+    # orphaned but within the grace period, e.g. of documents being ingested:
+    # not deleted yet
+    recent_chunks: int
+    # decrease of the vector store's size on disk, after compaction
+    bytes_reclaimed: int
+    dry_run: bool
+
+
+def collect_orphaned_chunks(
+    config: Config,
+    batch_size: int = 1000,
+    grace_period: float = 3600,
+    dry_run: bool = False,
+    on_batch: Callable[[int, int], None] | None = None,
+) -> CollectionReport:
+    """Delete the chunks whose document is not stored and that were written
+    over `grace_period` seconds ago (only count them if `dry_run`), calling `on_batch` with the numbers of chunks scanned and
+    orphaned so far after each batch."""
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    vector_store = services.get_vector_store(config)
+    if not isinstance(vector_store, Chroma):
+        raise Exception(
+            f"Not implemented: collecting chunks of {vector_store.__class__.__name__}"
+        )
+    size = services.vector_store_size(config)
+
+    # ids only, gathered before deleting so that deletions do not shift pages
+    orphaned: list[str] = []
+    orphaned_documents: set[str] = set()
+    scanned = unowned = recent = 0
+    # chunks written before they were stamped are as old as can be
+    written_before = time.time() - grace_period
+    with Session(services.get_db(config)) as session:
+        while True:
+            batch = vector_store._collection.get(
+                include=["metadatas"], limit=batch_size, offset=scanned
+            )
+            if not batch["ids"]:
+                break
+            metadatas = [metadata or {} for metadata in batch["metadatas"] or []]
+            sources = [metadata.get("source_id") for metadata in metadatas]
+            stored = set(
+                session.scalars(
+                    select(SqlKnowledgeBaseDocument.id).where(
+                        SqlKnowledgeBaseDocument.id.in_({s for s in sources if s})
+                    )
+                )
+            )
+            for chunk_id, source_id, metadata in zip(batch["ids"], sources, metadatas):
+                if not source_id:
+                    # not written by ingestion: left alone
+                    unowned += 1
+                elif source_id in stored:
+                    continue
+                elif metadata.get("ingested_at", 0) > written_before:
+                    recent += 1
+                else:
+                    orphaned.append(chunk_id)
+                    orphaned_documents.add(str(source_id))
+            scanned += len(batch["ids"])
+            if on_batch is not None:
+                on_batch(scanned, len(orphaned))
+
+    reclaimed = 0
+    if not dry_run and orphaned:
+        for i in range(0, len(orphaned), batch_size):
+            vector_store._collection.delete(ids=orphaned[i : i + batch_size])
+        services.compact_vector_store(config)
+        reclaimed = max(0, size - services.vector_store_size(config))
+        metrics.increment("gc.deleted_chunks", len(orphaned))
+
+    return {
+        "started_at": started_at.isoformat(),
+        "seconds": time.perf_counter() - started,
+        "chunks": scanned,
+        "orphaned_chunks": len(orphaned),
+        "orphaned_documents": len(orphaned_documents),
+        "unowned_chunks": unowned,
+        "recent_chunks": recent,
+        "bytes_reclaimed": reclaimed,
+        "dry_run": dry_run,
+    }
@@ -0,0 +1,246 @@
+"""Refresh of the documents of a topic from their source URLs.
+
+Each URL is re-requested with the validators of its last response, so that
+servers supporting conditional requests answer 304 without sending content
+again. Content that did change, but hashes the same as before, is not
+processed either. Otherwise the content goes through extraction, chunking and
+embedding as in `batch`, and documents no longer extracted from the URL, nor
+from any other, are deleted along with their chunks.
+
+URLs are refreshed concurrently, up to `concurrency` at a time; a failing URL
+is recorded in the report and does not stop the others.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Literal, TypedDict
+from sqlalchemy.orm import Session
+
+from .. import services
+from ..config import Config
+from ..data import IndexableData
+from ..fetcher import get_fetcher
+from ..workflow_query.caches import increment_answer_generations, invalidate_answers
+from .batch import process_content, select_sql_changes
+from .batching import ChunkBatcher
+from .node_fetch import to_source_content
+from .node_index_and_store import DocumentChanges, changed_topic_ids, store_documents
+from .sources import (
+    StoredSource,
+    delete_sources,
+    hash_content,
+    record_fetch,
+    select_topic_sources,
+    store_sources,
+)
+from .state import SourceContent
+
+
+class RefreshOutcome(TypedDict):
+    url: str
+    # "unchanged" if the content was sent but hashes the same as before
+    status: Literal["not_modified", "unchanged", "updated", "failed"]
+    # stored (or moved to the topic) by this run, then embedded
+    new_documents: int
+    # no longer extracted from the URL's content, nor from any other URL's
+    deleted_documents: int
+    chunks: int
+    error: str | None
+    seconds: float
+
+
+class RefreshReport(TypedDict):
+    started_at: str
+    seconds: float
+    sources: int
+    not_modified: int
+    unchanged: int
+    updated: int
+    failed: int
+    new_documents: int
+    deleted_documents: int
+    chunks: int
+    outcomes: list[RefreshOutcome]
+
+
+async def arefresh_topic(
+    topic_id: str | None,
+    config: Config,
+    concurrency: int = 8,
+    on_outcome: Callable[[RefreshOutcome], None] | None = None,
+) -> RefreshReport:
+    """Re-check the source URLs of the documents of a topic (None for the
+    default topic), calling `on_outcome` as each one completes."""
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    sources = await asyncio.to_thread(select_sources, topic_id, config)
+    pending: Iterator[StoredSource] = iter(sources)
+    outcomes: list[RefreshOutcome] = []
+
+    batcher = ChunkBatcher(config)
+    # sqlite does not take well to concurrent writers
+    write_lock = asyncio.Lock()
+
+    async def refresh_pending() -> None:
+        for source in pending:
+            outcome = await arefresh_source(
+                source, topic_id, config, batcher, write_lock
+            )
+            outcomes.append(outcome)
+            if on_outcome is not None:
+                on_outcome(outcome)
+
+    try:
+        await asyncio.gather(
+            *(refresh_pending() for _ in range(max(1, min(concurrency, len(sources)))))
+        )
+    finally:
+        await batcher.aclose()
+
+    return {
+        "started_at": started_at.isoformat(),
+        "seconds": time.perf_counter() - started,
+        "sources": len(outcomes),
+        "not_modified": sum(o["status"] == "not_modified" for o in outcomes),
+        "unchanged": sum(o["status"] == "unchanged" for o in outcomes),
+        "updated": sum(o["status"] == "updated" for o in outcomes),
+        "failed": sum(o["status"] == "failed" for o in outcomes),
+        "new_documents": sum(o["new_documents"] for o in outcomes),
+        "deleted_documents": sum(o["deleted_documents"] for o in outcomes),
+        "chunks": sum(o["chunks"] for o in outcomes),
+        "outcomes": outcomes,
+    }
+
+
+async def arefresh_source(
+    source: StoredSource,
+    topic_id: str | None,
+    config: Config,
+    batcher: ChunkBatcher,
+    write_lock: asyncio.Lock,
+) -> RefreshOutcome:
+    log = services.get_logger(config)
+    started = time.perf_counter()
+    url = source["url"]
+
+    def outcome(
+        status: Literal["not_modified", "unchanged", "updated", "failed"],
+        new_documents: int = 0,
+        deleted_documents: int = 0,
+        chunks: int = 0,
+        error: str | None = None,
+    ) -> RefreshOutcome:
+        return {
+            "url": url,
+            "status": status,
+            "new_documents": new_documents,
+            "deleted_documents": deleted_documents,
+            "chunks": chunks,
+            "error": error,
+            "seconds": time.perf_counter() - started,
+        }
+
+    try:
+        fetched = await get_fetcher(config).afetch_if_modified(
+            url, source["etag"], source["last_modified"]
+        )
+        source_content = None if fetched is None else to_source_content(fetched)
+        if (
+            source_content is None
+            or hash_content(source_content["data"]) == source["content_hash"]
+        ):
+            async with write_lock:
+                await asyncio.to_thread(
+                    record_unchanged_source, source, source_content, config
+                )
+            return outcome("not_modified" if source_content is None else "unchanged")
+
+        processed = await asyncio.to_thread(
+            process_content, url, source_content, topic_id, config
+        )
+        changes = await asyncio.to_thread(
+            select_sql_changes, processed["extracted_data"], topic_id, config
+        )
+        chunks = [
+            chunk
+            for r in changes["new"] + changes["moved"]
+            for chunk in processed["chunks"][r.id()]
+        ]
+        # new chunks are in place before documents and the source's content
+        # hash are stored, and before superseded chunks go away
+        if chunks:
+            await batcher.add(chunks)
+        async with write_lock:
+            deleted = await asyncio.to_thread(
+                store_refreshed_documents,
+                source,
+                source_content,
+                processed["extracted_data"],
+                changes,
+                topic_id,
+                config,
+            )
+        await asyncio.to_thread(
+            services.delete_document_chunks,
+            services.get_vector_store(config),
+            deleted,
+        )
+        if chunks or deleted:
+            for changed_topic_id in changed_topic_ids(changes, topic_id):
+                invalidate_answers(config, changed_topic_id)
+
+    except Exception as e:
+        log.warning(f"Failed to refresh {url}: {e}")
+        return outcome("failed", error=f"{e.__class__.__name__}: {e}")
+
+    return outcome(
+        "updated",
+        new_documents=len(changes["new"]) + len(changes["moved"]),
+        deleted_documents=len(deleted),
+        chunks=len(chunks),
+    )
+
+
+def select_sources(topic_id: str | None, config: Config) -> list[StoredSource]:
+    with Session(services.get_db(config)) as session:
+        return select_topic_sources(session, topic_id)
+
+
+def record_unchanged_source(
+    source: StoredSource, source_content: SourceContent | None, config: Config
+) -> None:
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            record_fetch(session, source, source_content)
+
+
+def store_refreshed_documents(
+    source: StoredSource,
+    source_content: SourceContent,
+    extracted_data: list[IndexableData],
+    changes: DocumentChanges,
+    topic_id: str | None,
+    config: Config,
+) -> list[str]:
+    """Store the documents now extracted from a source, and delete those of its
+    previous content that were not extracted again, unless other URLs are
+    sources of them; return the ids of the deleted documents"""
+    extracted_ids = {r.id() for r in extracted_data}
+    superseded = [id for id in source["document_ids"] if id not in extracted_ids]
+
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            store_documents(session, changes, topic_id)
+            store_sources(session, source["url"], source_content, extracted_data)
+            deleted = (
+                delete_sources(session, source["url"], superseded) if superseded else []
+            )
+            if deleted:
+                session.execute(
+                    increment_answer_generations(
+                        session.get_bind().dialect.name, [topic_id]
+                    )
+                )
+
+    return deleted
@@ -0,0 +1,167 @@
+"""Where stored documents were fetched from.
+
+For each document ingested from an HTTP URL, the response validators (ETag,
+Last-Modified) and a hash of the fetched content are stored, so that the URL
+can later be re-checked with a conditional request (see `refresh`). URLs with
+the same content are all recorded as sources of its documents, which are
+deleted once none of them yields them anymore.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, TypedDict
+from sqlalchemy import Select, delete, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..data import IndexableData
+from ..db import (
+    SqlDocumentSource,
+    SqlKnowledgeBaseDocument,
+    insert_or_update,
+)
+from .state import SourceContent
+
+# updated when a (document, URL) pair is stored again
+SOURCE_COLUMNS = ["etag", "last_modified", "content_hash", "fetched_at"]
+
+
+class StoredSource(TypedDict):
+    url: str
+    etag: str | None
+    last_modified: str | None
+    content_hash: str
+    # documents extracted from the URL's content
+    document_ids: list[str]
+
+
+def is_refreshable(url: str) -> bool:
+    return url.startswith(("http://", "https://"))
+
+
+def hash_content(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def store_sources(
+    session: Session,
+    url: str,
+    source_content: SourceContent | None,
+    extracted_data: list[IndexableData],
+) -> None:
+    """Record `url` as the source of the documents extracted from its content"""
+    if source_content is None or not is_refreshable(url) or not extracted_data:
+        return
+    session.execute(
+        insert_or_update(
+            session.get_bind().dialect.name, SqlDocumentSource, SOURCE_COLUMNS
+        ),
+        to_source_values(url, source_content, extracted_data),
+    )
+
+
+async def astore_sources(
+    session: AsyncSession,
+    url: str,
+    source_content: SourceContent | None,
+    extracted_data: list[IndexableData],
+) -> None:
+    if source_content is None or not is_refreshable(url) or not extracted_data:
+        return
+    await session.execute(
+        insert_or_update(
+            session.get_bind().dialect.name, SqlDocumentSource, SOURCE_COLUMNS
+        ),
+        to_source_values(url, source_content, extracted_data),
+    )
+
+
+def select_topic_sources(session: Session, topic_id: str | None) -> list[StoredSource]:
+    """Sources of the documents of a topic, by URL"""
+    sources: dict[str, StoredSource] = {}
+    for source in session.scalars(select_sources(topic_id)):
+        stored = sources.setdefault(
+            source.url,
+            {
+                "url": source.url,
+                "etag": source.etag,
+                "last_modified": source.last_modified,
+                "content_hash": source.content_hash,
+                "document_ids": [],
+            },
+        )
+        stored["document_ids"].append(source.document_id)
+    return list(sources.values())
+
+
+def select_sources(topic_id: str | None) -> Select[tuple[SqlDocumentSource]]:
+    query = select(SqlDocumentSource).join(SqlDocumentSource.document)
+    if topic_id is None:
+        query = query.where(SqlKnowledgeBaseDocument.topic_id.is_(None))
+    else:
+        query = query.where(SqlKnowledgeBaseDocument.topic_id == topic_id)
+    # the latest fetch first: its validators are the ones to send
+    return query.order_by(SqlDocumentSource.fetched_at.desc())
+
+
+def record_fetch(
+    session: Session, source: StoredSource, source_content: SourceContent | None
+) -> None:
+    """Record that `source` was found unchanged, with new validators if fetched"""
+    values: dict[str, Any] = {"fetched_at": datetime.now(timezone.utc)}
+    if source_content is not None:
+        values["etag"] = source_content.get("etag")
+        values["last_modified"] = source_content.get("last_modified")
+    session.execute(
+        update(SqlDocumentSource)
+        .where(
+            SqlDocumentSource.document_id.in_(source["document_ids"]),
+            SqlDocumentSource.url == source["url"],
+        )
+        .values(**values)
+    )
+
+
+def delete_sources(session: Session, url: str, document_ids: list[str]) -> list[str]:
+    """Forget `url` as a source of the documents, and delete those left without
+    sources; return the latter's ids"""
+    session.execute(
+        delete(SqlDocumentSource).where(
+            SqlDocumentSource.document_id.in_(document_ids),
+            SqlDocumentSource.url == url,
+        )
+    )
+    # still yielded by other URLs
+    sourced = set(
+        session.scalars(
+            select(SqlDocumentSource.document_id).where(
+                SqlDocumentSource.document_id.in_(document_ids)
+            )
+        )
+    )
+    deleted = [id for id in document_ids if id not in sourced]
+    if deleted:
+        session.execute(
+            delete(SqlKnowledgeBaseDocument).where(
+                SqlKnowledgeBaseDocument.id.in_(deleted)
+            )
+        )
+    return deleted
+
+
+def to_source_values(
+    url: str, source_content: SourceContent, extracted_data: list[IndexableData]
+) -> list[dict[str, Any]]:
+    fetched_at = datetime.now(timezone.utc)
+    content_hash = hash_content(source_content["data"])
+    return [
+        {
+            "document_id": r.id(),
+            "url": url,
+            "etag": source_content.get("etag"),
+            "last_modified": source_content.get("last_modified"),
+            "content_hash": content_hash,
+            "fetched_at": fetched_at,
+        }
+        for r in extracted_data
+    ]
@@ -1,10 +1,13 @@
-from typing import TypedDict, Literal
+from typing import NotRequired, TypedDict, Literal
 from ..data import IndexableData
 
 
 class SourceContent(TypedDict):
     data: str
     type: Literal["text/html", "text/plain"]  # TODO 'application/vnd.ms-excel'
+    # validators of the HTTP response, if sent
+    etag: NotRequired[str]
+    last_modified: NotRequired[str]
 
 
 class AgentState(TypedDict):
@@ -0,0 +1,290 @@
+"""Streaming ingestion of large local files, in bounded memory.
+
+Files over `indexing.streaming_threshold` bytes are not read whole. Instead:
+
+- they are read in blocks of `indexing.streaming_block_size` bytes and
+  decoded incrementally;
+- the text of HTML files is extracted block by block by an event-driven
+  parser (see `data.html_text`), as `TextualData` would;
+- text is chunked as it accumulates, holding a window of a few chunks;
+- chunks go to the vector store in batches of `indexing.embedding_batch_size`
+  through a `ChunkBatcher`, each batch being written before the next is read.
+
+The stored document of a streamed file holds its metadata only; its text is
+in its chunks. Its id hashes the file's bytes, read once beforehand, so that
+chunk ids are known before any is written and an unchanged file is skipped.
+"""
+
+import asyncio
+import codecs
+import hashlib
+import itertools
+import json
+import os
+import time
+from typing import BinaryIO, Iterator, Literal
+from urllib.parse import urlparse
+from langchain.schema import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from .. import services
+from ..config import Config
+from ..data.html_text import HtmlTextParser
+from ..db import SqlKnowledgeBaseDocument, insert_or_ignore
+from ..util import sniff_text_format
+from ..workflow_query.caches import increment_answer_generations, invalidate_answers
+from .batch import IngestOutcome
+from .batching import ChunkBatcher
+from .node_index_and_store import select_stored_topic_ids
+
+# chunks of text held before splitting, the last one being carried over
+WINDOW_CHUNKS = 8
+
+
+def streamed_path(url: str, config: Config) -> str | None:
+    """Path of the local file at `url` if it is to be streamed"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("", "file"):
+        return None
+    path = parsed.path
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    return path if size > config.indexing.streaming_threshold else None
+
+
+async def aingest_stream(
+    url: str,
+    path: str,
+    topic_id: str | None,
+    config: Config,
+    batcher: ChunkBatcher,
+    write_lock: asyncio.Lock,
+) -> IngestOutcome:
+    """Ingest the local file at `path` as one document, without reading it whole"""
+    log = services.get_logger(config)
+    started = time.perf_counter()
+    block_size = config.indexing.streaming_block_size
+
+    doc_id: str | None = None
+
+    def outcome(
+        status: Literal["ingested", "unchanged", "empty", "failed"],
+        chunks: int = 0,
+        error: str | None = None,
+    ) -> IngestOutcome:
+        return {
+            "url": url,
+            "status": status,
+            "documents": 0 if status in ("empty", "failed") else 1,
+            "new_documents": 1 if status == "ingested" else 0,
+            "skipped_documents": 1 if status == "unchanged" else 0,
+            "chunks": chunks,
+            "document_ids": (
+                [doc_id] if status in ("ingested", "unchanged") and doc_id else []
+            ),
+            "error": error,
+            "seconds": time.perf_counter() - started,
+        }
+
+    try:
+        doc_id = await asyncio.to_thread(hash_file, path, block_size)
+        stored = await asyncio.to_thread(select_stored_topic, doc_id, config)
+        if stored == (topic_id,):
+            return outcome("unchanged")
+
+        batch_size = config.indexing.embedding_batch_size
+        chunker = TextChunker(config.indexing.chunk_size, config.indexing.chunk_overlap)
+        metadata: dict[str, str | float] = {
+            "source_id": doc_id,
+            "source_url": url,
+            "topic_id": "UNCATEGORIZED" if topic_id is None else topic_id,
+            "ingested_at": time.time(),
+        }
+        batch: list[Document] = []
+        count = 0
+        pieces = read_text(path, block_size)
+        while True:
+            # reading and parsing are CPU-bound: off the event loop
+            piece = await asyncio.to_thread(next, pieces, None)
+            if piece is None:
+                chunks = chunker.close()
+            else:
+                text, title = piece
+                if title:
+                    metadata["title"] = title
+                chunks = chunker.add(text)
+
+            for chunk in chunks:
+                batch.append(
+                    Document(
+                        id=f"{doc_id}-{count}",
+                        page_content=chunk,
+                        metadata={**metadata, "chunk_id": count},
+                    )
+                )
+                count += 1
+            while len(batch) >= batch_size or (piece is None and batch):
+                # waits for the write: no more than a batch is read ahead
+                await batcher.add(batch[:batch_size])
+                batch = batch[batch_size:]
+            if piece is None:
+                break
+
+        if not count:
+            return outcome("empty")
+        async with write_lock:
+            await asyncio.to_thread(
+                store_streamed_document,
+                doc_id,
+                url,
+                path,
+                metadata.get("title"),
+                count,
+                stored,
+                topic_id,
+                config,
+            )
+        invalidate_answers(config, topic_id)
+        if stored is not None:
+            # moved from another topic, whose answers cite it no more
+            invalidate_answers(config, stored[0])
+
+    except Exception as e:
+        log.warning(f"Failed to ingest {url}: {e}")
+        return outcome("failed", error=f"{e.__class__.__name__}: {e}")
+
+    return outcome("ingested", chunks=count)
+
+
+def read_text(path: str, block_size: int) -> Iterator[tuple[str, str | None]]:
+    """Text of a file, block by block, with the document's title once known;
+    for HTML, its text nodes one per line"""
+    with open(path, "rb") as file:
+        blocks = read_blocks(file, block_size)
+        first = next(blocks, "")
+        if sniff_text_format(first) == "text/plain":
+            for text in itertools.chain([first], blocks):
+                yield text, None
+            return
+
+        parser = HtmlTextParser()
+        for text in itertools.chain([first], blocks):
+            parser.feed(text)
+            yield "".join(f"{t}\n" for t in parser.drain()), parser.title or parser.h1
+        parser.close()
+        yield "".join(f"{t}\n" for t in parser.drain()), parser.title or parser.h1
+
+
+def read_blocks(file: BinaryIO, block_size: int) -> Iterator[str]:
+    """Decoded blocks of a file, a character never being split across blocks"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for block in iter(lambda: file.read(block_size), b""):
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+class TextChunker:
+    """Splits text given in pieces into chunks of `chunk_size` characters with
+    `chunk_overlap`, holding at most about `WINDOW_CHUNKS` chunks of text.
+
+    Chunks are those of `RecursiveCharacterTextSplitter` on each window, so
+    their boundaries may differ slightly from those of the whole text's."""
+
+    def __init__(self, chunk_size: int, chunk_overlap: int) -> None:
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        )
+        self.window = chunk_size * WINDOW_CHUNKS
+        self.pieces: list[str] = []
+        self.length = 0
+
+    def add(self, text: str) -> list[str]:
+        """Chunks completed by `text`"""
+        self.pieces.append(text)
+        self.length += len(text)
+        if self.length < self.window:
+            return []
+
+        buffered = "".join(self.pieces)
+        chunks = self.splitter.create_documents([buffered])
+        # the last chunk may go on in the text to come: split again with it
+        tail = buffered[chunks[-1].metadata["start_index"] :] if chunks else ""
+        self.pieces, self.length = [tail], len(tail)
+        return [chunk.page_content for chunk in chunks[:-1]]
+
+    def close(self) -> list[str]:
+        """Chunks of the remaining text"""
+        buffered = "".join(self.pieces)
+        self.pieces, self.length = [], 0
+        return self.splitter.split_text(buffered)
+
+
+def hash_file(path: str, block_size: int) -> str:
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            content_hash.update(block)
+    return f"StreamedTextualData-{content_hash.hexdigest()[:8]}"
+
+
+def select_stored_topic(doc_id: str, config: Config) -> tuple[str | None] | None:
+    """(topic id,) of the stored document, None if not stored"""
+    with Session(services.get_db(config)) as session:
+        row = session.execute(select_stored_topic_ids([doc_id])).first()
+        return None if row is None else (row[1],)
+
+
+def store_streamed_document(
+    doc_id: str,
+    url: str,
+    path: str,
+    title: str | None,
+    chunks: int,
+    stored: tuple[str | None] | None,
+    topic_id: str | None,
+    config: Config,
+) -> None:
+    """Record a streamed document once its chunks are written, so that an
+    interrupted stream is ingested again; `stored` is (its previous topic id,)
+    if it was stored already"""
+    with Session(services.get_db(config)) as session:
+        with session.begin():
+            session.execute(
+                increment_answer_generations(
+                    session.get_bind().dialect.name,
+                    [topic_id] if stored is None else [topic_id, stored[0]],
+                )
+            )
+            if stored is not None:
+                # moved from another topic: its chunks were written again
+                session.execute(
+                    update(SqlKnowledgeBaseDocument)
+                    .where(SqlKnowledgeBaseDocument.id == doc_id)
+                    .values(topic_id=topic_id)
+                )
+                return
+            session.execute(
+                insert_or_ignore(
+                    session.get_bind().dialect.name, SqlKnowledgeBaseDocument
+                ),
+                [
+                    {
+                        "id": doc_id,
+                        # the text is only in the chunks
+                        "content": "",
+                        "data": json.dumps(
+                            {
+                                "title": title,
+                                "source_url": url,
+                                "size": os.path.getsize(path),
+                                "chunks": chunks,
+                            }
+                        ),
+                        "topic_id": topic_id,
+                    }
+                ],
+            )
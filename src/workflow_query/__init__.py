@@ -1,17 +1,38 @@
 from .state import AgentState
 from .graph import get_graph
-from .node_classify_query import classify_query
-from .node_retrieve_from_weather_service import retrieve_from_weather_service
-from .node_generate import generate
-from .node_retrieve_from_knowledge_base import retrieve_from_knowledge_base
-from .node_rerank__STUB import rerank
+from .node_classify_query import classify_query, aclassify_query
+from .node_retrieve_from_weather_service import (
+    retrieve_from_weather_service,
+    aretrieve_from_weather_service,
+)
+from .node_generate import generate, agenerate
+from .node_retrieve_from_knowledge_base import (
+    retrieve_from_knowledge_base,
+    aretrieve_from_knowledge_base,
+)
+from .node_rerank__STUB import rerank, arerank
+from .node_answer_cache import (
+    lookup_cached_answer,
+    alookup_cached_answer,
+    cache_answer,
+    acache_answer,
+)
 
 __all__ = [
     "AgentState",
     "get_graph",
     "classify_query",
+    "aclassify_query",
     "retrieve_from_weather_service",
+    "aretrieve_from_weather_service",
     "generate",
+    "agenerate",
     "retrieve_from_knowledge_base",
+    "aretrieve_from_knowledge_base",
     "rerank",
+    "arerank",
+    "lookup_cached_answer",
+    "alookup_cached_answer",
+    "cache_answer",
+    "acache_answer",
 ]
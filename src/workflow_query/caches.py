@@ -0,0 +1,163 @@
+"""Per-process caches for lookups the query workflow repeats on every query.
+
+Caches are held in the service registry, keyed by database configuration,
+so they are dropped together with pooled services on `services.shutdown()`.
+
+Documents are also ingested by other processes (workers running jobs, the
+CLI): transactions changing the documents of a topic increment its row in
+`answer_generations`, and cached answers for a topic are dropped when a
+lookup finds that its generation changed since the last one.
+"""
+
+import re
+from typing import Iterable, TypedDict
+from langchain.schema import Document
+from sqlalchemy import Insert, Select, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import services
+from ..cache import SemanticCache, TTLCache
+from ..config import Config
+from ..db import SqlAnswerGeneration, SqlTopic
+
+
+def get_topic_cache(config: Config) -> TTLCache[str, SqlTopic]:
+    return services.registry.get_or_create(
+        "topic_cache",
+        config.db.model_dump_json(),
+        lambda: TTLCache(
+            "topic",
+            maxsize=config.caching.topic_maxsize,
+            ttl=config.caching.topic_ttl,
+        ),
+    )
+
+
+def get_classification_cache(config: Config) -> TTLCache[tuple[str, str], bool]:
+    """Whether a (topic id, normalized query) pair is weather-related"""
+    return services.registry.get_or_create(
+        "classification_cache",
+        config.db.model_dump_json(),
+        lambda: TTLCache(
+            "classification",
+            maxsize=config.caching.classification_maxsize,
+            ttl=config.caching.classification_ttl,
+        ),
+    )
+
+
+class CachedAnswer(TypedDict):
+    answer: str
+    sources: list[Document]
+
+
+def get_answer_cache(config: Config) -> SemanticCache[str | None, CachedAnswer]:
+    """Answers by topic id and query embedding"""
+    return services.registry.get_or_create(
+        "answer_cache",
+        config.db.model_dump_json() + services.embeddings_key(config),
+        lambda: SemanticCache(
+            "answer",
+            maxsize=config.caching.answer_maxsize,
+            ttl=config.caching.answer_ttl,
+            threshold=config.caching.answer_similarity_threshold,
+        ),
+    )
+
+
+def get_answer_generations(config: Config) -> dict[str | None, int]:
+    """Generations of the topics' answers as of this process's last lookups"""
+    return services.registry.get_or_create(
+        "answer_generations",
+        config.db.model_dump_json() + services.embeddings_key(config),
+        dict,
+    )
+
+
+def to_topic_key(topic_id: str | None) -> str:
+    return "" if topic_id is None else topic_id
+
+
+def select_answer_generation(topic_id: str | None) -> Select[tuple[int]]:
+    return select(SqlAnswerGeneration.generation).where(
+        SqlAnswerGeneration.topic_key == to_topic_key(topic_id)
+    )
+
+
+def increment_answer_generations(
+    dialect_name: str, topic_ids: Iterable[str | None]
+) -> Insert:
+    """INSERT statement incrementing the generations of the topics' answers, to
+    be executed in the transaction that changes their documents"""
+    values = [
+        {"topic_key": key, "generation": 1}
+        for key in sorted({to_topic_key(topic_id) for topic_id in topic_ids})
+    ]
+    if dialect_name == "postgresql":
+        insert = postgresql.insert(SqlAnswerGeneration)
+    elif dialect_name == "sqlite":
+        insert = sqlite.insert(SqlAnswerGeneration)
+    else:
+        raise Exception(f"Not implemented: answer generations for {dialect_name}")
+    return insert.values(values).on_conflict_do_update(
+        index_elements=[SqlAnswerGeneration.topic_key],
+        set_={"generation": SqlAnswerGeneration.generation + 1},
+    )
+
+
+def sync_answer_generation(
+    config: Config, topic_id: str | None, stored_generation: int | None
+) -> None:
+    """Forget cached answers for a topic whose stored generation changed, i.e.
+    whose documents were changed by another process"""
+    generation = stored_generation or 0
+    seen = get_answer_generations(config)
+    if seen.setdefault(topic_id, generation) != generation:
+        get_answer_cache(config).invalidate(topic_id)
+        seen[topic_id] = generation
+
+
+def find_topic(config: Config, topic_id: str) -> SqlTopic | None:
+    cache = get_topic_cache(config)
+    topic = cache.get(topic_id)
+    if topic is None:
+        with Session(services.get_db(config)) as session:
+            topic = session.query(SqlTopic).filter(SqlTopic.id == topic_id).first()
+        # rows are cached detached, with their column attributes loaded
+        if topic is not None:
+            cache.set(topic_id, topic)
+    return topic
+
+
+async def afind_topic(config: Config, topic_id: str) -> SqlTopic | None:
+    cache = get_topic_cache(config)
+    topic = cache.get(topic_id)
+    if topic is None:
+        async with AsyncSession(services.get_async_db(config)) as session:
+            topic = await session.scalar(
+                select(SqlTopic).where(SqlTopic.id == topic_id)
+            )
+        if topic is not None:
+            cache.set(topic_id, topic)
+    return topic
+
+
+def invalidate_topic(config: Config, topic_id: str) -> None:
+    """Forget the topic row and anything derived from it"""
+    get_topic_cache(config).invalidate(topic_id)
+    get_classification_cache(config).invalidate_where(lambda key: key[0] == topic_id)
+    invalidate_answers(config, topic_id)
+
+
+def invalidate_answers(config: Config, topic_id: str | None) -> None:
+    """Forget this process's cached answers for a topic whose documents
+    changed; other processes see the generation incremented with the change."""
+    get_answer_cache(config).invalidate(topic_id)
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, whitespace and trailing punctuation so trivially different
+    spellings of the same question share a cache entry"""
+    return re.sub(r"\s+", " ", query).strip().strip("?!. ").lower()
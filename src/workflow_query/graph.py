@@ -1,46 +1,83 @@
+import functools
 import pprint
-from typing import Literal
-from langgraph.graph import StateGraph, END
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
 
 from ..config import Config
 from .state import AgentState
-from .node_retrieve_from_knowledge_base import retrieve_from_knowledge_base
-from .node_retrieve_from_weather_service import retrieve_from_weather_service
-from .node_classify_query import classify_query
-from .node_generate import generate
-from .node_rerank__STUB import rerank
+from .node_retrieve_from_knowledge_base import (
+    retrieve_from_knowledge_base,
+    aretrieve_from_knowledge_base,
+)
+from .node_retrieve_from_weather_service import (
+    retrieve_from_weather_service,
+    aretrieve_from_weather_service,
+)
+from .node_classify_query import classify_query, aclassify_query
+from .node_generate import generate, agenerate
+from .node_rerank__STUB import rerank, arerank
+from .node_answer_cache import (
+    lookup_cached_answer,
+    alookup_cached_answer,
+    cache_answer,
+    acache_answer,
+    is_cache_hit,
+)
 
 
-def route_based_on_query_classification(
-    state: AgentState,
-) -> Literal["retrieve_from_weather_service", "retrieve_from_knowledge_base"]:
-    if any(
-        source["type"] == "weather" for source in state["external_knowledge_sources"]
-    ):
-        return "retrieve_from_weather_service"
-    else:
-        return "retrieve_from_knowledge_base"
+@functools.cache
+def get_graph():
+    """Return the compiled query graph, built on first use and shared by all requests.
 
+    Run it with `invoke` from sync code and `ainvoke` from async code.
 
-def get_graph():
+    Knowledge base retrieval only depends on the query and topic, so it
+    runs in parallel with classification and the external sources the
+    classification selects; both branches join before reranking. Queries
+    similar enough to one already answered for the same topic skip the
+    workflow entirely.
+    """
     builder = StateGraph(AgentState, Config)
-    builder.set_entry_point("classify_query")
-    builder.add_node("classify_query", classify_query)
-    builder.add_node("retrieve_from_weather_service", retrieve_from_weather_service)
-    builder.add_node("retrieve_from_knowledge_base", retrieve_from_knowledge_base)
-    builder.add_node("rerank", rerank)
-    builder.add_node("generate", generate)
+    builder.add_node(
+        "lookup_cached_answer",
+        RunnableLambda(lookup_cached_answer, afunc=alookup_cached_answer),
+    )
+    builder.add_node(
+        "classify_query", RunnableLambda(classify_query, afunc=aclassify_query)
+    )
+    builder.add_node(
+        "retrieve_from_weather_service",
+        RunnableLambda(
+            retrieve_from_weather_service, afunc=aretrieve_from_weather_service
+        ),
+    )
+    builder.add_node(
+        "retrieve_from_knowledge_base",
+        RunnableLambda(
+            retrieve_from_knowledge_base, afunc=aretrieve_from_knowledge_base
+        ),
+    )
+    builder.add_node("rerank", RunnableLambda(rerank, afunc=arerank))
+    builder.add_node("generate", RunnableLambda(generate, afunc=agenerate))
+    builder.add_node("cache_answer", RunnableLambda(cache_answer, afunc=acache_answer))
+    builder.add_edge(START, "lookup_cached_answer")
     builder.add_conditional_edges(
-        "classify_query",
-        route_based_on_query_classification,
-        {
-            "retrieve_from_weather_service": "retrieve_from_weather_service",
-            "retrieve_from_knowledge_base": "retrieve_from_knowledge_base",
-        },
+        "lookup_cached_answer",
+        route_after_cache_lookup,
+        ["classify_query", "retrieve_from_knowledge_base", END],
+    )
+    builder.add_edge("classify_query", "retrieve_from_weather_service")
+    builder.add_edge(
+        ["retrieve_from_knowledge_base", "retrieve_from_weather_service"], "rerank"
     )
-    builder.add_edge("retrieve_from_weather_service", "retrieve_from_knowledge_base")
-    builder.add_edge("retrieve_from_knowledge_base", "rerank")
     builder.add_edge("rerank", "generate")
-    builder.add_edge("generate", END)
+    builder.add_edge("generate", "cache_answer")
+    builder.add_edge("cache_answer", END)
     graph = builder.compile()
     return graph
+
+
+def route_after_cache_lookup(state: AgentState) -> list[str]:
+    if is_cache_hit(state):
+        return [END]
+    return ["classify_query", "retrieve_from_knowledge_base"]
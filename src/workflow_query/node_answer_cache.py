@@ -0,0 +1,116 @@
+from typing import TypedDict
+from langchain.schema import AIMessage, BaseMessage, Document
+from langchain_core.runnables import RunnableConfig
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import services
+from ..config import Config
+from .state import AgentState, AnswerCacheLookup, get_query
+from .caches import get_answer_cache, select_answer_generation, sync_answer_generation
+
+
+class LookupCachedAnswerStateUpdate(TypedDict, total=False):
+    answer_cache: AnswerCacheLookup | None
+    query: str
+    messages: list[BaseMessage]
+    retrieved_knowledge: list[Document]
+
+
+def lookup_cached_answer(
+    state: AgentState, config: RunnableConfig
+) -> LookupCachedAnswerStateUpdate:
+    """Answer from the cache if a similar query was answered for the same topic."""
+    conf = Config.from_runnable_config(config)
+    if conf.caching.answer_maxsize == 0:
+        return {"answer_cache": None}
+
+    # the topic's documents may have changed in another process
+    with Session(services.get_db(conf)) as session:
+        stored_generation = session.scalar(select_answer_generation(state["topic_id"]))
+    sync_answer_generation(conf, state["topic_id"], stored_generation)
+
+    query = get_query(state)
+    query_embedding = services.get_embeddings(conf).embed_query(query)
+    return to_state_update(conf, state, query, query_embedding)
+
+
+async def alookup_cached_answer(
+    state: AgentState, config: RunnableConfig
+) -> LookupCachedAnswerStateUpdate:
+    conf = Config.from_runnable_config(config)
+    if conf.caching.answer_maxsize == 0:
+        return {"answer_cache": None}
+
+    async with AsyncSession(services.get_async_db(conf)) as session:
+        stored_generation = await session.scalar(
+            select_answer_generation(state["topic_id"])
+        )
+    sync_answer_generation(conf, state["topic_id"], stored_generation)
+
+    query = get_query(state)
+    query_embedding = await services.get_embeddings(conf).aembed_query(query)
+    return to_state_update(conf, state, query, query_embedding)
+
+
+def cache_answer(state: AgentState, config: RunnableConfig) -> None:
+    """Remember the generated answer, unless it depends on external knowledge."""
+    conf = Config.from_runnable_config(config)
+
+    lookup = state["answer_cache"]
+    # e.g. weather: valid for the moment it was generated only
+    if lookup is None or state["external_knowledge_sources"]:
+        return None
+    assert lookup["query_embedding"] is not None
+
+    answer = state["messages"][-1].content
+    assert isinstance(answer, str)
+
+    # skipped if the topic's documents changed while the answer was generated
+    get_answer_cache(conf).set(
+        state["topic_id"],
+        lookup["query_embedding"],
+        {"answer": answer, "sources": state["retrieved_knowledge"]},
+        generation=lookup["generation"],
+    )
+
+    return None
+
+
+async def acache_answer(state: AgentState, config: RunnableConfig) -> None:
+    # in-memory only, nothing to await
+    return cache_answer(state, config)
+
+
+def is_cache_hit(state: AgentState) -> bool:
+    return state["answer_cache"] is not None and state["answer_cache"]["hit"]
+
+
+def to_state_update(
+    conf: Config, state: AgentState, query: str, query_embedding: list[float]
+) -> LookupCachedAnswerStateUpdate:
+    cache = get_answer_cache(conf)
+    # read before the lookup, so that an invalidation racing with the
+    # generation of the answer prevents it from being cached
+    generation = cache.generation(state["topic_id"])
+    cached = cache.get(state["topic_id"], query_embedding)
+
+    if cached is None:
+        return {
+            "answer_cache": {
+                "hit": False,
+                "query_embedding": query_embedding,
+                "generation": generation,
+            }
+        }
+
+    return {
+        "answer_cache": {
+            "hit": True,
+            "query_embedding": None,
+            "generation": generation,
+        },
+        "query": query,
+        "messages": [AIMessage(content=cached["answer"])],
+        "retrieved_knowledge": cached["sources"],
+    }
@@ -1,14 +1,13 @@
 from typing import TypedDict
 from langchain_core.prompts.prompt import PromptTemplate
-from langchain.schema import HumanMessage
 from langchain_core.runnables import RunnableConfig
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
 
-from .. import services
-from ..db import SqlTopic
+from .. import metrics, services
 from ..config import Config
-from ..workflow_query.state import AgentState, ExternalKnowledgeSource
+from ..workflow_query.state import AgentState, ExternalKnowledgeSource, get_query
+from .caches import afind_topic, find_topic, get_classification_cache, normalize_query
+from .weather_classification import classify_locally, aclassify_locally
 
 
 class ClassifyStateUpdate(TypedDict):
@@ -17,36 +16,108 @@ class ClassifyStateUpdate(TypedDict):
 
 
 def classify_query(state: AgentState, config: RunnableConfig) -> ClassifyStateUpdate:
-    """Detects if the topic is a location and the query is weather-related."""
+    """Detects if the topic is a location and the query is weather-related.
+
+    Cheap local classifiers get the first say; the LLM is only asked when
+    none of them is confident enough.
+    """
 
     conf = Config.from_runnable_config(config)
-    db = services.get_db(conf)
 
-    last_message = state["messages"][-1]
-    assert isinstance(last_message, HumanMessage)
-    query = last_message.content
-    assert isinstance(query, str)
+    query = get_query(state)
+    topic_id = state["topic_id"]
 
-    if state["topic_id"] is None:
+    if topic_id is None:
         return {"query": query, "external_knowledge_sources": []}
 
-    with Session(db) as session:
-        topic = session.query(SqlTopic).filter(SqlTopic.id == state["topic_id"]).first()
-        if topic is None:
-            raise ValueError(f"Topic with id {state['topic_id']} not found")
-        location = topic.name
+    topic = find_topic(conf, topic_id)
+    if topic is None:
+        raise ValueError(f"Topic with id {topic_id} not found")
+    location = topic.name
+
+    cache = get_classification_cache(conf)
+    cache_key = (topic_id, normalize_query(query))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return to_state_update(query, location, cached)
+
+    decision = classify_locally(query, conf)
+    if decision is not None:
+        is_weather_related = decision["is_weather_related"]
+        record_tier(decision["tier"])
+    else:
+        response = (
+            services.get_llm(conf)
+            .with_structured_output(WeatherQueryClassification)
+            .invoke(
+                CLASSIFICATION_PROMPT_TEMPLATE.format(query=query, location=location)
+            )
+        )
+        is_weather_related = parse_llm_response(response)
+        record_tier("llm")
+
+    cache.set(cache_key, is_weather_related)
+    return to_state_update(query, location, is_weather_related)
+
+
+async def aclassify_query(
+    state: AgentState, config: RunnableConfig
+) -> ClassifyStateUpdate:
+    conf = Config.from_runnable_config(config)
+
+    query = get_query(state)
+    topic_id = state["topic_id"]
 
-    response = (
-        services.get_llm(conf)
-        .with_structured_output(WeatherQueryClassification)
-        .invoke(CLASSIFICATION_PROMPT_TEMPLATE.format(query=query, location=location))
-    )
+    if topic_id is None:
+        return {"query": query, "external_knowledge_sources": []}
 
+    topic = await afind_topic(conf, topic_id)
+    if topic is None:
+        raise ValueError(f"Topic with id {topic_id} not found")
+    location = topic.name
+
+    cache = get_classification_cache(conf)
+    cache_key = (topic_id, normalize_query(query))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return to_state_update(query, location, cached)
+
+    decision = await aclassify_locally(query, conf)
+    if decision is not None:
+        is_weather_related = decision["is_weather_related"]
+        record_tier(decision["tier"])
+    else:
+        response = await (
+            services.get_llm(conf)
+            .with_structured_output(WeatherQueryClassification)
+            .ainvoke(
+                CLASSIFICATION_PROMPT_TEMPLATE.format(query=query, location=location)
+            )
+        )
+        is_weather_related = parse_llm_response(response)
+        record_tier("llm")
+
+    cache.set(cache_key, is_weather_related)
+    return to_state_update(query, location, is_weather_related)
+
+
+def parse_llm_response(response) -> bool:
     # workaround for https://github.com/langchain-ai/langchain/discussions/28853
     assert isinstance(response, WeatherQueryClassification)
+    return response.is_weather_related
+
+
+def record_tier(tier: str) -> None:
+    """Count which tier settled the classification, for hit-rate metrics"""
+    metrics.increment("classify_query.classified")
+    metrics.increment(f"classify_query.tier.{tier}")
+
 
+def to_state_update(
+    query: str, location: str, is_weather_related: bool
+) -> ClassifyStateUpdate:
     external_knowledge_sources: list[ExternalKnowledgeSource] = []
-    if response.is_weather_related:
+    if is_weather_related:
         external_knowledge_sources.append({"type": "weather", "location": location})
 
     return {
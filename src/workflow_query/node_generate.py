@@ -2,12 +2,12 @@ import pprint
 from typing import TypedDict
 from langchain.schema import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
-from sqlalchemy.orm import Session
 
 from ..config import Config
 from .. import services
 from ..db import SqlTopic
 from .state import AgentState
+from .caches import afind_topic, find_topic
 
 
 class GenerateStateUpdate(TypedDict):
@@ -20,6 +20,33 @@ def generate(state: AgentState, config: RunnableConfig) -> GenerateStateUpdate:
     query = state["query"]
     assert query is not None
 
+    topic = find_topic(conf, state["topic_id"]) if state["topic_id"] else None
+
+    prompt = build_prompt(state, query, topic)
+
+    response = services.get_llm(conf).invoke(prompt)
+
+    return {"messages": [response]}
+
+
+async def agenerate(state: AgentState, config: RunnableConfig) -> GenerateStateUpdate:
+    conf = Config.from_runnable_config(config)
+
+    query = state["query"]
+    assert query is not None
+
+    topic = await afind_topic(conf, state["topic_id"]) if state["topic_id"] else None
+
+    prompt = build_prompt(state, query, topic)
+
+    response = await services.get_llm(conf).ainvoke(prompt)
+
+    return {"messages": [response]}
+
+
+def build_prompt(
+    state: AgentState, query: str, topic: SqlTopic | None
+) -> list[BaseMessage]:
     system_message_content = (
         "You are an assistant for question-answering tasks. "
         "Use the following pieces of retrieved context to answer "
@@ -29,21 +56,11 @@ def generate(state: AgentState, config: RunnableConfig) -> GenerateStateUpdate:
         "\n\n"
     )
 
-    if state["topic_id"]:
-        db = services.get_db(conf)
-        with Session(db) as session:
-            topic = (
-                session.query(SqlTopic).filter(SqlTopic.id == state["topic_id"]).first()
-            )
-            if topic:
-                system_message_content += f"Topic: {topic}\n\n"
+    if topic:
+        system_message_content += f"Topic: {topic}\n\n"
 
     system_message_content += "\n\n".join(
         doc.page_content for doc in state["retrieved_knowledge"]
     )
 
-    prompt = [SystemMessage(system_message_content), HumanMessage(query)]
-
-    response = services.get_llm(conf).invoke(prompt)
-
-    return {"messages": [response]}
+    return [SystemMessage(system_message_content), HumanMessage(query)]
@@ -6,3 +6,8 @@ from .state import AgentState
 def rerank(state: AgentState, config: RunnableConfig) -> None:
     "[STUB] use LLM to prioritize documents based on semantic relevance to the query."
     pass
+
+
+async def arerank(state: AgentState, config: RunnableConfig) -> None:
+    "[STUB] async variant of rerank()"
+    pass
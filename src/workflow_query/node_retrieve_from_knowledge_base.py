@@ -5,7 +5,7 @@ from langchain_core.runnables import RunnableConfig
 
 from .. import services
 from ..config import Config
-from .state import AgentState
+from .state import AgentState, get_query
 
 
 class RetrieveStateUpdate(TypedDict):
@@ -17,24 +17,49 @@ def retrieve_from_knowledge_base(
 ) -> RetrieveStateUpdate:
     conf = Config.from_runnable_config(config)
 
-    query = state["query"]
-    assert query is not None
+    # runs concurrently with `classify_query`, so `query` may not be set yet
+    query = get_query(state)
 
+    documents_with_scores = services.get_vector_store(
+        conf
+    ).similarity_search_with_relevance_scores(
+        query, k=2, filter=get_metadata_filter(state)
+    )
+
+    return to_state_update(conf, documents_with_scores)
+
+
+async def aretrieve_from_knowledge_base(
+    state: AgentState, config: RunnableConfig
+) -> RetrieveStateUpdate:
+    conf = Config.from_runnable_config(config)
+
+    query = get_query(state)
+
+    documents_with_scores = await services.get_vector_store(
+        conf
+    ).asimilarity_search_with_relevance_scores(
+        query, k=2, filter=get_metadata_filter(state)
+    )
+
+    return to_state_update(conf, documents_with_scores)
+
+
+def get_metadata_filter(state: AgentState) -> dict[str, str]:
     if state["topic_id"] is None:
-        metadata_filter = {"topic_id": "UNCATEGORIZED"}
+        return {"topic_id": "UNCATEGORIZED"}
     else:
-        metadata_filter = {"topic_id": state["topic_id"]}
+        return {"topic_id": state["topic_id"]}
 
-    documents_with_scores = services.get_vector_store(
-        conf
-    ).similarity_search_with_relevance_scores(query, k=2, filter=metadata_filter)
 
+def to_state_update(
+    conf: Config,
+    documents_with_scores: list[tuple[Document, float]],
+) -> RetrieveStateUpdate:
     most_relevant_documents = [
         doc
         for doc, score in documents_with_scores
         if score >= conf.vector_store.score_threshold
     ]
 
-    return {
-        "retrieved_knowledge": [*state["retrieved_knowledge"], *most_relevant_documents]
-    }
+    return {"retrieved_knowledge": most_relevant_documents}
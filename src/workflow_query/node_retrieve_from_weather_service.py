@@ -1,10 +1,13 @@
+import logging
 from typing import TypedDict
 from langchain_core.runnables.config import RunnableConfig
 from langchain.schema import Document
-from .. import services
 from ..config import Config
+from ..weather import WeatherReport, WeatherUnavailableError, get_weather_service
 from ..workflow_query.state import AgentState
 
+logger = logging.getLogger()
+
 
 class FetchWeatherInfoStateUpdate(TypedDict):
     retrieved_knowledge: list[Document]
@@ -12,9 +15,43 @@ class FetchWeatherInfoStateUpdate(TypedDict):
 
 def retrieve_from_weather_service(
     state: AgentState, config: RunnableConfig
+) -> FetchWeatherInfoStateUpdate:
+    """Fetch current weather, if `classify_query` requested it; no-op otherwise."""
+    conf = Config.from_runnable_config(config)
+
+    location = get_weather_location(state)
+    if location is None:
+        return {"retrieved_knowledge": []}
+
+    try:
+        report = get_weather_service(conf).get(location)
+    except WeatherUnavailableError:
+        # answer from the knowledge base alone rather than fail the query
+        logger.warning("no weather information available for %r", location)
+        return {"retrieved_knowledge": []}
+
+    return to_state_update(location, report)
+
+
+async def aretrieve_from_weather_service(
+    state: AgentState, config: RunnableConfig
 ) -> FetchWeatherInfoStateUpdate:
     conf = Config.from_runnable_config(config)
 
+    location = get_weather_location(state)
+    if location is None:
+        return {"retrieved_knowledge": []}
+
+    try:
+        report = await get_weather_service(conf).aget(location)
+    except WeatherUnavailableError:
+        logger.warning("no weather information available for %r", location)
+        return {"retrieved_knowledge": []}
+
+    return to_state_update(location, report)
+
+
+def get_weather_location(state: AgentState) -> str | None:
     weather_query = next(
         (
             source
@@ -23,29 +60,22 @@ def retrieve_from_weather_service(
         ),
         None,
     )
-    if weather_query is None:
-        raise Exception("No weather query found")
-
-    location = weather_query["location"]
+    return None if weather_query is None else weather_query["location"]
 
-    weather = services.get_weather_client(conf)
-    observation = weather.weather_manager().weather_at_place(location)
 
-    # TODO: handle case in which no observation is available
-    assert observation is not None
-
-    weather_data = observation.weather
+def to_state_update(
+    location: str, report: WeatherReport
+) -> FetchWeatherInfoStateUpdate:
     weather_info = (
         f"Current weather information for {location}: "
-        f"Temperature: {weather_data.temperature('celsius')['temp']}°C, "
-        f"Feels like: {weather_data.temperature('celsius')['feels_like']}°C, "
-        f"Humidity: {weather_data.humidity}%, "
-        f"Status: {weather_data.detailed_status}"
+        f"Temperature: {report['temperature']}°C, "
+        f"Feels like: {report['feels_like']}°C, "
+        f"Humidity: {report['humidity']}%, "
+        f"Status: {report['detailed_status']}"
     )
 
     return {
         "retrieved_knowledge": [
-            *state["retrieved_knowledge"],
             Document(page_content=weather_info, id="weather-info"),
         ]
     }
@@ -1,5 +1,6 @@
-from typing import TypedDict, Literal
-from langchain.schema import Document
+import operator
+from typing import Annotated, TypedDict, Literal
+from langchain.schema import Document, HumanMessage
 from langgraph.graph import MessagesState
 
 
@@ -17,8 +18,30 @@ class NewsExternalKnowledgeSource(TypedDict):
 ExternalKnowledgeSource = WeatherExternalKnowledgeSource | NewsExternalKnowledgeSource
 
 
+class AnswerCacheLookup(TypedDict):
+    hit: bool
+    # what a miss needs to store the generated answer
+    query_embedding: list[float] | None
+    generation: int
+
+
 class AgentState(MessagesState):
     query: str | None
     topic_id: str | None
-    retrieved_knowledge: list[Document]
+    # appended to by retrieval nodes, which may run in parallel
+    retrieved_knowledge: Annotated[list[Document], operator.add]
     external_knowledge_sources: list[ExternalKnowledgeSource]
+    # set by `lookup_cached_answer`; None if the answer cache is disabled
+    answer_cache: AnswerCacheLookup | None
+
+
+def get_query(state: AgentState) -> str:
+    """The user query, available before `classify_query` has populated `query`"""
+    if state["query"] is not None:
+        return state["query"]
+
+    last_message = state["messages"][-1]
+    assert isinstance(last_message, HumanMessage)
+    query = last_message.content
+    assert isinstance(query, str)
+    return query
@@ -0,0 +1,242 @@
+"""Local, cheap tiers for deciding whether a query is about the weather.
+
+`classify_query` consults these before falling back to the LLM:
+
+1. a lexicon pass that recognizes weather vocabulary, words that have other
+   senses counting only along with another weather word;
+2. a nearest-centroid pass over embeddings of prototype queries.
+
+Each tier returns a decision with a confidence, or None to abstain.
+"""
+
+import math
+import re
+from typing import Literal, TypedDict
+from langchain_core.embeddings import Embeddings
+
+from .. import services
+from ..config import Config
+
+
+Tier = Literal["lexicon", "prototype", "llm"]
+
+
+class LocalDecision(TypedDict):
+    is_weather_related: bool
+    confidence: float
+    tier: Tier
+
+
+WEATHER_TERMS = frozenset(
+    [
+        "weather",
+        "forecast",
+        "temperature",
+        "temperatures",
+        "rain",
+        "rains",
+        "raining",
+        "rainy",
+        "snow",
+        "snows",
+        "snowing",
+        "snowy",
+        "sunny",
+        "sunshine",
+        "cloudy",
+        "overcast",
+        "humidity",
+        "humid",
+        "windy",
+        "stormy",
+        "thunderstorm",
+        "fog",
+        "foggy",
+        "mist",
+        "misty",
+        "drizzle",
+        "celsius",
+        "fahrenheit",
+        "heatwave",
+    ]
+)
+
+# weather words in some queries only, e.g. "degrees of a university" or
+# "umbrella insurance"
+AMBIGUOUS_WEATHER_TERMS = frozenset(
+    [
+        "wind",
+        "storm",
+        "degrees",
+        "umbrella",
+        "freezing",
+    ]
+)
+
+NON_WEATHER_TERMS = frozenset(
+    [
+        "museum",
+        "museums",
+        "restaurant",
+        "restaurants",
+        "eat",
+        "food",
+        "history",
+        "historical",
+        "monument",
+        "monuments",
+        "landmark",
+        "landmarks",
+        "see",
+        "visit",
+        "shopping",
+        "hotel",
+        "hotels",
+        "price",
+        "prices",
+        "cost",
+        "costs",
+        "insurance",
+        "population",
+        "founded",
+    ]
+)
+
+LEXICON_POSITIVE_CONFIDENCE = 0.95
+LEXICON_NEGATIVE_CONFIDENCE = 0.85
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+def classify_by_lexicon(query: str) -> LocalDecision | None:
+    words = set(WORD_PATTERN.findall(query.lower()))
+
+    if words & WEATHER_TERMS or len(words & AMBIGUOUS_WEATHER_TERMS) >= 2:
+        return {
+            "is_weather_related": True,
+            "confidence": LEXICON_POSITIVE_CONFIDENCE,
+            "tier": "lexicon",
+        }
+    if words & NON_WEATHER_TERMS:
+        return {
+            "is_weather_related": False,
+            "confidence": LEXICON_NEGATIVE_CONFIDENCE,
+            "tier": "lexicon",
+        }
+    return None
+
+
+WEATHER_PROTOTYPES = [
+    "what is the weather like",
+    "is it going to rain today",
+    "how hot is it right now",
+    "do I need a jacket",
+    "will it be sunny this afternoon",
+    "what's the temperature outside",
+    "is it cold there",
+    "should I bring an umbrella",
+]
+
+NON_WEATHER_PROTOTYPES = [
+    "what are some nice things to see",
+    "where can I eat well",
+    "tell me about the history of the city",
+    "which museums are worth visiting",
+    "how do I get around by public transport",
+    "what is the trend in insurance costs",
+    "what neighborhoods are good for staying",
+    "what are the opening hours of the main attractions",
+]
+
+# scale of the logistic mapping the gap between the query's similarities to
+# the two centroids to a probability: a gap of 2x this (0.1) already gives a
+# confidence of ~0.88, 3x ~0.95
+PROTOTYPE_TEMPERATURE = 0.05
+
+
+class Centroids(TypedDict):
+    weather: list[float]
+    non_weather: list[float]
+
+
+def compute_centroids(embeddings: Embeddings) -> Centroids:
+    return {
+        "weather": normalize(mean(embeddings.embed_documents(WEATHER_PROTOTYPES))),
+        "non_weather": normalize(
+            mean(embeddings.embed_documents(NON_WEATHER_PROTOTYPES))
+        ),
+    }
+
+
+def get_centroids(config: Config) -> Centroids:
+    """Prototype centroids for the configured embeddings, computed once per process"""
+    return services.registry.get_or_create(
+        "weather_prototype_centroids",
+        services.embeddings_key(config),
+        lambda: compute_centroids(services.get_embeddings(config)),
+    )
+
+
+def classify_by_prototypes(
+    query_embedding: list[float], centroids: Centroids
+) -> LocalDecision:
+    query_vector = normalize(query_embedding)
+    gap = dot(query_vector, centroids["weather"]) - dot(
+        query_vector, centroids["non_weather"]
+    )
+    weather_probability = 1 / (1 + math.exp(-gap / PROTOTYPE_TEMPERATURE))
+
+    return {
+        "is_weather_related": weather_probability >= 0.5,
+        "confidence": max(weather_probability, 1 - weather_probability),
+        "tier": "prototype",
+    }
+
+
+def classify_locally(query: str, config: Config) -> LocalDecision | None:
+    """First sufficiently confident local decision, or None to defer to the LLM"""
+    for tier in config.classification.local_tiers:
+        if tier == "lexicon":
+            decision = classify_by_lexicon(query)
+        else:
+            decision = classify_by_prototypes(
+                services.get_embeddings(config).embed_query(query),
+                get_centroids(config),
+            )
+        if is_confident(decision, config):
+            return decision
+    return None
+
+
+async def aclassify_locally(query: str, config: Config) -> LocalDecision | None:
+    for tier in config.classification.local_tiers:
+        if tier == "lexicon":
+            decision = classify_by_lexicon(query)
+        else:
+            decision = classify_by_prototypes(
+                await services.get_embeddings(config).aembed_query(query),
+                get_centroids(config),
+            )
+        if is_confident(decision, config):
+            return decision
+    return None
+
+
+def is_confident(decision: LocalDecision | None, config: Config) -> bool:
+    return (
+        decision is not None
+        and decision["confidence"] >= config.classification.confidence_threshold
+    )
+
+
+def mean(vectors: list[list[float]]) -> list[float]:
+    return [sum(components) / len(vectors) for components in zip(*vectors)]
+
+
+def dot(a: list[float], b: list[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(dot(vector, vector))
+    return vector if norm == 0 else [x / norm for x in vector]
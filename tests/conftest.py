@@ -1,13 +1,20 @@
 import os
 import base64
+import threading
+import time
 import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from langchain_core.runnables.config import RunnableConfig
 from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
 from unittest.mock import Mock
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 from fastapi.testclient import TestClient
+from src import metrics, services
 from src.db import SqlAlchemyBase
 from src.config import Config
 from src.api.app import app
@@ -17,9 +24,94 @@ from src.api.deps import get_config
 load_dotenv()
 
 
-@pytest.fixture(scope="session")
-def average_insurance_expenditures_html() -> str:
-    return """
+@pytest.fixture(autouse=True)
+def reset_services():
+    """Ensure pooled services and metrics don't leak across tests"""
+    yield
+    services.shutdown()
+    metrics.reset()
+
+
+class FakeSite(ThreadingHTTPServer):
+    """Serves `pages` by path: (status, headers, body) per successive request,
+    the last one repeating. Conditional requests matching the ETag or
+    Last-Modified header of the response get a 304."""
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeSiteHandler)
+        self.pages: dict[str, list[tuple[int, dict[str, str], bytes]]] = {}
+        self.latency = 0.0
+        self.requests: list[str] = []
+        self.request_headers: list[dict[str, str]] = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def handle_error(self, request, client_address) -> None:
+        # clients hang up on responses over the size limit
+        pass
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    server: FakeSite
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        with self.server._lock:
+            self.server.requests.append(self.path)
+            self.server.request_headers.append(dict(self.headers.items()))
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+            responses = self.server.pages.get(self.path, [(404, {}, b"not found")])
+            status, headers, body = (
+                responses.pop(0) if len(responses) > 1 else responses[0]
+            )
+        if status == 200 and (
+            headers.get("ETag", object()) == self.headers.get("If-None-Match")
+            or headers.get("Last-Modified", object())
+            == self.headers.get("If-Modified-Since")
+        ):
+            status, body = 304, b""
+        try:
+            time.sleep(self.server.latency)
+            self.send_response(status)
+            chunked = headers.get("Transfer-Encoding") == "chunked"
+            if not chunked and status != 304:
+                headers = {"Content-Length": str(len(body)), **headers}
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if chunked:
+                for start in range(0, len(body), 100):
+                    chunk = body[start : start + 100]
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+            else:
+                self.wfile.write(body)
+        finally:
+            with self.server._lock:
+                self.server.active -= 1
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_site():
+    server = FakeSite()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+AVERAGE_INSURANCE_EXPENDITURES_HTML = """
 <html>
   <head>
     <meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
@@ -100,6 +192,11 @@ Source: National Association of Insurance Commissioners (NAIC). Further reprint
 """
 
 
+@pytest.fixture(scope="session")
+def average_insurance_expenditures_html() -> str:
+    return AVERAGE_INSURANCE_EXPENDITURES_HTML
+
+
 @pytest.fixture
 def average_insurance_expenditures_html_as_data_url(
     average_insurance_expenditures_html,
@@ -111,9 +208,7 @@ def average_insurance_expenditures_html_as_data_url(
     return f"data:text/html;base64,{encoded_html}"
 
 
-@pytest.fixture(scope="session")
-def premiums_by_state_html() -> str:
-    return """
+PREMIUMS_BY_STATE_HTML = """
 <html>
   <head>
     <meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
@@ -304,6 +399,11 @@ Source: NAIC data, sourced from S&amp;P Global Market Intelligence, Insurance In
 """
 
 
+@pytest.fixture(scope="session")
+def premiums_by_state_html() -> str:
+    return PREMIUMS_BY_STATE_HTML
+
+
 @pytest.fixture
 def premiums_by_state_html_as_data_url(premiums_by_state_html) -> str:
     """Returns the sample HTML content as a base64 encoded data URI"""
@@ -466,3 +566,23 @@ def api_client(config):
     yield client
 
     app.dependency_overrides[get_config] = get_config
+
+
+@pytest.fixture
+def fake_llm(config):
+    """Replace the configured LLM with a local fake that streams its canned answer"""
+    llm = GenericFakeChatModel(
+        messages=iter([AIMessage(content="The Eiffel Tower is worth a visit.")])
+    )
+    services.registry.get_or_create("llm", config.llm.model_dump_json(), lambda: llm)
+    return llm
+
+
+@pytest.fixture
+def fake_embeddings(config):
+    """Replace the configured embeddings with local ones, equal for equal texts"""
+    embeddings = DeterministicFakeEmbedding(size=384)
+    services.registry.get_or_create(
+        "embeddings", services.embeddings_key(config), lambda: embeddings
+    )
+    return embeddings
@@ -1,9 +1,13 @@
+import asyncio
+import json
 import pprint
 import pytest
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from src import services
 from src.db import SqlKnowledgeBaseDocument, SqlTopic
+from src.workflow_ingest import batch, jobs
 
 
 def test_healthcheck(api_client):
@@ -12,6 +16,115 @@ def test_healthcheck(api_client):
     assert response.status_code == 200
 
 
+def test_topics_crud(api_client):
+    response = api_client.post("/topics", json={"name": "Rome"})
+    assert response.status_code == 200
+    topic_id = response.json()["id"]
+
+    response = api_client.get(f"/topics/{topic_id}")
+    assert response.status_code == 200
+    assert response.json()["name"] == "Rome"
+
+    response = api_client.get("/topics")
+    assert [topic["id"] for topic in response.json()] == [topic_id]
+
+    response = api_client.delete(f"/topics/{topic_id}")
+    assert response.status_code == 200
+
+    response = api_client.get(f"/topics/{topic_id}")
+    assert response.status_code == 404
+
+
+def test_refresh_topic(api_client, config, fake_embeddings, fake_site):
+    fake_site.pages = {
+        "/louvre": [(200, {"Content-Type": "text/plain", "ETag": '"v1"'}, b"Louvre")]
+    }
+    topic_id = api_client.post("/topics", json={"name": "Paris"}).json()["id"]
+    asyncio.run(
+        batch.aingest_many([fake_site.url("/louvre")], topic_id, config, workers=0)
+    )
+
+    response = api_client.post(f"/topics/{topic_id}/refresh")
+
+    assert response.status_code == 200
+    assert (response.json()["sources"], response.json()["not_modified"]) == (1, 1)
+    assert api_client.post("/topics/default/refresh").json()["sources"] == 0
+    assert api_client.post("/topics/unknown/refresh").status_code == 404
+
+
+def test_deletes_remove_all_chunks(api_client, config, fake_embeddings, tmp_path):
+    config.indexing.chunk_size = 40
+    config.indexing.chunk_overlap = 0
+    topic_id = api_client.post("/topics", json={"name": "Paris"}).json()["id"]
+    (tmp_path / "long.txt").write_text(
+        " ".join(f"Museum number {i} of Paris." for i in range(150))
+    )
+    (tmp_path / "short.txt").write_text("The Louvre is in Paris.")
+    (tmp_path / "other.txt").write_text("The Colosseum is in Rome.")
+    asyncio.run(
+        batch.aingest_many(
+            [f"file://{tmp_path}/long.txt", f"file://{tmp_path}/short.txt"],
+            topic_id,
+            config,
+            workers=0,
+        )
+    )
+    asyncio.run(
+        batch.aingest_many([f"file://{tmp_path}/other.txt"], None, config, workers=0)
+    )
+    vector_store = services.get_vector_store(config)
+    with Session(services.get_db(config)) as session:
+        [long_id] = session.scalars(
+            select(SqlKnowledgeBaseDocument.id).where(
+                SqlKnowledgeBaseDocument.content.startswith("Museum number")
+            )
+        )
+    assert len(vector_store.get(where={"source_id": long_id})["ids"]) > 100
+
+    # beyond the first 100 chunks
+    assert api_client.delete(f"/notes/{long_id}").status_code == 200
+    assert vector_store.get(where={"source_id": long_id})["ids"] == []
+
+    assert api_client.delete(f"/topics/{topic_id}").status_code == 200
+    assert vector_store.get(where={"topic_id": topic_id})["ids"] == []
+    assert len(vector_store.get()["ids"]) == 1
+
+
+def test_query_stream(api_client, fake_llm):
+    response = api_client.get("/query/stream", params={"q": "What should I see?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (
+            event.split("\n")[0].removeprefix("event: "),
+            json.loads(event.split("data: ")[1]),
+        )
+        for event in response.text.strip().split("\n\n")
+    ]
+    assert sorted(data["node"] for name, data in events if name == "progress") == [
+        "cache_answer",
+        "classify_query",
+        "generate",
+        "lookup_cached_answer",
+        "rerank",
+        "retrieve_from_knowledge_base",
+        "retrieve_from_weather_service",
+    ]
+    assert "".join(data["content"] for name, data in events if name == "token") == (
+        "The Eiffel Tower is worth a visit."
+    )
+    assert events[-1] == (
+        "done",
+        {"answer": "The Eiffel Tower is worth a visit.", "sources": []},
+    )
+
+    response = api_client.get("/metrics")
+    assert (
+        response.json()["summaries"]["query_stream.time_to_first_token"]["count"] == 1
+    )
+
+
 @pytest.mark.vcr
 @pytest.mark.integration
 def test_poor_mans_e2e_test(api_client, config, snapshot):
@@ -47,10 +160,14 @@ def test_poor_mans_e2e_test(api_client, config, snapshot):
         },
     )
 
-    # verify that note is in the knowledge base
+    # run the queued ingestion, then verify that note is in the knowledge base
 
-    assert response.status_code == 200
-    note_id = response.json()["id"]
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    asyncio.run(jobs.arun_worker(config, workers=0, drain=True))
+    job = api_client.get(f"/jobs/{job_id}").json()
+    assert job["status"] == "succeeded"
+    note_id = job["result"]["outcomes"][0]["document_ids"][0]
     assert isinstance(note_id, str)
     with Session(services.get_db(config)) as session:
         stored_notes = session.query(SqlKnowledgeBaseDocument).all()
@@ -0,0 +1,105 @@
+from src import metrics
+from src.cache import SemanticCache, TTLCache
+
+
+def test_ttl_cache_expires_entries():
+    now = [0.0]
+    cache: TTLCache[str, int] = TTLCache(
+        "test", maxsize=10, ttl=5, clock=lambda: now[0]
+    )
+    cache.set("a", 1)
+
+    assert cache.get("a") == 1
+    now[0] = 5.0
+    assert cache.get("a") is None
+    assert metrics.snapshot()["counters"] == {
+        "cache.test.hits": 1,
+        "cache.test.misses": 1,
+    }
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache: TTLCache[str, int] = TTLCache("test", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_invalidate_where():
+    cache: TTLCache[tuple[str, str], bool] = TTLCache("test", maxsize=10, ttl=60)
+    cache.set(("topic-1", "q"), True)
+    cache.set(("topic-2", "q"), False)
+
+    cache.invalidate_where(lambda key: key[0] == "topic-1")
+
+    assert cache.get(("topic-1", "q")) is None
+    assert cache.get(("topic-2", "q")) is False
+
+
+def test_semantic_cache_matches_similar_vectors_within_partition():
+    cache: SemanticCache[str, str] = SemanticCache(
+        "test", maxsize=10, ttl=60, threshold=0.95
+    )
+    cache.set("topic-1", [1.0, 0.0], "east")
+
+    assert cache.get("topic-1", [2.0, 0.1]) == "east"
+    assert cache.get("topic-1", [1.0, 1.0]) is None
+    assert cache.get("topic-2", [1.0, 0.0]) is None
+    assert metrics.snapshot()["counters"] == {
+        "cache.test.hits": 1,
+        "cache.test.misses": 2,
+    }
+
+
+def test_semantic_cache_returns_most_similar_unexpired_entry():
+    now = [0.0]
+    cache: SemanticCache[str, str] = SemanticCache(
+        "test", maxsize=10, ttl=5, threshold=0.9, clock=lambda: now[0]
+    )
+    cache.set("topic-1", [1.0, 0.0], "east")
+    cache.set("topic-1", [1.0, 0.3], "east-north-east")
+    now[0] = 3
+    cache.set("topic-1", [1.0, 0.1], "almost east")
+
+    assert cache.get("topic-1", [1.0, 0.2]) == "east-north-east"
+    now[0] = 6
+    assert cache.get("topic-1", [1.0, 0.2]) == "almost east"
+    now[0] = 9
+    assert cache.get("topic-1", [1.0, 0.2]) is None
+
+
+def test_semantic_cache_evicts_least_recently_used():
+    cache: SemanticCache[str, str] = SemanticCache(
+        "test", maxsize=2, ttl=60, threshold=0.95
+    )
+    cache.set("topic-1", [1.0, 0.0], "east")
+    cache.set("topic-1", [0.0, 1.0], "north")
+    cache.get("topic-1", [1.0, 0.0])
+    cache.set("topic-2", [1.0, 0.0], "east")
+
+    assert cache.get("topic-1", [1.0, 0.0]) == "east"
+    assert cache.get("topic-1", [0.0, 1.0]) is None
+    assert len(cache) == 2
+    assert metrics.snapshot()["counters"]["cache.test.evictions"] == 1
+
+
+def test_semantic_cache_invalidates_partitions():
+    cache: SemanticCache[str | None, str] = SemanticCache(
+        "test", maxsize=10, ttl=60, threshold=0.95
+    )
+    cache.set("topic-1", [1.0, 0.0], "east")
+    cache.set(None, [1.0, 0.0], "east")
+    generation = cache.generation("topic-1")
+
+    cache.invalidate("topic-1")
+
+    assert cache.get("topic-1", [1.0, 0.0]) is None
+    assert cache.get(None, [1.0, 0.0]) == "east"
+    # a value computed before the invalidation is not stored
+    assert not cache.set("topic-1", [1.0, 0.0], "east", generation=generation)
+    assert cache.get("topic-1", [1.0, 0.0]) is None
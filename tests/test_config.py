@@ -0,0 +1,35 @@
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.checkpoint.base import get_checkpoint_metadata
+
+from src.config import Config, VALIDATED_CONFIG_KEY
+
+
+def test_from_runnable_config_reuses_validated_instance(config):
+    assert Config.from_runnable_config(config.to_runnable_config()) is config
+
+
+def test_validated_instance_survives_runnable_invocation(config):
+    seen = RunnableLambda(lambda _, config: Config.from_runnable_config(config)).invoke(
+        None, config.to_runnable_config()
+    )
+
+    assert seen is config
+
+
+def test_from_runnable_config_validates_serialized_config(config):
+    configurable = {
+        k: v
+        for k, v in config.to_runnable_config()["configurable"].items()
+        if k != VALIDATED_CONFIG_KEY
+    }
+
+    restored = Config.from_runnable_config(RunnableConfig(configurable=configurable))
+
+    assert restored == config
+    assert restored is not config
+
+
+def test_validated_instance_is_not_checkpointed(config):
+    metadata = get_checkpoint_metadata(config.to_runnable_config(), {})
+
+    assert VALIDATED_CONFIG_KEY not in metadata
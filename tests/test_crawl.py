@@ -0,0 +1,228 @@
+import asyncio
+
+import pytest
+from sqlalchemy.orm import Session
+
+from src import services
+from src.config import Config
+from src.db import SqlCrawlUrl
+from src.workflow_ingest import crawl
+from src.workflow_ingest.crawl import extract_links, normalize_url, parse_sitemap
+
+
+@pytest.fixture
+def crawling_config(config) -> Config:
+    config.crawling.min_host_delay = 0
+    config.fetching.retry_backoff = 0.01
+    return config
+
+
+def html_page(title: str, *links: str) -> tuple[int, dict[str, str], bytes]:
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    body = f"<html><head><title>{title}</title></head><body><h1>{title}</h1><p>About {title}.</p>{anchors}</body></html>"
+    return 200, {"Content-Type": "text/html"}, body.encode()
+
+
+@pytest.fixture
+def synthetic_site(fake_site):
+    sitemap = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        f"<url><loc>{fake_site.url('/orphan')}</loc></url>"
+        "</urlset>"
+    )
+    fake_site.pages = {
+        "/robots.txt": [
+            (
+                200,
+                {"Content-Type": "text/plain"},
+                f"User-agent: *\nDisallow: /private\nSitemap: {fake_site.url('/sitemap.xml')}\n".encode(),
+            )
+        ],
+        "/sitemap.xml": [(200, {"Content-Type": "application/xml"}, sitemap.encode())],
+        "/": [
+            html_page(
+                "Home",
+                "/louvre",
+                "./louvre#hours",
+                "/private/staff",
+                "/logo.png",
+                "http://example.com/elsewhere",
+            )
+        ],
+        "/louvre": [html_page("Louvre", "/orsay?b=2&a=1", "/")],
+        "/orsay?a=1&b=2": [html_page("Orsay", "/pompidou")],
+        "/orphan": [html_page("Orphan")],
+        "/pompidou": [html_page("Pompidou")],
+    }
+    return fake_site
+
+
+def test_crawl_follows_links_in_scope_and_ingests_pages(
+    crawling_config, fake_embeddings, synthetic_site
+):
+    state = crawl.create_crawl(
+        [synthetic_site.url("/")], None, crawling_config, max_depth=2
+    )
+    outcomes = []
+
+    report = asyncio.run(
+        crawl.arun_crawl(state, crawling_config, on_outcome=outcomes.append)
+    )
+
+    assert sorted(o["url"] for o in outcomes) == [
+        synthetic_site.url(path)
+        for path in ["/", "/louvre", "/orphan", "/orsay?a=1&b=2"]
+    ]
+    # beyond max_depth, outside of the site, not HTML, or disallowed
+    assert "/pompidou" not in synthetic_site.requests
+    assert "/logo.png" not in synthetic_site.requests
+    assert not any(path.startswith("/private") for path in synthetic_site.requests)
+    assert synthetic_site.requests.count("/louvre") == 1
+    assert (report["ingested"], report["disallowed"], report["failed"]) == (4, 1, 0)
+    chunks = services.get_vector_store(crawling_config).get()["documents"]
+    assert len(chunks) == report["chunks"] == 4
+    with Session(services.get_db(crawling_config)) as session:
+        statuses = {
+            u.url: u.status
+            for u in session.query(SqlCrawlUrl).filter_by(crawl_id=state["id"])
+        }
+    assert statuses[synthetic_site.url("/private/staff")] == "disallowed"
+    assert set(statuses.values()) == {"ingested", "disallowed"}
+
+
+def test_resumed_crawl_only_fetches_pending_urls(
+    crawling_config, fake_embeddings, synthetic_site
+):
+    state = crawl.create_crawl(
+        [synthetic_site.url("/")], None, crawling_config, max_depth=1
+    )
+    # as if interrupted after the home page was ingested, with the page it
+    # links to still pending
+    crawl.set_crawl_url_status(
+        state["id"], synthetic_site.url("/"), "ingested", crawling_config
+    )
+    crawl.add_crawl_urls(
+        state["id"], [synthetic_site.url("/louvre")], 1, crawling_config
+    )
+
+    report = asyncio.run(
+        crawl.arun_crawl(
+            crawl.load_crawl(state["id"], crawling_config),
+            crawling_config,
+            discover_sitemaps=False,
+        )
+    )
+
+    assert synthetic_site.requests == ["/robots.txt", "/louvre"]
+    assert report["ingested"] == 1
+    # already known to the crawl: not followed again
+    assert report["urls"] == 2
+
+
+def test_crawl_checks_redirect_targets_like_links(
+    crawling_config, fake_embeddings, synthetic_site
+):
+    # the same server under another host name: outside of the crawl
+    elsewhere = synthetic_site.url("/louvre").replace("127.0.0.1", "localhost")
+    synthetic_site.pages["/"] = [html_page("Home", "/old", "/staff", "/away")]
+    synthetic_site.pages["/old"] = [(301, {"Location": "/louvre"}, b"")]
+    synthetic_site.pages["/staff"] = [(302, {"Location": "/private/staff"}, b"")]
+    synthetic_site.pages["/away"] = [(302, {"Location": elsewhere}, b"")]
+    state = crawl.create_crawl(
+        [synthetic_site.url("/")], None, crawling_config, max_depth=1
+    )
+
+    report = asyncio.run(
+        crawl.arun_crawl(state, crawling_config, discover_sitemaps=False)
+    )
+
+    assert not any(path.startswith("/private") for path in synthetic_site.requests)
+    # only requested by the crawl through its own host
+    assert synthetic_site.requests.count("/louvre") == 1
+    assert report["redirected"] == 3
+    assert (report["ingested"], report["disallowed"], report["failed"]) == (2, 1, 0)
+    assert state["urls"][synthetic_site.url("/louvre")]["depth"] == 1
+
+
+def test_crawl_spaces_robots_txt_and_page_requests(
+    crawling_config, fake_embeddings, synthetic_site
+):
+    crawling_config.crawling.min_host_delay = 0.5
+    state = crawl.create_crawl(
+        [synthetic_site.url("/orphan")], None, crawling_config, max_depth=0
+    )
+
+    report = asyncio.run(
+        crawl.arun_crawl(state, crawling_config, discover_sitemaps=False)
+    )
+
+    assert synthetic_site.requests == ["/robots.txt", "/orphan"]
+    assert report["seconds"] >= 0.5
+
+
+def test_crawl_records_pages_failing_ingestion(
+    crawling_config, fake_embeddings, synthetic_site, monkeypatch
+):
+    async def failing_aingest_one(*args, **kwargs):
+        raise RuntimeError("extraction failed")
+
+    monkeypatch.setattr(crawl, "aingest_one", failing_aingest_one)
+    state = crawl.create_crawl(
+        [synthetic_site.url("/orphan")], None, crawling_config, max_depth=0
+    )
+
+    report = asyncio.run(
+        crawl.arun_crawl(state, crawling_config, discover_sitemaps=False)
+    )
+
+    assert (report["urls"], report["failed"]) == (1, 1)
+    assert crawl.load_crawl(state["id"], crawling_config)["urls"] == {
+        synthetic_site.url("/orphan"): {"depth": 0, "status": "failed"}
+    }
+
+
+def test_crawl_fetches_unreachable_robots_txt_again(
+    crawling_config, fake_embeddings, synthetic_site
+):
+    crawling_config.fetching.max_retries = 0
+    synthetic_site.pages["/robots.txt"] = [
+        (503, {}, b"unavailable"),
+        (200, {"Content-Type": "text/plain"}, b"User-agent: *\nDisallow:\n"),
+    ]
+    state = crawl.create_crawl(
+        [synthetic_site.url("/orphan"), synthetic_site.url("/pompidou")],
+        None,
+        crawling_config,
+        max_depth=0,
+    )
+
+    report = asyncio.run(
+        crawl.arun_crawl(state, crawling_config, concurrency=1, discover_sitemaps=False)
+    )
+
+    assert synthetic_site.requests.count("/robots.txt") == 2
+    # disallowed while robots.txt could not be fetched only
+    assert (report["disallowed"], report["ingested"]) == (1, 1)
+
+
+def test_normalize_url():
+    assert (
+        normalize_url("HTTP://Example.COM:80/a/./b/../c?z=1&a=2#top")
+        == "http://example.com/a/c?a=2&z=1"
+    )
+    assert normalize_url("https://example.com") == "https://example.com/"
+    assert normalize_url("https://example.com:8443/") == "https://example.com:8443/"
+    assert normalize_url("mailto:someone@example.com") is None
+    assert normalize_url("javascript:void(0)") is None
+
+
+def test_extract_links_and_parse_sitemap():
+    html = '<base href="/docs/"><a href="intro">Intro</a><a rel="nofollow" href="/ads">Ad</a>'
+    assert extract_links(html, "http://example.com/index.html") == [
+        "http://example.com/docs/intro"
+    ]
+
+    index = b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"><sitemap><loc>http://example.com/a.xml</loc></sitemap></sitemapindex>'
+    assert parse_sitemap(index) == ([], ["http://example.com/a.xml"])
+    assert parse_sitemap(b"not xml") == ([], [])
@@ -1,5 +1,68 @@
+import asyncio
+import json
+import time
+from typing import Any
+
 import pytest
-from src.data import GenericTabularData, TextualData
+from bs4 import BeautifulSoup
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field
+
+from src.config import IndexingConfig
+from src.data import GenericTabularData, HtmlTableExtractor, TextualData
+from src.data.html_text import HTML_TEXT_BACKENDS
+
+INDEXING = IndexingConfig(chunk_size=1000, chunk_overlap=100)
+
+
+class TableReadingChatModel(BaseChatModel):
+    """Answers extraction prompts with the rows of the table they contain,
+    after a fixed latency"""
+
+    latency: float = 0.2
+    prompts: list[str] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "table-reading-fake"
+
+    def _generate(self, messages: list[BaseMessage], *args, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._read(messages)
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], *args, **kwargs
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._read(messages)
+
+    def _read(self, messages: list[BaseMessage]) -> ChatResult:
+        prompt = str(messages[-1].content)
+        self.prompts.append(prompt)
+        rows = [
+            [cell.get_text() for cell in tr.find_all(["th", "td"])]
+            for tr in BeautifulSoup(prompt, "html.parser").find_all("tr")
+        ]
+        extraction: dict[str, Any] = {
+            "title": prompt.split("\n")[0],
+            "data": [dict(zip(rows[0], row)) for row in rows[1:]],
+        }
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(json.dumps(extraction)))]
+        )
+
+
+def museums_page(rows: int) -> str:
+    cells = "".join(
+        f'<tr class="row"><td>Museum {i}</td><td>{i}</td></tr>' for i in range(rows)
+    )
+    return f"""<html><head><script>track()</script></head><body>
+    <nav>Home | Contact</nav>
+    <h1>Visitors</h1>
+    <table style="width: 100%"><thead><tr><th>Museum</th><th>Visitors</th></tr></thead>
+    <tbody>{cells}</tbody></table></body></html>"""
 
 
 @pytest.mark.xfail(reason="todo")
@@ -7,12 +70,151 @@ def test_generic_tabular_data_from_content(snapshot):
     pass
 
 
+def test_html_table_extractor_reads_nested_data_table(premiums_by_state_html):
+    tabular_data = HtmlTableExtractor.from_content(
+        content_data=premiums_by_state_html,
+        content_type="text/html",
+        source_url="about:blank",
+        llm=None,
+        indexing=INDEXING,
+    )
+
+    assert tabular_data is not None
+    assert tabular_data.title == "Direct Premiums Written, P/C Insurance By State, 2023"
+    # the two column groups of the table are read one after the other
+    assert len(tabular_data.data) == 52
+    assert tabular_data.data[0] == {
+        "State": "Alabama",
+        "Total, all lines": "$13,146,853",
+    }
+    assert tabular_data.data[26] == {
+        "State": "Montana",
+        "Total, all lines": "$3,807,820",
+    }
+    assert tabular_data.data[-1] == {
+        "State": "United States",
+        "Total, all lines": "$949,898,320",
+    }
+
+
+def test_html_table_extractor_reads_spans_and_several_tables():
+    html = """<html><head><title>Museums</title></head><body>
+    <table><caption>Visitors</caption>
+      <tr><th rowspan="2">Museum</th><th colspan="2">Visitors (M)</th></tr>
+      <tr><th>2022</th><th>2023</th></tr>
+      <tr><td>Louvre</td><td>7.8</td><td>8.9</td></tr>
+    </table>
+    <h2>Opening hours</h2>
+    <table>
+      <thead><tr><th>Museum</th><th>Opens</th></tr></thead>
+      <tr><td>Orsay</td><td>9:30</td></tr>
+    </table></body></html>"""
+
+    tabular_data = HtmlTableExtractor.from_content(
+        content_data=html,
+        content_type="text/html",
+        source_url="about:blank",
+        llm=None,
+        indexing=INDEXING,
+    )
+
+    assert tabular_data is not None
+    assert tabular_data.title == "Museums"
+    assert tabular_data.data == [
+        {
+            "Table": "Visitors",
+            "Museum": "Louvre",
+            "Visitors (M) 2022": "7.8",
+            "Visitors (M) 2023": "8.9",
+        },
+        {"Table": "Opening hours", "Museum": "Orsay", "Opens": "9:30"},
+    ]
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        # no headers
+        "<table><tr><td>Louvre</td><td>Paris</td></tr></table>",
+        # headers guessed from the first row
+        "<table><tr><td>Museum</td><td>Visitors</td></tr><tr><td>Louvre</td><td>8.9</td></tr></table>",
+        # ragged rows
+        "<table><tr><th>Museum</th><th>City</th><th>Visitors</th></tr>"
+        "<tr><td>Louvre</td><td>8.9</td></tr><tr><td>Orsay</td><td>3.7</td></tr></table>",
+        # layout only
+        "<table><tr><td>Welcome to the Louvre</td></tr></table>",
+    ],
+)
+def test_html_table_extractor_leaves_ambiguous_tables_to_the_llm(html):
+    assert (
+        HtmlTableExtractor.from_content(
+            content_data=html,
+            content_type="text/html",
+            source_url="about:blank",
+            llm=None,
+            indexing=INDEXING,
+        )
+        is None
+    )
+
+
+def test_generic_tabular_data_extracts_row_groups_with_their_header():
+    llm = TableReadingChatModel(latency=0)
+    indexing = INDEXING.model_copy(update={"tabular_rows_per_group": 10})
+
+    tabular_data = GenericTabularData.from_content(
+        content_data=museums_page(25),
+        content_type="text/html",
+        source_url="about:blank",
+        llm=llm,
+        indexing=indexing,
+    )
+
+    assert tabular_data is not None
+    assert tabular_data.title == "Visitors"
+    assert tabular_data.data == [
+        {"Museum": f"Museum {i}", "Visitors": str(i)} for i in range(25)
+    ]
+    assert len(llm.prompts) == 3
+    # groups are extracted concurrently: prompts are recorded in any order
+    assert (
+        "Visitors\n<table><tr><th>Museum</th><th>Visitors</th></tr>"
+        + "".join(f"<tr><td>Museum {i}</td><td>{i}</td></tr>" for i in range(20, 25))
+        + "</table>"
+    ) in llm.prompts
+
+
+@pytest.mark.parametrize("concurrency", [1, 2, 4])
+def test_generic_tabular_data_extracts_row_groups_concurrently(concurrency):
+    llm = TableReadingChatModel(latency=0.2)
+    indexing = INDEXING.model_copy(
+        update={"tabular_rows_per_group": 10, "tabular_max_concurrency": concurrency}
+    )
+
+    started = time.perf_counter()
+    tabular_data = asyncio.run(
+        GenericTabularData.afrom_content(
+            content_data=museums_page(40),
+            content_type="text/html",
+            source_url="about:blank",
+            llm=llm,
+            indexing=indexing,
+        )
+    )
+    seconds = time.perf_counter() - started
+
+    assert tabular_data is not None and len(tabular_data.data) == 40
+    # 4 groups of rows, `concurrency` at a time
+    assert 0.2 * 4 / concurrency <= seconds < 0.2 * 4 / concurrency + 0.15
+
+
 def test_textual_data_from_html(snapshot):
     textual_data = TextualData.from_content(
         source_url="about:blank",
         content_data="<html><title>foobar</title><body><p>Hello, world!</p></body></html>",
         content_type="text/html",
         llm=None,
+        indexing=INDEXING,
     )
 
     assert textual_data is not None
@@ -25,7 +227,67 @@ def test_textual_data_from_text(snapshot):
         content_data="Hello, world!",
         content_type="text/html",
         llm=None,
+        indexing=INDEXING,
     )
 
     assert textual_data is not None
     assert textual_data.to_text() == snapshot
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "<html><title>foobar</title><body><p>Hello, world!</p></body></html>",
+        "<h1>lorem ipsum</h1><p>Vivamus id enim.  Aenean in sem ac leo mollis blandit.</p>",
+        "<title> </title><h1>A <i>b</i> &amp; c</h1><p>x<!-- y -->z</p><br/>w",
+        museums_page(3),
+        "average_insurance_expenditures_html",
+        "premiums_by_state_html",
+    ],
+)
+def test_html_text_backends_agree(html, request):
+    if html.endswith("_html"):
+        html = request.getfixturevalue(html)
+
+    extracted = [extract(html) for extract in HTML_TEXT_BACKENDS.values()]
+
+    assert all(e == extracted[0] for e in extracted)
+
+
+def test_textual_data_skips_boilerplate():
+    textual_data = TextualData.from_content(
+        source_url="about:blank",
+        content_data=museums_page(1),
+        content_type="text/html",
+        llm=None,
+        indexing=INDEXING,
+    )
+
+    assert textual_data is not None
+    assert textual_data.title == "Visitors"
+    assert "Home" not in textual_data.data and "track" not in textual_data.data
+
+
+def test_indexable_data_derives_text_id_and_chunks_once(monkeypatch):
+    tabular_data = GenericTabularData(
+        title="Average expenditures",
+        source_url="about:blank",
+        data=[{"Year": 2012 + i, "Average expenditure": 812.40 + i} for i in range(50)],
+    )
+    calls = []
+    to_text = GenericTabularData.to_text
+    monkeypatch.setattr(
+        GenericTabularData,
+        "to_text",
+        lambda self: calls.append(self) or to_text(self),
+    )
+
+    chunks = tabular_data.chunk_texts(chunk_size=200, chunk_overlap=0)
+
+    assert tabular_data.text.startswith(
+        "# Average expenditures\n\nYear: 2012, Average expenditure: 812.4\n\n"
+    )
+    assert tabular_data.id() == tabular_data.id()
+    assert tabular_data.chunk_texts(chunk_size=200, chunk_overlap=0) is chunks
+    assert len(tabular_data.chunk_texts(chunk_size=500, chunk_overlap=0)) < len(chunks)
+    assert len(calls) == 1
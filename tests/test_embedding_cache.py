@@ -0,0 +1,108 @@
+import asyncio
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src import metrics, services
+from src.embedding_cache import CachedEmbeddings, SqliteVectorStore
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+def make_embeddings() -> CountingEmbeddings:
+    return CountingEmbeddings(size=8, embedded=[])
+
+
+def test_cached_embeddings_embed_each_distinct_text_once():
+    embeddings = make_embeddings()
+    cached = CachedEmbeddings(embeddings, "fake/8")
+
+    first = cached.embed_documents(["a", "b", "a"])
+    second = cached.embed_documents(["b", "c"])
+
+    assert embeddings.embedded == ["a", "b", "c"]
+    assert first == embeddings.embed_documents(["a", "b", "a"])
+    assert second[0] == first[1]
+    assert cached.embed_query("c") == second[1]
+    stats = cached.stats()
+    assert stats["misses"] == 4
+    assert stats["memory_hits"] == 2
+    assert stats["hit_rate"] == 2 / 6
+    assert metrics.snapshot()["counters"]["cache.embeddings.misses"] == 4
+
+
+def test_cached_embeddings_persist_by_model_identity(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    vectors = CachedEmbeddings(make_embeddings(), "fake/8", path).embed_documents(
+        ["a", "b"]
+    )
+
+    embeddings = make_embeddings()
+    reopened = CachedEmbeddings(embeddings, "fake/8", path)
+    other_model = CachedEmbeddings(embeddings, "fake/8-v2", path)
+
+    assert asyncio.run(reopened.aembed_documents(["a", "b"])) == vectors
+    assert embeddings.embedded == []
+    assert reopened.stats()["disk_hits"] == 2
+    other_model.embed_documents(["a"])
+    assert embeddings.embedded == ["a"]
+
+
+def test_cached_embeddings_bound_memory_and_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(SqliteVectorStore, "EVICTION_INTERVAL", 2)
+    path = str(tmp_path / "embeddings.sqlite")
+    embeddings = make_embeddings()
+    cached = CachedEmbeddings(
+        embeddings, "fake/8", path, max_entries=4, memory_maxsize=2
+    )
+
+    for i in range(10):
+        cached.embed_documents([str(i)])
+
+    assert len(cached._memory) == 2
+    assert cached._disk is not None
+    (count,) = cached._disk._connection.execute(
+        "SELECT COUNT(*) FROM embeddings"
+    ).fetchone()
+    assert count <= 4
+    # the least recently used went first
+    reopened = CachedEmbeddings(embeddings, "fake/8", path)
+    reopened.embed_documents(["9", "0"])
+    assert reopened.stats()["disk_hits"] == 1
+    assert embeddings.embedded[-1] == "0"
+
+
+def test_get_embeddings_caches_configured_embeddings(config, tmp_path):
+    config = config.model_copy(
+        update={
+            "caching": config.caching.model_copy(
+                update={"embedding_path": str(tmp_path / "embeddings.sqlite")}
+            )
+        }
+    )
+
+    embeddings = services.get_embeddings(config)
+
+    assert isinstance(embeddings, CachedEmbeddings)
+    assert embeddings.model_identity == "chroma/default"
+    assert (tmp_path / "embeddings.sqlite").exists()
+
+
+def test_get_embeddings_is_distinct_for_distinct_caching(config, tmp_path):
+    other_config = config.model_copy(
+        update={
+            "caching": config.caching.model_copy(
+                update={"embedding_path": str(tmp_path / "embeddings.sqlite")}
+            )
+        }
+    )
+
+    embeddings = services.get_embeddings(other_config)
+
+    assert services.get_embeddings(config) is not embeddings
+    assert services.get_embeddings(other_config) is embeddings
@@ -0,0 +1,117 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src import metrics
+from src.config import Config
+from src.fetcher import ContentTooLargeError, get_fetcher
+
+
+@pytest.fixture
+def fetching_config(config) -> Config:
+    return config.model_copy(
+        update={
+            "fetching": config.fetching.model_copy(
+                update={
+                    "read_timeout": 1,
+                    "retry_backoff": 0.01,
+                    "max_connections_per_host": 2,
+                    "max_content_size": 1000,
+                }
+            )
+        }
+    )
+
+
+HTML = "<html><head><title>Café</title></head><body>Crème brûlée</body></html>"
+
+
+def test_fetch_decodes_declared_meta_or_detected_charset(fetching_config, fake_site):
+    meta = HTML.replace("<head>", '<head><meta charset="iso-8859-1">')
+    fake_site.pages = {
+        "/declared": [
+            (200, {"Content-Type": "text/html; charset=cp1252"}, HTML.encode("cp1252"))
+        ],
+        "/meta": [(200, {"Content-Type": "text/html"}, meta.encode("latin-1"))],
+        "/detected": [(200, {"Content-Type": "text/plain"}, "Crème brûlée".encode())],
+    }
+    fetcher = get_fetcher(fetching_config)
+
+    assert fetcher.fetch(fake_site.url("/declared")) == {
+        "data": HTML,
+        "type": "text/html",
+    }
+    assert fetcher.fetch(fake_site.url("/meta"))["data"] == meta
+    assert fetcher.fetch(fake_site.url("/detected")) == {
+        "data": "Crème brûlée",
+        "type": "text/plain",
+    }
+
+
+def test_fetch_retries_transient_errors(fetching_config, fake_site):
+    fake_site.pages = {
+        "/flaky": [
+            (503, {"Retry-After": "0"}, b""),
+            (502, {}, b""),
+            (200, {"Content-Type": "text/plain"}, b"finally"),
+        ],
+        "/down": [(503, {}, b"")],
+    }
+    fetcher = get_fetcher(fetching_config)
+
+    assert fetcher.fetch(fake_site.url("/flaky"))["data"] == "finally"
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fetcher.afetch(fake_site.url("/down")))
+    assert fake_site.requests == ["/flaky"] * 3 + ["/down"] * 4
+    assert metrics.snapshot()["counters"]["fetch.retries"] == 5
+
+
+def test_fetch_abandons_content_over_max_size(fetching_config, fake_site):
+    fetching_config.fetching.max_retries = 0
+    fetching_config.fetching.read_timeout = 0.2
+    fake_site.pages = {
+        "/large": [(200, {"Content-Type": "text/plain"}, b"x" * 1001)],
+        # the size is only known once the download exceeds it
+        "/undeclared": [
+            (
+                200,
+                {"Content-Type": "text/plain", "Transfer-Encoding": "chunked"},
+                b"x" * 1001,
+            )
+        ],
+        "/small": [
+            (
+                200,
+                {"Content-Type": "text/plain", "Transfer-Encoding": "chunked"},
+                b"x" * 1000,
+            )
+        ],
+        "/slow": [(200, {"Content-Type": "text/plain"}, b"x")],
+    }
+    fetcher = get_fetcher(fetching_config)
+
+    with pytest.raises(ContentTooLargeError):
+        fetcher.fetch(fake_site.url("/large"))
+    with pytest.raises(ContentTooLargeError):
+        asyncio.run(fetcher.afetch(fake_site.url("/undeclared")))
+    assert fetcher.fetch(fake_site.url("/small"))["data"] == "x" * 1000
+    fake_site.latency = 0.5
+    with pytest.raises(httpx.TimeoutException):
+        fetcher.fetch(fake_site.url("/slow"))
+
+
+def test_afetch_many_limits_concurrency_per_host(fetching_config, fake_site):
+    fake_site.latency = 0.1
+    fake_site.pages = {
+        f"/{i}": [(200, {"Content-Type": "text/plain"}, str(i).encode())]
+        for i in range(6)
+    }
+    fetcher = get_fetcher(fetching_config)
+    urls = [fake_site.url(f"/{i}") for i in range(6)] + [fake_site.url("/missing")]
+
+    results = asyncio.run(fetcher.afetch_many(urls))
+
+    assert [r["data"] for r in results[:6]] == [str(i) for i in range(6)]  # type: ignore[index]
+    assert isinstance(results[6], httpx.HTTPStatusError)
+    assert fake_site.max_active == 2
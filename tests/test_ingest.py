@@ -1,17 +1,28 @@
+import gc
 import pprint
+import asyncio
+import weakref
 import pytest
+from unittest.mock import patch
 from langchain_chroma.vectorstores import Chroma
+from langgraph.checkpoint.base import empty_checkpoint
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine
 
+from src.data.html_text import HtmlTextParser, extract_html_text_with_beautifulsoup
 from src.data.textual import TextualData
-from src.db import SqlKnowledgeBaseDocument
+from src import metrics, services
+from src.db import SqlDocumentSource, SqlKnowledgeBaseDocument
+from src.workflow_ingest import batch, checkpoints, orphans, refresh
 from src.workflow_ingest import (
     AgentState,
     SourceContent,
     fetch,
+    afetch,
     extract,
+    aextract,
     index_and_store,
+    aindex_and_store,
     get_graph,
 )
 
@@ -29,6 +40,19 @@ def test_fetch(config, travel_knowledge_data_as_data_url, snapshot):
     assert state_update.get("source_content") == snapshot
 
 
+def test_afetch(config, travel_knowledge_data_as_data_url):
+    agent_state = AgentState(
+        url=travel_knowledge_data_as_data_url,
+        source_content=None,
+        extracted_data=[],
+        topic_id=None,
+    )
+
+    state_update = asyncio.run(afetch(agent_state, config.to_runnable_config()))
+
+    assert state_update == fetch(agent_state, config.to_runnable_config())
+
+
 @pytest.mark.vcr
 @pytest.mark.timeout(60)  # longer timeout for LLM processing
 def test_extract_generic_tabular_data(
@@ -66,6 +90,21 @@ def test_extract_textual_data(config, snapshot):
     assert state_update == snapshot
 
 
+def test_aextract_textual_data(config):
+    agent_state = AgentState(
+        url="about:blank",
+        source_content=SourceContent(
+            data="<h1>lorem ipsum</h1><p>Vivamus id enim.</p>", type="text/html"
+        ),
+        extracted_data=[],
+        topic_id=None,
+    )
+
+    state_update = asyncio.run(aextract(agent_state, config.to_runnable_config()))
+
+    assert state_update == extract(agent_state, config.to_runnable_config())
+
+
 def test_index_and_store(
     config,
     snapshot,
@@ -75,6 +114,7 @@ def test_index_and_store(
         content_type="text/plain",
         source_url="about:blank",
         llm=None,
+        indexing=config.indexing,
     )
     assert data is not None
 
@@ -119,3 +159,460 @@ def test_graph(config, travel_knowledge_data_as_data_url, snapshot):
     assert result == snapshot
     assert database_state == snapshot
     assert vector_store_state == snapshot
+
+
+def test_graph_is_compiled_once():
+    assert get_graph() is get_graph()
+
+
+def test_expand_inputs(tmp_path):
+    (tmp_path / "pages" / "nested").mkdir(parents=True)
+    (tmp_path / "pages" / "a.txt").write_text("a")
+    (tmp_path / "pages" / "nested" / "b.html").write_text("b")
+    (tmp_path / "pages" / ".hidden").write_text("c")
+    (tmp_path / "urls.txt").write_text(
+        "# comment\n\nhttps://example.com/page\n" f"{tmp_path}/pages/a.txt\n"
+    )
+
+    assert batch.expand_inputs(
+        [f"{tmp_path}/pages", f"{tmp_path}/**/*.html", "https://example.com/other"],
+        [f"{tmp_path}/urls.txt"],
+    ) == [
+        f"file://{tmp_path}/pages/a.txt",
+        f"file://{tmp_path}/pages/nested/b.html",
+        "https://example.com/other",
+        "https://example.com/page",
+    ]
+
+
+def test_ingest_many_continues_past_failures(config, fake_embeddings, tmp_path):
+    for name in ["louvre", "orsay"]:
+        (tmp_path / f"{name}.txt").write_text(f"The {name} museum is in Paris.")
+    urls = batch.expand_inputs([f"{tmp_path}/*.txt", f"{tmp_path}/missing.txt"])
+    outcomes = []
+
+    report = asyncio.run(
+        batch.aingest_many(
+            urls, None, config, concurrency=2, workers=0, on_outcome=outcomes.append
+        )
+    )
+
+    assert (report["inputs"], report["ingested"], report["failed"]) == (3, 2, 1)
+    assert report["documents"] == 2
+    assert report["outcomes"] == outcomes
+    assert [o["url"] for o in outcomes if o["status"] == "failed"] == [
+        f"file://{tmp_path}/missing.txt"
+    ]
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 2
+    assert len(services.get_vector_store(config).get()["ids"]) == report["chunks"]
+
+
+@pytest.mark.parametrize("max_latency, expected_batches", [(0.05, 1), (0, 3)])
+def test_aindex_and_store_batches_concurrent_documents(
+    config, fake_embeddings, max_latency, expected_batches
+):
+    config.indexing.batch_max_latency = max_latency
+    states = [
+        AgentState(
+            url="about:blank",
+            topic_id=None,
+            source_content=None,
+            extracted_data=[
+                TextualData(title=None, source_url="about:blank", data=text)
+            ],
+        )
+        for text in ["The Louvre.", "The Orsay.", "The Pompidou."]
+    ]
+
+    async def ingest_concurrently():
+        await asyncio.gather(
+            *(aindex_and_store(state, config.to_runnable_config()) for state in states)
+        )
+
+    asyncio.run(ingest_concurrently())
+
+    assert len(services.get_vector_store(config).get()["ids"]) == 3
+    assert metrics.snapshot()["counters"]["ingest.batches"] == expected_batches
+
+
+def test_index_and_store_skips_stored_documents(config, fake_embeddings):
+    data = TextualData(title=None, source_url="about:blank", data="The Louvre.")
+    agent_state = AgentState(
+        url="about:blank", topic_id=None, source_content=None, extracted_data=[data]
+    )
+    index_and_store(agent_state, config.to_runnable_config())
+
+    with patch.object(
+        services.get_vector_store(config), "add_documents"
+    ) as add_documents:
+        index_and_store(agent_state, config.to_runnable_config())
+
+    add_documents.assert_not_called()
+    counters = metrics.snapshot()["counters"]
+    assert (
+        counters["ingest.documents.new"],
+        counters["ingest.documents.unchanged"],
+    ) == (1, 1)
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 1
+
+
+def test_documents_are_embedded_again_after_failed_vector_write(
+    config, fake_embeddings, tmp_path, monkeypatch
+):
+    (tmp_path / "louvre.txt").write_text("The Louvre museum is in Paris.")
+    urls = batch.expand_inputs([f"{tmp_path}/louvre.txt"])
+    add_embedded_documents = services.add_embedded_documents
+
+    def failing(*args, **kwargs):
+        monkeypatch.setattr(services, "add_embedded_documents", add_embedded_documents)
+        raise ConnectionError("vector store unavailable")
+
+    monkeypatch.setattr(services, "add_embedded_documents", failing)
+    report = asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+    assert report["failed"] == 1
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 0
+
+    report = asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+
+    assert (report["ingested"], report["chunks"]) == (1, 1)
+    assert len(services.get_vector_store(config).get()["ids"]) == 1
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 1
+
+
+def test_moving_documents_invalidates_answers_of_both_topics(
+    config, fake_embeddings, tmp_path, monkeypatch
+):
+    (tmp_path / "louvre.txt").write_text("The Louvre museum is in Paris.")
+    urls = batch.expand_inputs([f"{tmp_path}/louvre.txt"])
+    asyncio.run(batch.aingest_many(urls, "museums", config, workers=0))
+    invalidated: list[str | None] = []
+    monkeypatch.setattr(
+        batch,
+        "invalidate_answers",
+        lambda config, topic_id: invalidated.append(topic_id),
+    )
+
+    report = asyncio.run(batch.aingest_many(urls, "paris", config, workers=0))
+
+    assert report["ingested"] == 1
+    assert sorted(invalidated) == ["museums", "paris"]
+
+
+def test_ingest_many_stores_identical_inputs_once(config, fake_embeddings, tmp_path):
+    for name in ["louvre", "mirror"]:
+        (tmp_path / f"{name}.txt").write_text("The Louvre museum is in Paris.")
+    urls = batch.expand_inputs([f"{tmp_path}/*.txt"])
+
+    report = asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+
+    assert report["failed"] == 0
+    assert len(services.get_vector_store(config).get()["ids"]) == 1
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 1
+
+
+def test_ingest_many_reports_unchanged_inputs(config, fake_embeddings, tmp_path):
+    (tmp_path / "louvre.txt").write_text("The Louvre museum is in Paris.")
+    urls = batch.expand_inputs([f"{tmp_path}/louvre.txt"])
+    asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+
+    report = asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+
+    assert report["unchanged"] == 1
+    assert (report["new_documents"], report["skipped_documents"]) == (0, 1)
+    assert report["chunks"] == 0
+
+
+def test_refresh_topic_reprocesses_changed_sources_only(
+    config, fake_embeddings, fake_site
+):
+    fake_site.pages = {
+        "/louvre": [
+            (200, {"Content-Type": "text/plain", "ETag": '"v1"'}, b"The Louvre.")
+        ],
+        "/orsay": [
+            (
+                200,
+                {
+                    "Content-Type": "text/plain",
+                    "Last-Modified": "Mon, 06 Jan 2025 10:00:00 GMT",
+                },
+                b"The Orsay.",
+            )
+        ],
+        "/pompidou": [(200, {"Content-Type": "text/plain"}, b"The Pompidou.")],
+    }
+    urls = [fake_site.url(path) for path in ["/louvre", "/orsay", "/pompidou"]]
+    asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+    fake_site.pages["/orsay"] = [
+        (
+            200,
+            {
+                "Content-Type": "text/plain",
+                "Last-Modified": "Tue, 07 Jan 2025 10:00:00 GMT",
+            },
+            b"The Orsay, renovated.",
+        )
+    ]
+    fake_site.request_headers.clear()
+    outcomes = []
+
+    report = asyncio.run(
+        refresh.arefresh_topic(None, config, on_outcome=outcomes.append)
+    )
+
+    assert {o["url"]: o["status"] for o in outcomes} == {
+        urls[0]: "not_modified",
+        urls[1]: "updated",
+        urls[2]: "unchanged",
+    }
+    assert (report["new_documents"], report["deleted_documents"]) == (1, 1)
+    assert {h.get("If-None-Match") for h in fake_site.request_headers} == {
+        '"v1"',
+        None,
+    }
+    chunks = services.get_vector_store(config).get()["documents"]
+    assert sorted(chunks) == ["The Louvre.", "The Orsay, renovated.", "The Pompidou."]
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 3
+        assert session.query(SqlDocumentSource).count() == 3
+
+    # the new validators are sent next time
+    report = asyncio.run(refresh.arefresh_topic(None, config))
+    assert report["not_modified"] == 2
+
+
+def test_refresh_keeps_documents_other_urls_are_sources_of(
+    config, fake_embeddings, fake_site
+):
+    page = (200, {"Content-Type": "text/plain"}, b"The Louvre.")
+    fake_site.pages = {"/louvre": [page], "/mirror": [page]}
+    urls = [fake_site.url("/louvre"), fake_site.url("/mirror")]
+    asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+    with Session(services.get_db(config)) as session:
+        assert sorted(s.url for s in session.query(SqlDocumentSource)) == urls
+    fake_site.pages["/mirror"] = [
+        (200, {"Content-Type": "text/plain"}, b"The Louvre, mirrored.")
+    ]
+
+    report = asyncio.run(refresh.arefresh_topic(None, config))
+
+    assert (report["new_documents"], report["deleted_documents"]) == (1, 0)
+    chunks = services.get_vector_store(config).get()["documents"]
+    assert sorted(chunks) == ["The Louvre, mirrored.", "The Louvre."]
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 2
+        assert session.query(SqlDocumentSource).count() == 2
+
+    # once no URL yields it anymore
+    fake_site.pages["/louvre"] = [
+        (200, {"Content-Type": "text/plain"}, b"The Louvre, renovated.")
+    ]
+    report = asyncio.run(refresh.arefresh_topic(None, config))
+    assert report["deleted_documents"] == 1
+    chunks = services.get_vector_store(config).get()["documents"]
+    assert "The Louvre." not in chunks
+
+
+def make_large_html(paragraphs: int) -> str:
+    body = "".join(
+        f"<p>Paragraph {i} &amp; its <b>museum</b> of Paris.</p>"
+        f"<script>var p = {i};</script>"
+        for i in range(paragraphs)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Museums</title>"
+        "<style>p { margin: 0 }</style></head>"
+        f"<body><h1>Paris</h1>{body}</body></html>"
+    )
+
+
+def test_html_text_parser_matches_beautifulsoup():
+    html = make_large_html(50)
+    parser = HtmlTextParser()
+    texts = []
+    # fed in pieces cutting through tags and entities
+    for start in range(0, len(html), 37):
+        parser.feed(html[start : start + 37])
+        texts.extend(parser.drain())
+    parser.close()
+    texts.extend(parser.drain())
+
+    extracted = extract_html_text_with_beautifulsoup(html)
+    assert "\n".join(texts) == extracted["text"]
+    assert (parser.title, parser.h1) == (extracted["title"], "Paris")
+
+
+@pytest.mark.parametrize("extension", ["txt", "html"])
+def test_ingest_many_streams_large_files(config, fake_embeddings, tmp_path, extension):
+    config.indexing.streaming_threshold = 1024
+    config.indexing.streaming_block_size = 100
+    config.indexing.embedding_batch_size = 8
+    if extension == "txt":
+        content = "".join(f"Line {i} about a museum of Paris.\n" for i in range(500))
+    else:
+        content = make_large_html(500)
+    (tmp_path / f"large.{extension}").write_text(content)
+    urls = batch.expand_inputs([f"{tmp_path}/large.{extension}"])
+
+    report = asyncio.run(batch.aingest_many(urls, "museums", config, workers=0))
+
+    assert report["ingested"] == 1
+    stored = services.get_vector_store(config).get()
+    assert len(stored["ids"]) == report["chunks"] > 1
+    assert all(len(c) <= config.indexing.chunk_size for c in stored["documents"])
+    text = "\n".join(stored["documents"])
+    assert all(f"{n} " in text for n in range(500))
+    assert "var p" not in text
+    titles = {m.get("title") for m in stored["metadatas"]}
+    assert titles == {None if extension == "txt" else "Museums"}
+    with Session(services.get_db(config)) as session:
+        document = session.query(SqlKnowledgeBaseDocument).one()
+        assert document.topic_id == "museums"
+
+    report = asyncio.run(batch.aingest_many(urls, "museums", config, workers=0))
+    assert report["unchanged"] == 1
+
+
+def test_interrupted_ingestion_resumes_from_checkpoint(
+    config, fake_embeddings, fake_site, monkeypatch, tmp_path
+):
+    config.checkpointing.path = f"{tmp_path}/checkpoints.sqlite"
+    fake_site.pages = {
+        "/louvre": [(200, {"Content-Type": "text/plain"}, b"The Louvre museum.")],
+    }
+    url = fake_site.url("/louvre")
+    extracted = []
+
+    from_content = TextualData.from_content
+
+    def counting_from_content(cls, **kwargs):
+        extracted.append(kwargs["source_url"])
+        return from_content(**kwargs)
+
+    monkeypatch.setattr(TextualData, "from_content", classmethod(counting_from_content))
+    store_sql_documents = batch.store_sql_documents
+
+    def interrupted(*args, **kwargs):
+        monkeypatch.setattr(batch, "store_sql_documents", store_sql_documents)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(batch, "store_sql_documents", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(batch.aingest_many([url], None, config, workers=0))
+
+    checkpointer = checkpoints.get_checkpointer(config)
+    assert checkpointer is not None
+    assert checkpointer.thread_ids() == [
+        checkpoints.to_thread_id(checkpoints.BATCH_RUN, url)
+    ]
+
+    report = asyncio.run(batch.aingest_many([url], None, config, workers=0))
+
+    assert report["ingested"] == 1
+    # neither fetched nor extracted again
+    assert len(fake_site.requests) == 1
+    assert extracted == [url]
+    assert checkpointer.thread_ids() == []
+    with Session(services.get_db(config)) as session:
+        assert session.query(SqlKnowledgeBaseDocument).count() == 1
+
+
+def test_collect_orphaned_chunks(config, fake_embeddings, tmp_path):
+    for name in ["louvre", "orsay", "pompidou"]:
+        (tmp_path / f"{name}.txt").write_text(f"The {name} museum is in Paris.")
+    urls = batch.expand_inputs([f"{tmp_path}/*.txt"])
+    asyncio.run(batch.aingest_many(urls, None, config, workers=0))
+    vector_store = services.get_vector_store(config)
+    # chunks left behind by documents deleted from the database only
+    with Session(services.get_db(config)) as session:
+        for document in session.query(SqlKnowledgeBaseDocument).filter(
+            SqlKnowledgeBaseDocument.content.notlike("%louvre%")
+        ):
+            session.delete(document)
+        session.commit()
+        [kept_id] = [d.id for d in session.query(SqlKnowledgeBaseDocument)]
+
+    report = orphans.collect_orphaned_chunks(
+        config, batch_size=2, grace_period=0, dry_run=True
+    )
+    assert (report["chunks"], report["orphaned_chunks"]) == (3, 2)
+    assert len(vector_store.get()["ids"]) == 3
+
+    report = orphans.collect_orphaned_chunks(config, batch_size=2, grace_period=0)
+    assert (report["orphaned_chunks"], report["orphaned_documents"]) == (2, 2)
+    assert report["bytes_reclaimed"] >= 0
+    assert [m["source_id"] for m in vector_store.get()["metadatas"]] == [kept_id]
+
+    report = orphans.collect_orphaned_chunks(config)
+    assert (report["chunks"], report["orphaned_chunks"]) == (1, 0)
+
+
+def test_collect_orphaned_chunks_keeps_chunks_without_source(config, fake_embeddings):
+    vector_store = services.get_vector_store(config)
+    vector_store.add_texts(
+        ["Written by another application.", "Without metadata."],
+        metadatas=[{"source_id": ""}, {"author": "someone"}],
+        ids=["foreign-0", "foreign-1"],
+    )
+
+    report = orphans.collect_orphaned_chunks(config)
+
+    assert (report["orphaned_chunks"], report["unowned_chunks"]) == (0, 2)
+    assert sorted(vector_store.get()["ids"]) == ["foreign-0", "foreign-1"]
+
+
+def test_collect_orphaned_chunks_keeps_chunks_of_documents_being_ingested(
+    config, fake_embeddings, tmp_path
+):
+    (tmp_path / "louvre.txt").write_text("The Louvre museum is in Paris.")
+    asyncio.run(
+        batch.aingest_many(
+            batch.expand_inputs([f"{tmp_path}/*.txt"]), None, config, workers=0
+        )
+    )
+    # as if the document's chunks were written and it was not stored yet
+    with Session(services.get_db(config)) as session:
+        session.query(SqlKnowledgeBaseDocument).delete()
+        session.commit()
+
+    report = orphans.collect_orphaned_chunks(config)
+
+    assert (report["orphaned_chunks"], report["recent_chunks"]) == (0, 1)
+    assert len(services.get_vector_store(config).get()["ids"]) == 1
+
+
+def test_checkpointed_graph_is_released_with_its_checkpointer(config, tmp_path):
+    config.checkpointing.path = f"{tmp_path}/checkpoints.sqlite"
+    graph = checkpoints.get_checkpointed_graph(config)
+    assert checkpoints.get_checkpointed_graph(config) is graph
+    checkpointer = weakref.ref(checkpoints.get_checkpointer(config))
+
+    services.shutdown()
+    del graph
+    gc.collect()
+
+    assert checkpointer() is None
+
+
+def test_checkpoint_threads_are_listed_by_run(tmp_path):
+    checkpointer = checkpoints.SqliteCheckpointSaver(f"{tmp_path}/checkpoints.sqlite")
+    thread_ids = [
+        checkpoints.to_thread_id(checkpoints.BATCH_RUN, "https://example.com/a"),
+        checkpoints.to_thread_id(checkpoints.job_run_id("1"), "https://example.com/a"),
+    ]
+    for thread_id in thread_ids:
+        checkpointer.put(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}},
+            empty_checkpoint(),
+            {},
+            {},
+        )
+
+    assert checkpointer.thread_ids() == sorted(thread_ids)
+    assert checkpointer.thread_ids(checkpoints.BATCH_RUN) == [thread_ids[0]]
+    checkpointer.close()
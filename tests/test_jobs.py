@@ -0,0 +1,232 @@
+import asyncio
+import multiprocessing
+import threading
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import HumanMessage
+from sqlalchemy.orm import Session
+
+from src import services
+from src.config import Config
+from src.db import SqlKnowledgeBaseDocument
+from src.workflow_ingest import jobs
+from src.workflow_query import AgentState, lookup_cached_answer
+from src.workflow_query.caches import get_answer_cache
+
+
+@pytest.fixture
+def jobs_config(config) -> Config:
+    config.jobs.poll_interval = 0.01
+    config.jobs.retry_delay = 0
+    config.fetching.retry_backoff = 0.01
+    return config
+
+
+def run_worker(config: Config, **kwargs) -> int:
+    return asyncio.run(jobs.arun_worker(config, workers=0, drain=True, **kwargs))
+
+
+def run_worker_process(config: Config) -> None:
+    """Run a worker as a separate process would, with local embeddings"""
+    services.registry.get_or_create(
+        "embeddings",
+        services.embeddings_key(config),
+        lambda: DeterministicFakeEmbedding(size=384),
+    )
+    run_worker(config)
+    services.shutdown()
+
+
+def test_ingest_and_notes_are_queued_then_run(
+    api_client, jobs_config, fake_embeddings, fake_site
+):
+    fake_site.pages = {
+        "/louvre": [(200, {"Content-Type": "text/plain"}, b"The Louvre.")],
+    }
+    response = api_client.post("/ingest", json={"urls": [fake_site.url("/louvre")]})
+    assert response.status_code == 202
+    ingest_job_id = response.json()["job_id"]
+    response = api_client.post(
+        "/notes", json={"content": "The Orsay.", "content_type": "text/plain"}
+    )
+    assert response.status_code == 202
+    note_job_id = response.json()["job_id"]
+
+    # nothing is ingested by the API itself
+    assert api_client.get(f"/jobs/{note_job_id}").json()["status"] == "queued"
+    assert fake_site.requests == []
+
+    assert run_worker(jobs_config) == 2
+
+    job = api_client.get(f"/jobs/{ingest_job_id}").json()
+    assert (job["status"], job["attempts"], job["error"]) == ("succeeded", 1, None)
+    assert job["result"]["ingested"] == 1
+    job = api_client.get(f"/jobs/{note_job_id}").json()
+    [note_id] = job["result"]["outcomes"][0]["document_ids"]
+    with Session(services.get_db(jobs_config)) as session:
+        assert session.get(SqlKnowledgeBaseDocument, note_id).content == "The Orsay."
+        assert session.query(SqlKnowledgeBaseDocument).count() == 2
+
+
+def test_ingest_rejects_invalid_requests(api_client):
+    assert api_client.post("/ingest", json={"urls": []}).status_code == 422
+    assert (
+        api_client.post("/ingest", json={"urls": ["file:///etc/passwd"]}).status_code
+        == 400
+    )
+    assert api_client.get("/jobs/missing").status_code == 404
+
+
+def test_failed_jobs_are_retried(jobs_config, fake_embeddings, fake_site):
+    jobs_config.jobs.max_attempts = 3
+    fake_site.pages = {
+        "/louvre": [
+            (404, {}, b"not found"),
+            (200, {"Content-Type": "text/plain"}, b"The Louvre."),
+        ],
+        "/missing": [(404, {}, b"not found")],
+    }
+    recovering = jobs.enqueue_ingest([fake_site.url("/louvre")], None, jobs_config)
+    failing = jobs.enqueue_ingest([fake_site.url("/missing")], None, jobs_config)
+    statuses: list[tuple[str, jobs.JobStatus | None]] = []
+
+    run_worker(jobs_config, on_job=lambda id, status: statuses.append((id, status)))
+
+    assert [s for id, s in statuses if id == recovering] == ["queued", "succeeded"]
+    assert [s for id, s in statuses if id == failing] == ["queued"] * 2 + ["failed"]
+    job = jobs.get_job(failing, jobs_config)
+    assert job is not None
+    assert (job["attempts"], job["error"]) == (3, "1 of 1 inputs failed")
+    assert job["result"] is not None and job["result"]["failed"] == 1
+
+
+def test_retried_jobs_only_run_failed_inputs(jobs_config, fake_embeddings, fake_site):
+    jobs_config.jobs.max_attempts = 3
+    fake_site.pages = {
+        "/louvre": [(200, {"Content-Type": "text/plain"}, b"The Louvre.")],
+        "/orsay": [
+            (404, {}, b"not found"),
+            (200, {"Content-Type": "text/plain"}, b"The Orsay."),
+        ],
+    }
+    job_id = jobs.enqueue_ingest(
+        [fake_site.url("/louvre"), fake_site.url("/orsay")], None, jobs_config
+    )
+
+    run_worker(jobs_config)
+
+    assert fake_site.requests.count("/louvre") == 1
+    assert fake_site.requests.count("/orsay") == 2
+    job = jobs.get_job(job_id, jobs_config)
+    assert job is not None and job["result"] is not None
+    assert (job["status"], job["attempts"]) == ("succeeded", 2)
+    # outcomes of both attempts, in the order of the inputs
+    assert [o["url"] for o in job["result"]["outcomes"]] == [
+        fake_site.url("/louvre"),
+        fake_site.url("/orsay"),
+    ]
+    assert (job["result"]["ingested"], job["result"]["failed"]) == (2, 0)
+
+
+def test_jobs_of_lost_workers_are_claimed_again(jobs_config):
+    jobs_config.jobs.visibility_timeout = 60
+    jobs_config.jobs.max_attempts = 2
+    job_id = jobs.enqueue_ingest(["https://example.com"], None, jobs_config)
+
+    [claimed] = jobs.claim_jobs("a", 10, jobs_config)
+    assert (claimed["id"], claimed["attempts"]) == (job_id, 1)
+    # hidden from other workers while the lease lasts
+    assert jobs.claim_jobs("b", 10, jobs_config) == []
+
+    jobs_config.jobs.visibility_timeout = 0
+    jobs.renew_claims([job_id], "a", jobs_config)
+    [claimed] = jobs.claim_jobs("b", 10, jobs_config)
+    assert claimed["attempts"] == 2
+    # the first worker's lease is gone
+    assert jobs.finish_job(job_id, "a", None, None, jobs_config) is None
+
+    # no attempts left once the second lease expires
+    assert jobs.claim_jobs("c", 10, jobs_config) == []
+    job = jobs.get_job(job_id, jobs_config)
+    assert job is not None
+    assert (job["status"], job["error"]) == ("failed", "Visibility timeout exceeded")
+
+
+def test_concurrent_claims_do_not_overlap(jobs_config):
+    job_ids = {
+        jobs.enqueue_ingest([f"https://example.com/{i}"], None, jobs_config)
+        for i in range(40)
+    }
+    claims: dict[str, list[str]] = {}
+
+    def claim(worker_id: str) -> None:
+        claims[worker_id] = []
+        while claimed := jobs.claim_jobs(worker_id, 3, jobs_config):
+            claims[worker_id].extend(job["id"] for job in claimed)
+
+    threads = [threading.Thread(target=claim, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed_ids = [id for ids in claims.values() for id in ids]
+    assert sorted(claimed_ids) == sorted(job_ids)
+
+
+def test_stopped_worker_hands_back_running_jobs(
+    jobs_config, fake_embeddings, fake_site
+):
+    jobs_config.jobs.shutdown_timeout = 0.05
+    fake_site.latency = 0.5
+    fake_site.pages = {
+        "/louvre": [(200, {"Content-Type": "text/plain"}, b"The Louvre.")],
+    }
+    job_id = jobs.enqueue_ingest([fake_site.url("/louvre")], None, jobs_config)
+
+    async def run_then_stop() -> int:
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.1, stop.set)
+        return await jobs.arun_worker(jobs_config, workers=0, stop=stop)
+
+    assert asyncio.run(run_then_stop()) == 0
+
+    job = jobs.get_job(job_id, jobs_config)
+    assert job is not None
+    assert (job["status"], job["attempts"]) == ("queued", 0)
+
+
+def test_jobs_run_by_other_processes_invalidate_cached_answers(
+    jobs_config, fake_embeddings
+):
+    state = AgentState(
+        messages=[HumanMessage(content="what should I see?")],
+        retrieved_knowledge=[],
+        query=None,
+        topic_id=None,
+        external_knowledge_sources=[],
+        answer_cache=None,
+    )
+
+    def lookup() -> bool:
+        update = lookup_cached_answer(state, jobs_config.to_runnable_config())
+        return update["answer_cache"]["hit"]
+
+    assert not lookup()
+    get_answer_cache(jobs_config).set(
+        None,
+        fake_embeddings.embed_query("what should I see?"),
+        {"answer": "The Louvre.", "sources": []},
+    )
+    assert lookup()
+
+    jobs.enqueue_ingest(["data:text/plain,The%20Orsay."], None, jobs_config)
+    worker = multiprocessing.get_context("spawn").Process(
+        target=run_worker_process, args=(jobs_config,)
+    )
+    worker.start()
+    worker.join(timeout=60)
+    assert worker.exitcode == 0
+
+    assert not lookup()
@@ -10,10 +10,18 @@ from src.workflow_query import (
     AgentState,
     get_graph,
     retrieve_from_knowledge_base,
+    retrieve_from_weather_service,
     classify_query,
 )
-from src import services
+from src import metrics, services
 from src.workflow_query.node_generate import generate
+from src.workflow_query.caches import get_answer_cache
+from src.workflow_ingest import AgentState as IngestAgentState, index_and_store
+from src.data.textual import TextualData
+from src.workflow_query.weather_classification import (
+    classify_by_lexicon,
+    classify_by_prototypes,
+)
 
 
 @pytest.mark.vcr
@@ -60,6 +68,93 @@ def test_classify_query_determines_query_not_to_be_about_weather_if_no_topic_pro
     }
 
 
+def test_classify_query_decides_clear_cases_without_llm(config, fake_llm):
+    with Session(services.get_db(config)) as session:
+        paris_topic = SqlTopic(name="Paris", created_at=datetime.now(timezone.utc))
+        session.add(paris_topic)
+        session.commit()
+        session.refresh(paris_topic)
+
+    agent_state = AgentState(
+        messages=[HumanMessage(content="Will it rain this afternoon?")],
+        retrieved_knowledge=[],
+        query=None,
+        topic_id=paris_topic.id,
+        external_knowledge_sources=[],
+    )
+
+    state_update = classify_query(agent_state, config.to_runnable_config())
+
+    assert state_update["external_knowledge_sources"] == [
+        {"type": "weather", "location": "Paris"}
+    ]
+    counters = metrics.snapshot()["counters"]
+    assert counters["classify_query.classified"] == 1
+    assert counters["classify_query.tier.lexicon"] == 1
+
+
+def test_classify_query_caches_topic_and_classification(config, fake_llm):
+    with Session(services.get_db(config)) as session:
+        paris_topic = SqlTopic(name="Paris", created_at=datetime.now(timezone.utc))
+        session.add(paris_topic)
+        session.commit()
+        session.refresh(paris_topic)
+
+    for query in ["Will it rain this afternoon?", "will it rain  this afternoon"]:
+        state_update = classify_query(
+            AgentState(
+                messages=[HumanMessage(content=query)],
+                retrieved_knowledge=[],
+                query=None,
+                topic_id=paris_topic.id,
+                external_knowledge_sources=[],
+            ),
+            config.to_runnable_config(),
+        )
+        assert state_update["external_knowledge_sources"] == [
+            {"type": "weather", "location": "Paris"}
+        ]
+
+    counters = metrics.snapshot()["counters"]
+    assert counters["classify_query.classified"] == 1
+    assert counters["cache.classification.hits"] == 1
+    assert counters["cache.topic.hits"] == 1
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        ("Is it raining?", True),
+        ("What's the FORECAST for tomorrow", True),
+        ("Which museums should I visit?", False),
+        ("Should I visit the museum if it rains?", True),
+        ("What do locals think of the mayor?", None),
+        ("Are there storm warnings and strong wind?", True),
+        ("How many degrees does the university offer?", None),
+        ("What does umbrella insurance cost?", False),
+    ],
+)
+def test_classify_by_lexicon(query, expected):
+    decision = classify_by_lexicon(query)
+
+    if expected is None:
+        assert decision is None
+    else:
+        assert decision is not None
+        assert decision["is_weather_related"] == expected
+
+
+def test_classify_by_prototypes_picks_nearest_centroid():
+    centroids = {"weather": [1.0, 0.0], "non_weather": [0.0, 1.0]}
+
+    near_weather = classify_by_prototypes([0.9, 0.1], centroids)
+    undecided = classify_by_prototypes([1.0, 1.0], centroids)
+
+    assert near_weather["is_weather_related"] is True
+    assert near_weather["confidence"] > 0.99
+    assert undecided["confidence"] == 0.5
+
+
 def test_retrieve_with_travel_knowledge_base(
     config, travel_knowledge_documents, snapshot
 ):
@@ -81,6 +176,22 @@ def test_retrieve_with_travel_knowledge_base(
     assert state_update["retrieved_knowledge"] == snapshot
 
 
+def test_retrieve_from_weather_service_is_noop_for_non_weather_queries(config):
+    agent_state = AgentState(
+        messages=[HumanMessage(content="what are some nice things to see?")],
+        retrieved_knowledge=[],
+        query="what are some nice things to see?",
+        topic_id="Paris",
+        external_knowledge_sources=[],
+    )
+
+    state_update = retrieve_from_weather_service(
+        agent_state, config.to_runnable_config()
+    )
+
+    assert state_update == {"retrieved_knowledge": []}
+
+
 @pytest.mark.vcr
 def test_generate_from_knowledge_base(config, travel_knowledge_documents, snapshot):
     agent_state = AgentState(
@@ -116,6 +227,10 @@ def test_generate_from_external_service(config, snapshot):
     assert state_update["messages"][-1].content == snapshot
 
 
+def test_graph_is_compiled_once():
+    assert get_graph() is get_graph()
+
+
 @pytest.mark.vcr
 def test_graph_with_weather_query(config, travel_knowledge_documents, snapshot):
     with Session(services.get_db(config)) as session:
@@ -160,3 +275,57 @@ def test_graph_with_knowledge_query(config, travel_knowledge_documents, snapshot
     response = get_graph().invoke(agent_state, config.to_runnable_config())
 
     assert response.get("messages", [])[-1].content == snapshot
+
+
+def test_graph_answers_repeated_queries_from_cache(config, fake_llm, fake_embeddings):
+    def make_state(query: str) -> AgentState:
+        return AgentState(
+            messages=[HumanMessage(content=query)],
+            retrieved_knowledge=[],
+            query=None,
+            topic_id=None,
+            external_knowledge_sources=[],
+            answer_cache=None,
+        )
+
+    first = get_graph().invoke(
+        make_state("what should I see?"), config.to_runnable_config()
+    )
+    # the fake LLM has a single answer: a second call would fail
+    second = get_graph().invoke(
+        make_state("what should I see?"), config.to_runnable_config()
+    )
+
+    assert first["answer_cache"]["hit"] is False
+    assert second["answer_cache"]["hit"] is True
+    assert second["messages"][-1].content == "The Eiffel Tower is worth a visit."
+    assert metrics.snapshot()["counters"]["cache.answer.hits"] == 1
+
+
+def test_index_and_store_invalidates_cached_answers(config, fake_embeddings):
+    cache = get_answer_cache(config)
+    cache.set(None, fake_embeddings.embed_query("q"), {"answer": "a", "sources": []})
+    cache.set(
+        "other-topic", fake_embeddings.embed_query("q"), {"answer": "a", "sources": []}
+    )
+    data = TextualData.from_content(
+        content_data="The Louvre is open every day except Tuesday.",
+        content_type="text/plain",
+        source_url="about:blank",
+        llm=None,
+        indexing=config.indexing,
+    )
+    assert data is not None
+
+    index_and_store(
+        IngestAgentState(
+            url="about:blank",
+            topic_id=None,
+            source_content=None,
+            extracted_data=[data],
+        ),
+        config.to_runnable_config(),
+    )
+
+    assert cache.get(None, fake_embeddings.embed_query("q")) is None
+    assert cache.get("other-topic", fake_embeddings.embed_query("q")) is not None
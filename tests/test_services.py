@@ -0,0 +1,21 @@
+from src import services
+
+
+def test_get_db_reuses_engine_for_same_config(config):
+    assert services.get_db(config) is services.get_db(config)
+
+
+def test_get_db_creates_distinct_engines_for_distinct_configs(config):
+    other_config = config.model_copy(
+        update={"db": config.db.model_copy(update={"url": "sqlite://"})}
+    )
+
+    assert services.get_db(config) is not services.get_db(other_config)
+
+
+def test_shutdown_releases_instances(config):
+    engine = services.get_db(config)
+
+    services.shutdown()
+
+    assert services.get_db(config) is not engine
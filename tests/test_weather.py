@@ -0,0 +1,210 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from src import metrics
+from src.config import Config
+from src.weather import WeatherUnavailableError, get_weather_service
+
+
+class FakeOpenWeatherMap(ThreadingHTTPServer):
+    """Answers current-weather requests the way api.openweathermap.org does.
+
+    The weather client is pointed at it as a plain HTTP proxy, so requests
+    arrive with absolute URLs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeOpenWeatherMapHandler)
+        self.latency = 0.0
+        self.status = 200
+        self.temperature = 20.0
+        self.requests: list[str] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address) -> None:
+        # clients hang up on slow responses once their deadline has passed
+        pass
+
+
+class FakeOpenWeatherMapHandler(BaseHTTPRequestHandler):
+    server: FakeOpenWeatherMap
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        place = parse_qs(url.query)["q"][0]
+        self.server.requests.append(place)
+        time.sleep(self.server.latency)
+
+        if self.server.status != 200:
+            body = {"cod": self.server.status, "message": "unavailable"}
+        else:
+            body = {
+                "coord": {"lon": 2.35, "lat": 48.85},
+                "weather": [
+                    {"id": 701, "main": "Mist", "description": "mist", "icon": "50n"}
+                ],
+                "main": {
+                    "temp": 273.15 + self.server.temperature,
+                    "feels_like": 273.15 + self.server.temperature - 2,
+                    "pressure": 1021,
+                    "humidity": 95,
+                },
+                "visibility": 2000,
+                "wind": {"speed": 2.06, "deg": 190},
+                "clouds": {"all": 100},
+                "dt": 1700000000,
+                "sys": {"country": "FR", "sunrise": 1699945000, "sunset": 1699979000},
+                "timezone": 3600,
+                "id": 2988507,
+                "name": place,
+                "cod": 200,
+            }
+        payload = json.dumps(body).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_owm():
+    server = FakeOpenWeatherMap()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def weather_config(config, fake_owm) -> Config:
+    return config.model_copy(
+        update={
+            "weather": config.weather.model_copy(
+                update={
+                    "proxy": fake_owm.url,
+                    "use_ssl": False,
+                    "cache_ttl": 60,
+                    "stale_ttl": 600,
+                    "deadline": 0.5,
+                }
+            )
+        }
+    )
+
+
+def test_weather_service_caches_observations(weather_config, fake_owm):
+    service = get_weather_service(weather_config)
+
+    first = service.get("Paris")
+    second = service.get("  paris ")
+
+    assert first["temperature"] == pytest.approx(20.0)
+    assert first["humidity"] == 95
+    assert first["detailed_status"] == "mist"
+    assert second == first
+    assert fake_owm.requests == ["Paris"]
+    assert metrics.snapshot()["counters"]["weather.hits"] == 1
+
+
+def test_weather_service_coalesces_concurrent_requests(weather_config, fake_owm):
+    fake_owm.latency = 0.2
+    service = get_weather_service(weather_config)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        reports = list(executor.map(lambda _: service.get("Paris"), range(10)))
+
+    assert all(report == reports[0] for report in reports)
+    assert fake_owm.requests == ["Paris"]
+    assert metrics.snapshot()["counters"]["weather.coalesced"] == 9
+
+
+def test_weather_service_coalesces_concurrent_async_requests(weather_config, fake_owm):
+    fake_owm.latency = 0.2
+    service = get_weather_service(weather_config)
+
+    async def run():
+        return await asyncio.gather(*(service.aget("Paris") for _ in range(10)))
+
+    reports = asyncio.run(run())
+
+    assert all(report == reports[0] for report in reports)
+    assert fake_owm.requests == ["Paris"]
+
+
+def test_weather_service_serves_stale_while_revalidating(weather_config, fake_owm):
+    weather_config.weather.cache_ttl = 0
+    service = get_weather_service(weather_config)
+    service.get("Paris")
+    fake_owm.temperature = 25.0
+    fake_owm.latency = 0.2
+
+    started = time.perf_counter()
+    stale = service.get("Paris")
+
+    assert time.perf_counter() - started < 0.1
+    assert stale["temperature"] == pytest.approx(20.0)
+    # the background refresh eventually lands in the cache
+    deadline = time.monotonic() + 2
+    while service.get("Paris")["temperature"] != pytest.approx(25.0):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert metrics.snapshot()["counters"]["weather.stale_hits"] >= 1
+
+
+def test_weather_service_falls_back_to_stale_past_deadline(weather_config, fake_owm):
+    weather_config.weather.cache_ttl = 0
+    weather_config.weather.stale_ttl = 0
+    service = get_weather_service(weather_config)
+    service.get("Paris")
+    fake_owm.latency = 1.0
+    fake_owm.temperature = 25.0
+
+    started = time.perf_counter()
+    report = service.get("Paris")
+
+    assert time.perf_counter() - started < 0.9
+    assert report["temperature"] == pytest.approx(20.0)
+    counters = metrics.snapshot()["counters"]
+    assert counters["weather.timeouts"] == 1
+    assert counters["weather.stale_fallbacks"] == 1
+
+
+def test_weather_service_falls_back_to_stale_on_errors(weather_config, fake_owm):
+    weather_config.weather.cache_ttl = 0
+    weather_config.weather.stale_ttl = 0
+    service = get_weather_service(weather_config)
+    service.get("Paris")
+    fake_owm.status = 500
+
+    assert asyncio.run(service.aget("Paris"))["temperature"] == pytest.approx(20.0)
+    assert metrics.snapshot()["counters"]["weather.stale_fallbacks"] == 1
+    assert fake_owm.requests == ["Paris", "Paris"]
+
+
+def test_weather_service_raises_past_deadline_without_cached_observation(
+    weather_config, fake_owm
+):
+    fake_owm.latency = 1.0
+    service = get_weather_service(weather_config)
+
+    started = time.perf_counter()
+    with pytest.raises(WeatherUnavailableError):
+        service.get("Paris")
+    assert time.perf_counter() - started < 0.9